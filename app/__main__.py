@@ -1,4 +1,19 @@
-from app.gui import main
+import sys
+
+from app.startup import StartupClock
+
+
+def main() -> None:
+    clock = StartupClock()
+
+    # Only pay for tkinter when the GUI is actually wanted.
+    if len(sys.argv) > 1:
+        from app.cli import main as cli_main
+        sys.exit(cli_main(sys.argv[1:]))
+
+    from app.gui import main as gui_main
+    clock.mark("imports")
+    gui_main(clock)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,199 @@
+"""Time-of-day bandwidth caps.
+
+The schedule uses rclone's ``--bwlimit`` timetable syntax, e.g.
+``08:00,256k 20:00,off`` (256 KiB/s from 08 to 20, unlimited overnight) or
+``Mon-08:00,1M Sat-00:00,off``. A single value such as ``2M`` is a constant
+cap. rclone rates are bytes per second (``2M`` is 2 MiB/s, about 17 Mbit/s);
+link speeds may also be given in bits, e.g. ``08:00,2Mbit 20:00,off``.
+
+The process backend passes the timetable straight to rclone. With the rcd
+backend, ``BandwidthScheduler`` applies the slot in force through the rc
+``core/bwlimit`` call and switches it live at the slot boundaries.
+"""
+
+import datetime
+import re
+import threading
+from dataclasses import dataclass
+from typing import Callable
+
+from app.log import log_debug
+
+_DAYS = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+_ENTRY_RE = re.compile(r"^(?:([A-Za-z]{3})-)?(\d{1,2}):(\d{2}),(\S+)$")
+_RATE_RE = re.compile(r"^(\d+(?:\.\d+)?)([BbKkMmGgTt]?)$")
+_BIT_RATE_RE = re.compile(r"^(\d+(?:\.\d+)?)([KkMmGg])bit(?:/s)?$")
+_BIT_MULTIPLIERS = {"k": 1e3, "m": 1e6, "g": 1e9}
+_UNITS = {"b": "B/s", "k": "KiB/s", "m": "MiB/s", "g": "GiB/s", "t": "TiB/s", "": "KiB/s"}
+_UNIT_BYTES = {"b": 1, "k": 1024, "m": 1024 ** 2, "g": 1024 ** 3, "t": 1024 ** 4, "": 1024}
+_MINUTES_PER_WEEK = 7 * 24 * 60
+
+
+def normalize_rate(rate: str) -> str:
+    """Turn ``2Mbit`` into rclone's byte-based form; raise ValueError if invalid."""
+    if rate.lower() == "off":
+        return "off"
+    parts = []
+    for part in rate.split(":"):
+        m = _BIT_RATE_RE.match(part)
+        if m:
+            part = f"{max(1, round(float(m.group(1)) * _BIT_MULTIPLIERS[m.group(2).lower()] / 8 / 1024))}k"
+        elif not _RATE_RE.match(part):
+            raise ValueError(f"invalid bandwidth rate {rate!r}")
+        parts.append(part)
+    return ":".join(parts)
+
+
+def format_rate(rate: str) -> str:
+    """Human form of an rclone rate, e.g. ``2M`` -> ``2 MiB/s``."""
+    if rate.lower() == "off":
+        return "unlimited"
+    upload = rate.split(":")[0]
+    m = _RATE_RE.match(upload)
+    if not m:
+        return rate
+    return f"{m.group(1)} {_UNITS[m.group(2).lower()]}"
+
+
+@dataclass(frozen=True)
+class _Slot:
+    minute_of_week: int
+    rate: str
+
+
+class BandwidthSchedule:
+    def __init__(self, spec: str):
+        self.spec = spec.strip()
+        self._slots: list[_Slot] = []
+        self._timetable: list[str] = []
+        tokens = self.spec.split()
+        if len(tokens) == 1 and "," not in tokens[0]:
+            self._slots.append(_Slot(0, normalize_rate(tokens[0])))
+            self._timetable.append(self._slots[0].rate)
+            return
+        for token in tokens:
+            m = _ENTRY_RE.match(token)
+            if not m:
+                raise ValueError(f"invalid bandwidth timetable entry {token!r}")
+            day, hh, mm, rate = m.group(1), int(m.group(2)), int(m.group(3)), normalize_rate(m.group(4))
+            if hh > 23 or mm > 59:
+                raise ValueError(f"invalid time in bandwidth timetable entry {token!r}")
+            minute = hh * 60 + mm
+            self._timetable.append(f"{day + '-' if day else ''}{hh:02d}:{mm:02d},{rate}")
+            if day:
+                if day.lower() not in _DAYS:
+                    raise ValueError(f"invalid day in bandwidth timetable entry {token!r}")
+                self._slots.append(_Slot(_DAYS.index(day.lower()) * 1440 + minute, rate))
+            else:
+                self._slots.extend(_Slot(d * 1440 + minute, rate) for d in range(7))
+        self._slots.sort(key=lambda s: s.minute_of_week)
+
+    def rclone_timetable(self) -> str:
+        """The schedule as an rclone ``--bwlimit`` value, with bit rates converted."""
+        return " ".join(self._timetable)
+
+    @property
+    def is_constant(self) -> bool:
+        return len({s.rate for s in self._slots}) <= 1
+
+    def _index_at(self, now: datetime.datetime) -> int:
+        mow = now.weekday() * 1440 + now.hour * 60 + now.minute
+        index = len(self._slots) - 1  # before the first slot of the week: wrap around
+        for i, slot in enumerate(self._slots):
+            if slot.minute_of_week <= mow:
+                index = i
+            else:
+                break
+        return index
+
+    def rate_at(self, now: datetime.datetime) -> str:
+        return self._slots[self._index_at(now)].rate
+
+    def bytes_per_s_at(self, now: datetime.datetime) -> float | None:
+        """The upload cap in force at ``now`` in bytes/s; None when unlimited."""
+        m = _RATE_RE.match(self.rate_at(now).split(":")[0])
+        if not m:
+            return None
+        return float(m.group(1)) * _UNIT_BYTES[m.group(2).lower()]
+
+    def next_change(self, now: datetime.datetime) -> tuple[datetime.datetime, str] | None:
+        """When the cap next changes, and to what; None for a constant cap."""
+        if self.is_constant:
+            return None
+        i = self._index_at(now)
+        current = self._slots[i].rate
+        mow = now.weekday() * 1440 + now.hour * 60 + now.minute
+        for step in range(1, len(self._slots) + 1):
+            slot = self._slots[(i + step) % len(self._slots)]
+            if slot.rate == current:
+                continue
+            delta = (slot.minute_of_week - mow) % _MINUTES_PER_WEEK or _MINUTES_PER_WEEK
+            start = now.replace(second=0, microsecond=0) + datetime.timedelta(minutes=delta)
+            return start, slot.rate
+        return None
+
+    def describe(self, now: datetime.datetime | None = None) -> str:
+        now = now or datetime.datetime.now()
+        text = format_rate(self.rate_at(now))
+        change = self.next_change(now)
+        if change is not None:
+            text += f" until {change[0]:%H:%M}, then {format_rate(change[1])}"
+        return text
+
+
+def load_schedule(options: dict[str, str], override: str | None = None) -> BandwidthSchedule | None:
+    """The schedule from ``override`` (e.g. ``--bwlimit``) or BWLIMIT in bucket.conf."""
+    spec = override if override is not None else options.get("bwlimit", "")
+    if not spec.strip():
+        return None
+    try:
+        return BandwidthSchedule(spec)
+    except ValueError as e:
+        log_debug(f"Ignoring BWLIMIT: {e}")
+        return None
+
+
+class BandwidthScheduler:
+    """Applies a schedule live through a setter such as rc ``core/bwlimit``.
+
+    Runs in a background thread while an upload is in progress and calls
+    ``apply(rate)`` on start and whenever the slot changes. ``stop`` lifts the
+    cap again, since the rcd daemon outlives the upload.
+    """
+
+    def __init__(self, schedule: BandwidthSchedule, apply: Callable[[str], None], interval_s: float = 30.0):
+        self.schedule = schedule
+        self._apply = apply
+        self._interval_s = interval_s
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._current: str | None = None
+
+    def _tick(self) -> None:
+        rate = self.schedule.rate_at(datetime.datetime.now())
+        if rate != self._current:
+            try:
+                self._apply(rate)
+                self._current = rate
+                log_debug(f"Bandwidth cap: {format_rate(rate)}")
+            except Exception as e:
+                log_debug(f"Could not set bandwidth cap: {e}")
+
+    def _run(self) -> None:
+        while not self._stop.wait(self._interval_s):
+            self._tick()
+
+    def start(self) -> None:
+        self._tick()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+        if self._current not in (None, "off"):
+            try:
+                self._apply("off")
+            except Exception as e:
+                log_debug(f"Could not lift bandwidth cap: {e}")
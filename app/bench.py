@@ -0,0 +1,587 @@
+"""Throughput benchmarks against a local S3 stand-in.
+
+``python -m app bench`` generates synthetic drone datasets (DJI-style flight
+folders full of JPGs, a few large MP4/TIFF files, loose files at the root and
+``$RECYCLE.BIN`` noise), starts a throwaway S3 endpoint on localhost
+(``rclone serve s3``, or a MinIO binary) and uploads each dataset with the
+real ``UploadEngine``, once cold and once again with nothing new to send.
+
+A ``SlowLink`` proxy between rclone and the endpoint can add latency and cap
+the uplink, to look like a field station rather than a loopback device.
+Results (scan, YAML and bulk upload times, files/s and MB/s) are written as
+JSON under ``configs/bench/`` so runs can be compared across versions.
+"""
+
+import datetime
+import json
+import os
+import platform
+import queue
+import random
+import secrets
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+
+from app.bandwidth import normalize_rate
+from app.config import parse_size
+from app.engine import UploadEngine, UploadMetadata, UploadTarget
+from app.log import log_debug
+from app.paths import _safe_makedirs, get_app_root_dir, get_user_config_dir
+from app.rcd import free_port, open_backend
+
+BENCH_DIRNAME = "bench"
+BENCH_REMOTE = "seabeebench"
+BENCH_BUCKET = "bench"
+SERVERS = ("rclone", "minio")
+
+_MiB = 1024 * 1024
+_BLOCK_BYTES = 4 * _MiB
+_STARTUP_TIMEOUT_S = 15.0
+_PROXY_CHUNK = 64 * 1024
+
+_FLIGHT_NAMES = [
+    "Revlingen_MT", "Create-Area-Route12", "FleinvaerFroya", "Kjoeroeya",
+    "Create-Area-Route13", "Enholmen", "Sklinna", "Hornoya",
+]
+
+
+# ---------------------------------------------------------------------------
+# Synthetic datasets
+# ---------------------------------------------------------------------------
+
+@dataclass(frozen=True)
+class Scenario:
+    name: str
+    description: str
+    flights: int
+    photos_per_flight: int
+    photo_bytes: tuple[int, int]
+    large_files: int
+    large_file_bytes: int
+    loose_files: int
+    recycle_files: int
+
+
+SCENARIOS = {
+    s.name: s
+    for s in (
+        Scenario(
+            "flights", "Typical SD card dump: flight folders of photos, two videos, loose root files",
+            flights=4, photos_per_flight=100, photo_bytes=(4 * _MiB, 8 * _MiB),
+            large_files=2, large_file_bytes=256 * _MiB, loose_files=20, recycle_files=10,
+        ),
+        Scenario(
+            "small-files", "Many small files (thumbnails, sidecars): per-file overhead dominates",
+            flights=10, photos_per_flight=500, photo_bytes=(16 * 1024, 256 * 1024),
+            large_files=0, large_file_bytes=0, loose_files=50, recycle_files=20,
+        ),
+        Scenario(
+            "large-files", "A few huge videos and orthomosaic TIFFs: raw throughput dominates",
+            flights=2, photos_per_flight=10, photo_bytes=(4 * _MiB, 8 * _MiB),
+            large_files=4, large_file_bytes=1024 * _MiB, loose_files=0, recycle_files=2,
+        ),
+    )
+}
+
+
+@dataclass
+class Dataset:
+    root: str
+    files: int = 0
+    bytes: int = 0
+    folders: int = 0
+    seconds: float = 0.0
+
+
+def _scaled(n: int, scale: float) -> int:
+    return max(1, round(n * scale)) if n else 0
+
+
+def _write_file(path: str, size: int, rng: random.Random, block: memoryview, mtime: float) -> None:
+    # A random header makes every file unique; the body is a random slice of a
+    # shared incompressible block, which is much faster than fresh random bytes.
+    with open(path, "wb") as f:
+        header = rng.randbytes(min(size, 4096))
+        f.write(header)
+        remaining = size - len(header)
+        while remaining > 0:
+            offset = rng.randrange(_BLOCK_BYTES)
+            n = min(remaining, _BLOCK_BYTES)
+            f.write(block[offset:offset + n])
+            remaining -= n
+    os.utime(path, (mtime, mtime))
+
+
+def generate_dataset(root: str, scenario: Scenario, scale: float = 1.0, seed: int = 0) -> Dataset:
+    """Write ``scenario`` under ``root`` as it would look on a field hard drive.
+
+    ``scale`` multiplies the file counts. The same seed gives the same tree.
+    Only files the uploader would send are counted in the returned totals.
+    """
+    started = time.monotonic()
+    rng = random.Random(seed)
+    block_bytes = rng.randbytes(_BLOCK_BYTES)
+    block = memoryview(block_bytes + block_bytes)
+    ds = Dataset(root=root)
+    os.makedirs(root, exist_ok=True)
+    t0 = datetime.datetime(2025, 5, 12, 8, 0)
+
+    large_left = _scaled(scenario.large_files, scale)
+    nflights = _scaled(scenario.flights, scale)
+    for i in range(nflights):
+        start = t0 + datetime.timedelta(hours=2 * i)
+        name = f"DJI_{start:%Y%m%d%H%M}_{i + 1:03d}_{_FLIGHT_NAMES[i % len(_FLIGHT_NAMES)]}"
+        flight = os.path.join(root, name)
+        os.makedirs(flight, exist_ok=True)
+        ds.folders += 1
+        for j in range(_scaled(scenario.photos_per_flight, scale)):
+            shot = start + datetime.timedelta(seconds=2 * j)
+            size = rng.randint(*scenario.photo_bytes)
+            _write_file(
+                os.path.join(flight, f"DJI_{shot:%Y%m%d%H%M%S}_{j + 1:04d}_V.JPG"),
+                size, rng, block, shot.timestamp(),
+            )
+            ds.files += 1
+            ds.bytes += size
+        # Spread the large files over the first flights, alternating video and orthomosaic.
+        if large_left:
+            ext = "MP4" if large_left % 2 == 0 else "TIF"
+            _write_file(
+                os.path.join(flight, f"DJI_{start:%Y%m%d%H%M%S}_0000_V.{ext}"),
+                scenario.large_file_bytes, rng, block, start.timestamp(),
+            )
+            ds.files += 1
+            ds.bytes += scenario.large_file_bytes
+            large_left -= 1
+        _write_file(os.path.join(flight, "Thumbs.db"), 4096, rng, block, start.timestamp())
+
+    for k in range(_scaled(scenario.loose_files, scale)):
+        size = rng.randint(*scenario.photo_bytes)
+        _write_file(os.path.join(root, f"DJI_{k + 1:04d}.JPG"), size, rng, block, t0.timestamp())
+        ds.files += 1
+        ds.bytes += size
+
+    nrecycle = _scaled(scenario.recycle_files, scale)
+    if nrecycle:
+        bin_dir = os.path.join(root, "$RECYCLE.BIN", "S-1-5-21-1004336348-1177238915-682003330-1001")
+        os.makedirs(bin_dir, exist_ok=True)
+        with open(os.path.join(bin_dir, "desktop.ini"), "w", encoding="utf-8") as f:
+            f.write("[.ShellClassInfo]\n")
+        for k in range(nrecycle):
+            _write_file(os.path.join(bin_dir, f"$R{k:06X}.JPG"), 64 * 1024, rng, block, t0.timestamp())
+
+    ds.seconds = time.monotonic() - started
+    return ds
+
+
+# ---------------------------------------------------------------------------
+# Simulated link
+# ---------------------------------------------------------------------------
+
+def parse_link_rate(text: str) -> float:
+    """Bytes per second from ``2M`` (bytes, rclone style) or ``50Mbit``; raise ValueError if invalid."""
+    rate = normalize_rate(text.strip()).split(":")[0]
+    if rate[-1:].isdigit():
+        rate += "k"  # rclone's default unit
+    nbytes = parse_size(rate) if rate != "off" else None
+    if nbytes is None:
+        raise ValueError(f"invalid link rate {text!r}")
+    return float(nbytes)
+
+
+class _RateLimiter:
+    """Serialises senders onto one link of ``rate`` bytes/s."""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self, nbytes: int) -> None:
+        with self._lock:
+            now = time.monotonic()
+            done = max(now, self._next) + nbytes / self.rate
+            self._next = done
+        time.sleep(max(0.0, done - now))
+
+
+class SlowLink:
+    """TCP forwarder to ``127.0.0.1:target_port`` with latency and an uplink cap.
+
+    Every chunk is delivered ``latency_ms / 2`` after it was read, in each
+    direction, so a request/response round trip costs ``latency_ms`` without
+    throttling long streams. ``rate`` (bytes/s) is shared by all connections
+    towards the server, like a single field uplink.
+    """
+
+    def __init__(self, target_port: int, latency_ms: float = 0.0, rate: float | None = None):
+        self.target_port = target_port
+        self.delay_s = latency_ms / 2000.0
+        self._limiter = _RateLimiter(rate) if rate else None
+        self._listener: socket.socket | None = None
+        self._closed = threading.Event()
+        self.port = 0
+
+    def start(self) -> int:
+        self._listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._listener.bind(("127.0.0.1", 0))
+        self._listener.listen(64)
+        self.port = self._listener.getsockname()[1]
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+        return self.port
+
+    def stop(self) -> None:
+        self._closed.set()
+        if self._listener is not None:
+            try:
+                self._listener.close()
+            except OSError:
+                pass
+
+    def _accept_loop(self) -> None:
+        while not self._closed.is_set():
+            try:
+                client, _ = self._listener.accept()
+            except OSError:
+                return
+            try:
+                upstream = socket.create_connection(("127.0.0.1", self.target_port))
+            except OSError:
+                client.close()
+                continue
+            for sock in (client, upstream):
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._pipe(client, upstream, self._limiter)
+            self._pipe(upstream, client, None)
+
+    def _pipe(self, src: socket.socket, dst: socket.socket, limiter: _RateLimiter | None) -> None:
+        chunks: queue.Queue[tuple[float, bytes] | None] = queue.Queue()
+
+        def read() -> None:
+            try:
+                while data := src.recv(_PROXY_CHUNK):
+                    chunks.put((time.monotonic() + self.delay_s, data))
+            except OSError:
+                pass
+            chunks.put(None)
+
+        def write() -> None:
+            try:
+                while (item := chunks.get()) is not None:
+                    due, data = item
+                    pause = due - time.monotonic()
+                    if pause > 0:
+                        time.sleep(pause)
+                    if limiter is not None:
+                        limiter.wait(len(data))
+                    dst.sendall(data)
+                dst.shutdown(socket.SHUT_WR)
+            except OSError:
+                for sock in (src, dst):
+                    try:
+                        sock.close()
+                    except OSError:
+                        pass
+
+        threading.Thread(target=read, daemon=True).start()
+        threading.Thread(target=write, daemon=True).start()
+
+
+# ---------------------------------------------------------------------------
+# Local S3 endpoint
+# ---------------------------------------------------------------------------
+
+def _wait_for_port(port: int, process: subprocess.Popen, what: str) -> None:
+    deadline = time.monotonic() + _STARTUP_TIMEOUT_S
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{what} exited with code {process.returncode} during startup")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"{what} did not start listening on port {port}")
+
+
+class LocalS3:
+    """A throwaway S3 endpoint on localhost, backed by a temporary directory.
+
+    ``start`` returns the path of an rclone.conf defining ``BENCH_REMOTE``
+    against it (through ``link`` when given), with ``BENCH_BUCKET`` created.
+    """
+
+    def __init__(self, rclone_exe: str, workdir: str, server: str = "rclone", minio_exe: str | None = None):
+        if server not in SERVERS:
+            raise ValueError(f"unknown S3 server {server!r}")
+        self.rclone_exe = rclone_exe
+        self.workdir = workdir
+        self.server = server
+        self.minio_exe = minio_exe or shutil.which("minio")
+        self.data_dir = os.path.join(workdir, "s3")
+        self.conf_path = os.path.join(workdir, "rclone.conf")
+        self.port = 0
+        self._process: subprocess.Popen | None = None
+
+    def start(self, link: SlowLink | None = None) -> str:
+        os.makedirs(self.data_dir, exist_ok=True)
+        self.port = free_port()
+        access_key, secret_key = "seabee", secrets.token_hex(16)
+        # An empty config for the server itself, so it never reads the user's.
+        with open(self.conf_path, "w", encoding="utf-8"):
+            pass
+
+        if self.server == "rclone":
+            os.makedirs(os.path.join(self.data_dir, BENCH_BUCKET), exist_ok=True)
+            command = [
+                self.rclone_exe, "serve", "s3", self.data_dir,
+                "--config", self.conf_path,
+                "--addr", f"127.0.0.1:{self.port}",
+                "--auth-key", f"{access_key},{secret_key}",
+            ]
+            env = None
+            provider = "Rclone"
+        else:
+            if not self.minio_exe:
+                raise RuntimeError("minio not found; pass --minio-exe or use --server rclone")
+            command = [self.minio_exe, "server", self.data_dir, "--address", f"127.0.0.1:{self.port}", "--quiet"]
+            env = dict(os.environ, MINIO_ROOT_USER=access_key, MINIO_ROOT_PASSWORD=secret_key)
+            provider = "Minio"
+
+        log_debug(f"Bench: starting {self.server} S3 server on 127.0.0.1:{self.port}")
+        self._process = subprocess.Popen(
+            command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        _wait_for_port(self.port, self._process, f"{self.server} S3 server")
+
+        port = self.port
+        if link is not None:
+            link.target_port = self.port
+            port = link.start()
+        lines = [
+            f"[{BENCH_REMOTE}]",
+            "type = s3",
+            f"provider = {provider}",
+            f"endpoint = http://127.0.0.1:{port}",
+            f"access_key_id = {access_key}",
+            f"secret_access_key = {secret_key}",
+        ]
+        if self.server == "rclone":
+            # rclone serve s3 does not support multipart uploads.
+            lines.append("use_multipart_uploads = false")
+        with open(self.conf_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+        if self.server == "minio":
+            subprocess.run(
+                [self.rclone_exe, "mkdir", f"{BENCH_REMOTE}:{BENCH_BUCKET}", "--config", self.conf_path],
+                check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            )
+        return self.conf_path
+
+    def stop(self) -> None:
+        process, self._process = self._process, None
+        if process is None or process.poll() is not None:
+            return
+        process.terminate()
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+# ---------------------------------------------------------------------------
+# Runs
+# ---------------------------------------------------------------------------
+
+@dataclass
+class RunResult:
+    scenario: str
+    run: str  # "cold": empty bucket and caches; "warm": the same upload again
+    files: int
+    bytes: int
+    uploaded_files: int = 0
+    uploaded_bytes: int = 0
+    scan_s: float = 0.0
+    yaml_s: float = 0.0  # writing and uploading the YAML files
+    upload_s: float = 0.0
+    total_s: float = 0.0
+    files_per_s: float = 0.0
+    mb_per_s: float = 0.0
+    phases: dict[str, float] = field(default_factory=dict)
+    counters: dict[str, int] = field(default_factory=dict)
+    error: str | None = None
+
+
+@dataclass
+class BenchConfig:
+    scenarios: list[str]
+    scale: float = 1.0
+    seed: int = 0
+    server: str = "rclone"
+    minio_exe: str | None = None
+    backend: str = "process"
+    latency_ms: float = 0.0
+    bandwidth: str | None = None
+    options: dict[str, str] = field(default_factory=dict)
+    warm: bool = True
+    workdir: str | None = None
+    keep: bool = False
+
+
+def _run_upload(
+    rclone_exe: str,
+    rclone_conf: str,
+    folder: str,
+    result: RunResult,
+    config: BenchConfig,
+    config_dir: str,
+) -> None:
+    target = UploadTarget(remote=BENCH_REMOTE, bucket=BENCH_BUCKET, prefix=f"{result.scenario}/")
+    daemon = open_backend(config.backend, rclone_exe, rclone_conf)
+    engine = UploadEngine(
+        rclone_exe,
+        rclone_conf,
+        target,
+        daemon=daemon,
+        options=dict(config.options),
+    )
+    meta = UploadMetadata(theme="Seabirds", organisation="NINA", creator_name="bench", project="bench")
+
+    # Ledger, scan cache and hash cache live in the config dir: a fresh one
+    # per scenario makes the first run cold and the second one warm.
+    saved = os.environ.get("SEABEE_CONFIG_DIR")
+    os.environ["SEABEE_CONFIG_DIR"] = config_dir
+    try:
+        if daemon is not None:
+            daemon.start()
+        engine.upload_folder(folder, meta)
+    except Exception as e:
+        result.error = str(e)
+    finally:
+        if daemon is not None:
+            daemon.stop()
+        if saved is None:
+            os.environ.pop("SEABEE_CONFIG_DIR", None)
+        else:
+            os.environ["SEABEE_CONFIG_DIR"] = saved
+
+    m = engine.metrics
+    result.phases = {name: round(s, 3) for name, s in m.phases.items()}
+    result.counters = dict(m.counters)
+    result.total_s = m.seconds
+    result.scan_s = m.phases["scan"]
+    result.yaml_s = m.phases["write_yaml"] + m.phases["upload_yaml"]
+    result.upload_s = m.phases["upload"]
+    result.uploaded_files = m.counters["files_uploaded"]
+    result.uploaded_bytes = m.counters["bytes_uploaded"]
+    if result.upload_s > 0:
+        result.files_per_s = result.uploaded_files / result.upload_s
+        result.mb_per_s = result.uploaded_bytes / 1e6 / result.upload_s
+
+
+def _git_version() -> str:
+    try:
+        out = subprocess.run(
+            ["git", "describe", "--always", "--dirty"],
+            cwd=get_app_root_dir(), capture_output=True, text=True, timeout=10,
+        )
+    except (OSError, subprocess.SubprocessError):
+        return "unknown"
+    return out.stdout.strip() or "unknown"
+
+
+def _rclone_version(rclone_exe: str) -> str:
+    try:
+        out = subprocess.run([rclone_exe, "version"], capture_output=True, text=True, timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return "unknown"
+    return (out.stdout.splitlines() or ["unknown"])[0].strip()
+
+
+def default_results_path() -> str:
+    ts = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+    return os.path.join(get_user_config_dir(), BENCH_DIRNAME, f"bench-{ts}.json")
+
+
+def run_benchmarks(rclone_exe: str, config: BenchConfig, on_result=None) -> dict:
+    """Generate, serve and upload every scenario in ``config``; return the results record.
+
+    ``on_result(result)`` is called after each run, e.g. to print a table row.
+    """
+    rate = parse_link_rate(config.bandwidth) if config.bandwidth else None
+    workdir = config.workdir or tempfile.mkdtemp(prefix="seabee-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    record = {
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "version": _git_version(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "rclone": _rclone_version(rclone_exe),
+        "config": {k: v for k, v in asdict(config).items() if k not in ("workdir", "keep")},
+        "results": [],
+    }
+
+    server = LocalS3(rclone_exe, workdir, config.server, config.minio_exe)
+    link = SlowLink(0, config.latency_ms, rate) if config.latency_ms or rate else None
+    try:
+        rclone_conf = server.start(link)
+        for name in config.scenarios:
+            scenario = SCENARIOS[name]
+            data_dir = os.path.join(workdir, "data", name)
+            log_debug(f"Bench: generating {name} (scale {config.scale})…")
+            ds = generate_dataset(data_dir, scenario, config.scale, config.seed)
+            log_debug(
+                f"Bench: {name}: {ds.files} file(s), {ds.bytes / 1e6:.0f} MB in "
+                f"{ds.folders} folder(s), generated in {ds.seconds:.1f}s"
+            )
+            config_dir = os.path.join(workdir, "config", name)
+            _safe_makedirs(config_dir)
+            for run in ("cold", "warm") if config.warm else ("cold",):
+                result = RunResult(scenario=name, run=run, files=ds.files, bytes=ds.bytes)
+                _run_upload(rclone_exe, rclone_conf, data_dir, result, config, config_dir)
+                record["results"].append(asdict(result))
+                if on_result is not None:
+                    on_result(result)
+            if not config.keep:
+                shutil.rmtree(data_dir, ignore_errors=True)
+    finally:
+        if link is not None:
+            link.stop()
+        server.stop()
+        if not config.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return record
+
+
+def write_results(record: dict, path: str | None = None) -> str:
+    path = path or default_results_path()
+    _safe_makedirs(os.path.dirname(path))
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(record, f, indent=2)
+    return path
+
+
+def compare_results(old: dict, new: dict) -> list[str]:
+    """One line per (scenario, run) present in both records, with the MB/s and time change."""
+    before = {(r["scenario"], r["run"]): r for r in old.get("results", [])}
+    lines = []
+    for r in new.get("results", []):
+        o = before.get((r["scenario"], r["run"]))
+        if o is None:
+            continue
+        speed = f"{o['mb_per_s']:.1f} -> {r['mb_per_s']:.1f} MB/s"
+        if o["mb_per_s"] > 0:
+            speed += f" ({(r['mb_per_s'] / o['mb_per_s'] - 1) * 100:+.0f}%)"
+        total = f"{o['total_s']:.1f}s -> {r['total_s']:.1f}s"
+        if o["total_s"] > 0:
+            total += f" ({(r['total_s'] / o['total_s'] - 1) * 100:+.0f}%)"
+        lines.append(f"{r['scenario']:<12} {r['run']:<5} {speed}, total {total}")
+    return lines
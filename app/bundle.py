@@ -0,0 +1,280 @@
+"""Small-file bundles: pack a folder's small files into tar archives.
+
+Multispectral and RTK flights leave many small sidecar files (``.MRK``,
+``.NAV``, ``.OBS``, per-band TIFs, …) next to the images. On a high-latency
+link, the per-object cost of uploading those dominates, so with
+``BUNDLE_SMALL_FILES`` set in bucket.conf, files below that size are packed
+into ``seabee-bundle-<hash>.tar`` objects in their folder instead. Each
+bundle has a sidecar ``seabee-bundle-<hash>.tar.index.json``:
+
+    {"bundle": "seabee-bundle-….tar", "size": <tar bytes>, "mtime": …,
+     "files": [{"name": …, "size": …, "mtime": …, "offset": …, "md5": …}, …]}
+
+``offset`` is where the member's data starts in the tar, so one file can be
+read back with a single ranged GET (``Range: bytes=offset-(offset+size-1)``)
+without fetching the whole bundle.
+
+Bundles are built deterministically: the name is a hash of the members'
+names, sizes and modtimes, and rebuilding from the same files gives a
+byte-identical tar. The tar and its index are staged under
+``configs/staging/<dest hash>/<folder>/``. Uploaded tars are deleted; the
+index is kept, so later runs know the bundle's size without rebuilding it.
+A folder's YAML ``nfiles`` counts objects as uploaded: unbundled files plus
+two per bundle.
+
+When a folder's small files change, its bundles get new names. Once the
+ledger confirms the new bundles (or the files now uploaded on their own),
+the superseded bundle objects are deleted from the remote and dropped from
+the ledger, so downstream never sees a member in two bundles.
+"""
+
+import hashlib
+import json
+import os
+import tarfile
+from typing import Callable
+
+from app.config import parse_size
+from app.log import log_debug
+from app.scanner import FileEntry, FolderManifest
+
+BUNDLE_PREFIX = "seabee-bundle-"
+INDEX_SUFFIX = ".index.json"
+# Fewer small files than this are not worth two objects (tar + index).
+MIN_BUNDLE_FILES = 3
+# Larger sets are split into several bundles, so a failed upload only
+# re-sends one of them.
+MAX_BUNDLE_BYTES = 256 * 1024 * 1024
+
+# ``(relpath, entry) -> True`` if ``entry`` is recorded as uploaded under ``relpath``.
+UploadedLookup = Callable[[str, FileEntry], bool]
+
+
+def bundle_threshold(options: dict[str, str]) -> int | None:
+    """BUNDLE_SMALL_FILES in bucket.conf: bundle files below this size (off by default)."""
+    raw = options.get("bundle_small_files", "").strip()
+    if not raw or raw.lower() in ("off", "false", "no", "0"):
+        return None
+    threshold = parse_size(raw)
+    if threshold is None:
+        log_debug(f"Ignoring invalid BUNDLE_SMALL_FILES={raw!r} in bucket.conf")
+    return threshold
+
+
+def is_bundle_name(name: str) -> bool:
+    return name.startswith(BUNDLE_PREFIX)
+
+
+def _bundle_name(members: list[FileEntry]) -> str:
+    digest = hashlib.sha1()
+    for f in members:
+        digest.update(f"{f.name}\0{f.size}\0{f.mtime!r}\n".encode("utf-8"))
+    return f"{BUNDLE_PREFIX}{digest.hexdigest()[:16]}.tar"
+
+
+def _chunks(small: list[FileEntry]) -> list[list[FileEntry]]:
+    """Split ``small`` (sorted by name) into runs of at most MAX_BUNDLE_BYTES.
+
+    Files are usually numbered in shooting order, so files added later mostly
+    change the last bundle only.
+    """
+    chunks: list[list[FileEntry]] = [[]]
+    nbytes = 0
+    for f in small:
+        if chunks[-1] and nbytes + f.size > MAX_BUNDLE_BYTES:
+            chunks.append([])
+            nbytes = 0
+        chunks[-1].append(f)
+        nbytes += f.size
+    return chunks
+
+
+class _HashingReader:
+    """File wrapper that feeds what ``tarfile`` reads into an MD5."""
+
+    def __init__(self, f, md5):
+        self._f = f
+        self._md5 = md5
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._f.read(size)
+        self._md5.update(data)
+        return data
+
+
+class Bundler:
+    """Replaces small files in folder manifests with staged bundle entries."""
+
+    def __init__(self, root: str, threshold: int):
+        self.root = root
+        self.threshold = threshold
+        self.built = 0
+        self.bundled_files = 0
+        # Folder relpath -> the bundle entries and small files it is uploaded
+        # as, for the folders seen by files_for (see superseded()).
+        self.small_entries: dict[str, list[FileEntry]] = {}
+
+    def staging_dir(self, relpath: str) -> str:
+        return os.path.join(self.root, *relpath.split("/"))
+
+    def files_for(self, manifest: FolderManifest, is_uploaded: UploadedLookup | None = None) -> list[FileEntry]:
+        """The folder's files as they are uploaded, small ones replaced by bundles.
+
+        Bundle entries point at their staged copy through ``FileEntry.source``.
+        A staged tar that is missing is rebuilt unless ``is_uploaded`` says
+        it is already on the remote; a staged tar that is uploaded is deleted.
+        """
+        if manifest.is_root or manifest.is_virtual:
+            return manifest.files
+        small = [f for f in manifest.files if f.size < self.threshold]
+        self.small_entries[manifest.relpath] = small
+        if len(small) < MIN_BUNDLE_FILES:
+            return manifest.files
+        staging = self.staging_dir(manifest.relpath)
+        files = [f for f in manifest.files if f.size >= self.threshold]
+        keep: set[str] = set()
+        uploaded_as: list[FileEntry] = []
+        for members in _chunks(small):
+            entries = None
+            if len(members) >= MIN_BUNDLE_FILES:
+                entries = self._stage(manifest, staging, members, is_uploaded)
+            if entries is None:
+                files.extend(members)
+                uploaded_as.extend(members)
+                continue
+            files.extend(entries)
+            uploaded_as.extend(entries)
+            keep.update(f.name for f in entries)
+            self.bundled_files += len(members)
+        self._prune(staging, keep)
+        self.small_entries[manifest.relpath] = uploaded_as
+        files.sort(key=lambda f: f.name)
+        return files
+
+    def superseded(self, relpath: str, recorded: list[str], is_uploaded: UploadedLookup) -> list[str]:
+        """Bundle objects of folder ``relpath`` that its current bundles replace.
+
+        ``recorded`` are the bundle names the ledger has for the folder. Old
+        bundles are only reported once every current bundle (or small file
+        no longer bundled) is uploaded, so no member is ever missing from the
+        remote in between.
+        """
+        current = self.small_entries.get(relpath)
+        if current is None:
+            return []
+        names = {f.name for f in current}
+        stale = sorted(name for name in recorded if name not in names)
+        if stale and all(is_uploaded(relpath, f) for f in current):
+            return stale
+        return []
+
+    def _stage(
+        self,
+        manifest: FolderManifest,
+        staging: str,
+        members: list[FileEntry],
+        is_uploaded: UploadedLookup | None,
+    ) -> list[FileEntry] | None:
+        name = _bundle_name(members)
+        tar_path = os.path.join(staging, name)
+        index_path = tar_path + INDEX_SUFFIX
+        index = _read_index(index_path)
+        if index is not None:
+            tar = FileEntry(name, index["size"], index["mtime"], source=tar_path)
+            uploaded = is_uploaded is not None and is_uploaded(manifest.relpath, tar)
+            if os.path.exists(tar_path):
+                if uploaded:
+                    _remove(tar_path)
+            elif not uploaded:
+                index = None
+        if index is None:
+            index = self._build(manifest.path, tar_path, members)
+            if index is None:
+                return None
+        mtime = index["mtime"]
+        return [
+            FileEntry(name, index["size"], mtime, source=tar_path),
+            FileEntry(name + INDEX_SUFFIX, os.path.getsize(index_path), mtime, source=index_path),
+        ]
+
+    def _build(self, folder: str, tar_path: str, members: list[FileEntry]) -> dict | None:
+        """Write the tar and its index; None (files stay unbundled) if a member is unreadable."""
+        os.makedirs(os.path.dirname(tar_path), exist_ok=True)
+        mtime = max(f.mtime for f in members)
+        entries = []
+        tmp = tar_path + ".tmp"
+        try:
+            # PAX keeps long names and sub-second modtimes; headers carry no
+            # owner or build time, so the same files give the same bytes.
+            with open(tmp, "wb") as raw, tarfile.open(fileobj=raw, mode="w", format=tarfile.PAX_FORMAT) as tar:
+                for f in members:
+                    info = tarfile.TarInfo(f.name)
+                    info.size = f.size
+                    info.mtime = f.mtime
+                    info.mode = 0o644
+                    md5 = hashlib.md5()
+                    with open(os.path.join(folder, f.name), "rb") as src:
+                        tar.addfile(info, _HashingReader(src, md5))
+                    padded = -(-f.size // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+                    entries.append({
+                        "name": f.name,
+                        "size": f.size,
+                        "mtime": f.mtime,
+                        "offset": tar.offset - padded,
+                        "md5": md5.hexdigest(),
+                    })
+            os.utime(tmp, (mtime, mtime))
+            os.replace(tmp, tar_path)
+        except (OSError, tarfile.TarError) as e:
+            log_debug(f"Could not bundle small files in {folder}, uploading them as they are: {e}")
+            _remove(tmp)
+            return None
+        index = {
+            "bundle": os.path.basename(tar_path),
+            "size": os.path.getsize(tar_path),
+            "mtime": mtime,
+            "files": entries,
+        }
+        index_path = tar_path + INDEX_SUFFIX
+        with open(index_path + ".tmp", "w", encoding="utf-8", newline="\n") as f:
+            json.dump(index, f, indent=1, sort_keys=True)
+        os.utime(index_path + ".tmp", (mtime, mtime))
+        os.replace(index_path + ".tmp", index_path)
+        self.built += 1
+        return index
+
+    def _prune(self, staging: str, keep: set[str]) -> None:
+        """Delete staged bundles the folder no longer maps to (its small files changed)."""
+        try:
+            names = os.listdir(staging)
+        except OSError:
+            return
+        for name in names:
+            if is_bundle_name(name) and name not in keep:
+                _remove(os.path.join(staging, name))
+
+    def release(self, list_path: str) -> None:
+        """Delete the staged tars in an uploaded transfer list; their indexes stay."""
+        with open(list_path, encoding="utf-8") as f:
+            for line in f:
+                relpath = line.rstrip("\n")
+                if relpath.endswith(".tar"):
+                    _remove(os.path.join(self.root, *relpath.split("/")))
+
+
+def _read_index(path: str) -> dict | None:
+    try:
+        with open(path, encoding="utf-8") as f:
+            index = json.load(f)
+        if isinstance(index.get("size"), int) and isinstance(index.get("mtime"), (int, float)):
+            return index
+    except (OSError, ValueError, AttributeError):
+        pass
+    return None
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
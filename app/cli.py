@@ -0,0 +1,550 @@
+"""Headless entry points: ``python -m app upload <folder>... [options]``,
+``python -m app verify <folder> [--repair]``, ``python -m app bench`` and
+``python -m app startup``.
+
+Runs the same upload pipeline as the GUI without importing tkinter, so it can
+be scheduled (cron, Task Scheduler) to run unattended. Several folders (e.g.
+all the campaign's drives) go through the same job queue as in the GUI.
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+
+from app.bench import (
+    SCENARIOS,
+    SERVERS,
+    BenchConfig,
+    RunResult,
+    compare_results,
+    run_benchmarks,
+    write_results,
+)
+from app.config import (
+    RCLONE_BACKENDS,
+    ensure_config_file,
+    ensure_defaults_ready,
+    load_bucket_config,
+    load_bucket_options,
+    load_rclone_backend,
+    resolve_rclone_conf,
+    resolve_rclone_exe,
+)
+from app.compress import COMPRESS_MODES
+from app.engine import (
+    ROOT_FILES_MODES,
+    ProgressCallback,
+    StatusCallback,
+    UploadEngine,
+    UploadMetadata,
+    UploadTarget,
+)
+from app.jobs import CANCELLED, DONE, UploadJob, UploadQueue, queue_limits
+from app.ingest import CardIngest, open_hash_cache, open_tee
+from app.log import flush_log, log_debug
+from app.rcd import open_backend
+from app.startup import IMPORT_BUDGET_MS, profile_imports
+from app.paths import get_app_root_dir, get_user_config_dir
+from app.progress import Progress, format_bytes, format_eta
+from app.schedule import UPLOAD_ORDERS
+from app.verify import VerificationReport
+from app.watch import FolderWatcher, watch_timing
+
+
+def _add_common_args(p: argparse.ArgumentParser) -> None:
+    p.add_argument("--theme", help="Defaults to theme in defaults.txt.")
+    p.add_argument("--organisation", help="Defaults to organisation in defaults.txt.")
+    p.add_argument("--creator-name", help="Defaults to creator_name in defaults.txt.")
+    p.add_argument("--project", help="Defaults to project in defaults.txt.")
+    p.add_argument("--remote", help="Override REMOTE_NAME from bucket.conf.")
+    p.add_argument("--bucket", help="Override BUCKET_NAME from bucket.conf.")
+    p.add_argument("--prefix", help="Override OBJECT_PREFIX from bucket.conf.")
+    p.add_argument(
+        "--rescan", action="store_true",
+        help="Ignore the scan cache and list every folder again.",
+    )
+    p.add_argument(
+        "--backend", choices=RCLONE_BACKENDS,
+        help="Upload backend: one rclone process per transfer, one rclone rcd daemon, "
+             "or native in-process S3 (default: RCLONE_BACKEND in bucket.conf, else process).",
+    )
+    p.add_argument(
+        "--no-ledger", action="store_true",
+        help="Do not use the upload ledger; let rclone compare every file with the remote.",
+    )
+    p.add_argument(
+        "--no-checksum", action="store_true",
+        help="Skip the MD5 stage and let rclone compare size and modtime only.",
+    )
+    p.add_argument(
+        "--no-dedup", action="store_true",
+        help="Upload files even if the same content is already on the remote, "
+             "instead of copying it there server-side.",
+    )
+    p.add_argument(
+        "--no-folder-summary", action="store_true",
+        help="Leave capture times, GPS footprint and cameras out of each folder's YAML.",
+    )
+    p.add_argument(
+        "--bwlimit", metavar="SCHEDULE",
+        help="Bandwidth cap for this run, e.g. 2Mbit or '08:00,2Mbit 20:00,off' "
+             "(default: BWLIMIT in bucket.conf; 'off' for none).",
+    )
+    p.add_argument(
+        "--root-files", choices=ROOT_FILES_MODES,
+        help="Loose files at the drive root: move them into a package folder on the drive, "
+             "or upload them to a virtual package without touching the drive "
+             "(default: ROOT_FILES in bucket.conf, else move).",
+    )
+    p.add_argument(
+        "--bundle-small-files", metavar="SIZE",
+        help="Pack files below SIZE (e.g. 1M) into per-folder tar bundles with an index "
+             "(default: BUNDLE_SMALL_FILES in bucket.conf; 'off' for none).",
+    )
+    p.add_argument(
+        "--compress", choices=COMPRESS_MODES,
+        help="Upload compressible files (logs, RINEX, CSV, …) compressed; 'auto' only while it "
+             "saves time on the link (default: COMPRESS in bucket.conf, else off).",
+    )
+    p.add_argument(
+        "--upload-order", choices=UPLOAD_ORDERS,
+        help="Order in which flight folders are uploaded, one after another; 'mixed' copies "
+             "everything at once (default: UPLOAD_ORDER in bucket.conf, else name).",
+    )
+    p.add_argument(
+        "--upload-first", metavar="FOLDER", action="append",
+        help="Upload this folder (name or pattern) before all others; repeat for several "
+             "(default: UPLOAD_FIRST in bucket.conf).",
+    )
+    p.add_argument(
+        "--metrics-textfile", metavar="PATH",
+        help="Also write this run's metrics as a Prometheus textfile "
+             "(default: METRICS_TEXTFILE in bucket.conf).",
+    )
+    p.add_argument(
+        "--repair", action="store_true",
+        help="Re-upload the files verification finds missing or mismatched.",
+    )
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m app", description="SeaBee FieldUploader")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    up = sub.add_parser("upload", help="Upload a drive or folder without opening the GUI.")
+    up.add_argument("folders", nargs="+", metavar="folder", help="Folder(s) to upload (usually drive roots).")
+    _add_common_args(up)
+    up.add_argument(
+        "--reconcile", action="store_true",
+        help="List the remote first and correct the upload ledger before uploading.",
+    )
+    up.add_argument(
+        "--verify", action="store_true",
+        help="After uploading, check every folder against the remote listing.",
+    )
+    up.add_argument(
+        "--watch", action="store_true",
+        help="Keep running and upload each top-level folder once its files stop changing, "
+             "while the drive is still being copied to (one folder only; Ctrl+C to stop).",
+    )
+    up.add_argument(
+        "--from-card", metavar="CARD",
+        help="Copy the SD card's DCIM folder into the (single) folder first, uploading each "
+             "flight folder as soon as it is copied; the upload is always verified.",
+    )
+
+    ver = sub.add_parser("verify", help="Check an earlier upload against the remote listing.")
+    ver.add_argument("folder", help="Folder that was uploaded (usually the drive root).")
+    _add_common_args(ver)
+
+    bench = sub.add_parser(
+        "bench", help="Measure upload throughput on synthetic datasets against a local S3 server.",
+    )
+    bench.add_argument(
+        "--scenario", action="append", choices=sorted(SCENARIOS), dest="scenarios",
+        help="Dataset to generate and upload; repeat for several (default: all).",
+    )
+    bench.add_argument(
+        "--scale", type=float, default=1.0,
+        help="Multiply the scenarios' file counts, e.g. 0.1 for a quick run (default 1).",
+    )
+    bench.add_argument("--seed", type=int, default=0, help="Seed for the generated datasets.")
+    bench.add_argument(
+        "--server", choices=SERVERS, default="rclone",
+        help="Local S3 endpoint: rclone serve s3 (default) or a MinIO binary.",
+    )
+    bench.add_argument("--minio-exe", help="MinIO binary for --server minio (default: minio on PATH).")
+    bench.add_argument(
+        "--backend", choices=RCLONE_BACKENDS, default="process",
+        help="Upload backend used for the runs (default: process).",
+    )
+    bench.add_argument(
+        "--latency-ms", type=float, default=0.0,
+        help="Simulated round-trip latency between rclone and the server.",
+    )
+    bench.add_argument(
+        "--bandwidth", metavar="RATE",
+        help="Simulated uplink, e.g. 50Mbit or 2M (bytes/s, as in rclone).",
+    )
+    bench.add_argument(
+        "--set", action="append", default=[], metavar="KEY=VALUE", dest="settings",
+        help="bucket.conf option for the uploads, e.g. TRANSFERS=8 or CHECKSUM=false; repeatable.",
+    )
+    bench.add_argument("--no-warm", action="store_true", help="Skip the second, nothing-to-upload run.")
+    bench.add_argument("--workdir", help="Where to generate data and serve S3 from (default: a temp folder).")
+    bench.add_argument("--keep", action="store_true", help="Keep the generated data and the served bucket.")
+    bench.add_argument("--output", help="Results file (default: configs/bench/bench-<time>.json).")
+    bench.add_argument("--compare", metavar="RESULTS", help="Earlier results file to compare against.")
+
+    startup = sub.add_parser("startup", help="Profile the GUI's start-up imports against the budget.")
+    startup.add_argument("--module", default="app.gui", help="Module to import (default: app.gui).")
+    startup.add_argument("--top", type=int, default=15, help="How many of the slowest imports to list.")
+    startup.add_argument(
+        "--budget-ms", type=float, default=IMPORT_BUDGET_MS,
+        help=f"Fail if importing the module takes longer (default {IMPORT_BUDGET_MS:.0f}).",
+    )
+    return parser
+
+
+def _print_progress(p: Progress, label: str = "") -> None:
+    print(
+        f"  {label}{format_bytes(p.bytes)} / {format_bytes(p.total_bytes)}"
+        f"  {p.transfers}/{p.total_transfers} files"
+        f"  {format_bytes(p.speed)}/s  ETA {format_eta(p.eta)}"
+        + (f"  errors: {p.errors}" if p.errors else ""),
+        flush=True,
+    )
+
+
+def _resolve_rclone() -> tuple[str, str] | None:
+    rclone_exe = resolve_rclone_exe()
+    if not rclone_exe:
+        print(
+            "ERROR: could not find rclone.\n"
+            "Run setup.bat (Windows) or setup.sh (Linux/Mac) first, or place rclone in\n"
+            f"  - {os.path.join(get_app_root_dir(), 'runtime', 'rclone')}\n"
+            f"  - {get_user_config_dir()}\n"
+            "  - anywhere on PATH",
+            file=sys.stderr,
+        )
+        return None
+
+    rclone_conf = resolve_rclone_conf()
+    if not rclone_conf:
+        conf_path = ensure_config_file("rclone.conf", "rclone.conf.template")
+        print(
+            f"ERROR: no rclone.conf found. A template was written to\n  {conf_path}\n"
+            "Fill in the credentials and run again.",
+            file=sys.stderr,
+        )
+        return None
+    return rclone_exe, rclone_conf
+
+
+def _metadata(args: argparse.Namespace) -> UploadMetadata:
+    defs = ensure_defaults_ready()
+    return UploadMetadata(
+        theme=args.theme if args.theme is not None else defs.get("theme", "Seabirds"),
+        organisation=args.organisation if args.organisation is not None else defs.get("organisation", "NINA"),
+        creator_name=args.creator_name if args.creator_name is not None else defs.get("creator_name", ""),
+        project=args.project if args.project is not None else defs.get("project", ""),
+    )
+
+
+def _target(args: argparse.Namespace) -> UploadTarget:
+    remote, bucket, prefix = load_bucket_config()
+    prefix = args.prefix if args.prefix is not None else prefix
+    if prefix and not prefix.endswith("/"):
+        prefix += "/"
+    return UploadTarget(
+        remote=args.remote or remote,
+        bucket=args.bucket or bucket,
+        prefix=prefix,
+    )
+
+
+def _options(args: argparse.Namespace) -> dict[str, str]:
+    """bucket.conf options with this run's command-line overrides applied."""
+    options = load_bucket_options()
+    if args.bwlimit is not None:
+        options["bwlimit"] = args.bwlimit
+    if args.no_checksum:
+        options["checksum"] = "false"
+    if args.no_dedup:
+        options["dedup"] = "false"
+    if args.no_folder_summary:
+        options["folder_summary"] = "false"
+    if getattr(args, "verify", False):
+        options["verify"] = "true"
+    if args.repair:
+        options["repair"] = "true"
+    if args.metrics_textfile:
+        options["metrics_textfile"] = args.metrics_textfile
+    if args.root_files:
+        options["root_files"] = args.root_files
+    if args.bundle_small_files is not None:
+        options["bundle_small_files"] = args.bundle_small_files
+    if args.compress:
+        options["compress"] = args.compress
+    if args.upload_order:
+        options["upload_order"] = args.upload_order
+    if args.upload_first:
+        options["upload_first"] = ",".join(args.upload_first)
+    return options
+
+
+def cmd_upload(args: argparse.Namespace) -> int:
+    for folder in args.folders:
+        if not os.path.isdir(folder):
+            print(f"ERROR: not a folder: {folder}", file=sys.stderr)
+            return 2
+    if args.watch and len(args.folders) > 1:
+        print("ERROR: --watch takes a single folder", file=sys.stderr)
+        return 2
+    if args.from_card:
+        if args.watch or len(args.folders) > 1:
+            print("ERROR: --from-card takes a single folder and no --watch", file=sys.stderr)
+            return 2
+        if not os.path.isdir(args.from_card):
+            print(f"ERROR: not a folder: {args.from_card}", file=sys.stderr)
+            return 2
+
+    rclone = _resolve_rclone()
+    if rclone is None:
+        return 2
+    rclone_exe, rclone_conf = rclone
+    meta = _metadata(args)
+    target = _target(args)
+    options = _options(args)
+    if args.from_card:
+        # The card is read once; verification is what checks the drive copy.
+        options["verify"] = "true"
+
+    backend = args.backend or load_rclone_backend()
+    daemon = open_backend(backend, rclone_exe, rclone_conf)
+
+    def make_engine(job: UploadJob, on_status: StatusCallback, on_progress: ProgressCallback) -> UploadEngine:
+        log_debug(f"Headless upload: {job.folder} -> {target.dest} (backend={backend})")
+        return UploadEngine(
+            rclone_exe,
+            rclone_conf,
+            target,
+            on_status=on_status,
+            on_progress=on_progress,
+            use_scan_cache=not args.rescan,
+            use_ledger=not args.no_ledger,
+            reconcile=job.reconcile,
+            daemon=daemon,
+            options=options,
+            budget=queue.budget,
+        )
+
+    several = len(args.folders) > 1
+    last_message: dict[int, str] = {}
+
+    def on_update(job: UploadJob) -> None:
+        # Status changes are already logged by the engine; only progress is printed.
+        if job.message != last_message.get(job.id):
+            last_message[job.id] = job.message
+        elif job.progress is not None and job.active:
+            _print_progress(job.progress, f"[{job.folder}] " if several else "")
+
+    max_jobs, max_bytes = queue_limits(options)
+    queue = UploadQueue(make_engine, max_jobs=max_jobs, max_bytes_in_flight=max_bytes, on_update=on_update)
+    ingest_failed = False
+    try:
+        if daemon is not None:
+            daemon.start()
+        if args.watch:
+            folder = args.folders[0]
+            watcher = FolderWatcher(folder, *watch_timing(options), use_scan_cache=not args.rescan)
+            watcher.run(
+                lambda names: queue.submit(folder, meta, reconcile=args.reconcile, folders=names),
+                threading.Event(),
+            )
+        elif args.from_card:
+            folder = args.folders[0]
+            tee = open_tee(daemon, target.dest, options)
+            ingest = CardIngest(args.from_card, folder, open_hash_cache(options), tee)
+            try:
+                ingest.run(
+                    lambda names: queue.submit(folder, meta, reconcile=args.reconcile, verify=True, folders=names),
+                    threading.Event(),
+                )
+            except (OSError, RuntimeError) as e:
+                # Folders already copied still finish uploading.
+                log_debug(f"❌ Copy from card failed: {e}")
+                ingest_failed = True
+        else:
+            for folder in args.folders:
+                queue.submit(folder, meta, reconcile=args.reconcile)
+        queue.wait()
+    except KeyboardInterrupt:
+        queue.cancel_all()
+        queue.wait()
+        log_debug("❌ Upload cancelled.")
+        return 130
+    except Exception as e:
+        log_debug(f"❌ Upload failed: {e}")
+        return 1
+    finally:
+        if daemon is not None:
+            daemon.stop()
+    failed = [j for j in queue.jobs() if j.state not in (DONE, CANCELLED)]
+    for job in failed:
+        log_debug(f"❌ Upload failed: {job.folder}: {job.error}")
+    return 1 if failed or ingest_failed else 0
+
+
+def _print_report(report: VerificationReport) -> None:
+    flush_log()
+    for f in report.folders:
+        if f.ok and not f.extra:
+            continue
+        print(f"  {f.relpath}: {f.remote_files} object(s), nfiles={f.yaml_nfiles}", flush=True)
+        for label, count, names in (
+            ("missing", f.missing, f.missing_names),
+            ("mismatched", f.mismatched, f.mismatched_names),
+            ("extra", f.extra, f.extra_names),
+        ):
+            if count:
+                more = f" (+{count - len(names)} more)" if count > len(names) else ""
+                print(f"    {label}: {', '.join(names)}{more}", flush=True)
+
+
+def cmd_verify(args: argparse.Namespace) -> int:
+    """Verify an earlier upload and, with --repair, re-upload only the gaps."""
+    if not os.path.isdir(args.folder):
+        print(f"ERROR: not a folder: {args.folder}", file=sys.stderr)
+        return 2
+    rclone = _resolve_rclone()
+    if rclone is None:
+        return 2
+    rclone_exe, rclone_conf = rclone
+
+    backend = args.backend or load_rclone_backend()
+    daemon = open_backend(backend, rclone_exe, rclone_conf)
+    engine = UploadEngine(
+        rclone_exe,
+        rclone_conf,
+        _target(args),
+        on_progress=_print_progress,
+        use_scan_cache=not args.rescan,
+        use_ledger=not args.no_ledger,
+        daemon=daemon,
+        options=_options(args),
+    )
+    try:
+        if daemon is not None:
+            daemon.start()
+        report = engine.verify_upload(args.folder)
+        _print_report(report)
+        if not report.ok and args.repair and report.gaps:
+            report = engine.repair_upload(args.folder, _metadata(args), report)
+            _print_report(report)
+    except KeyboardInterrupt:
+        engine.cancel()
+        log_debug("❌ Verification cancelled.")
+        return 130
+    except Exception as e:
+        log_debug(f"❌ Verification failed: {e}")
+        return 1
+    finally:
+        if daemon is not None:
+            daemon.stop()
+    log_debug(("✅ " if report.ok else "⚠️ ") + report.summary())
+    return 0 if report.ok else 1
+
+
+def _print_run(r: RunResult) -> None:
+    flush_log()
+    line = (
+        f"  {r.scenario:<12} {r.run:<5} scan {r.scan_s:6.1f}s  yaml {r.yaml_s:5.1f}s  "
+        f"upload {r.upload_s:6.1f}s  total {r.total_s:6.1f}s  "
+        f"{r.uploaded_files}/{r.files} files  {r.files_per_s:7.1f} files/s  {r.mb_per_s:7.1f} MB/s"
+    )
+    if r.error:
+        line += f"  ERROR: {r.error}"
+    print(line, flush=True)
+
+
+def cmd_bench(args: argparse.Namespace) -> int:
+    """Run the throughput benchmarks and write the results as JSON."""
+    rclone_exe = resolve_rclone_exe()
+    if not rclone_exe:
+        print("ERROR: could not find rclone. Run setup.bat / setup.sh first.", file=sys.stderr)
+        return 2
+    options: dict[str, str] = {}
+    for setting in args.settings:
+        key, sep, value = setting.partition("=")
+        if not sep or not key.strip():
+            print(f"ERROR: expected KEY=VALUE, got {setting!r}", file=sys.stderr)
+            return 2
+        options[key.strip().lower()] = value.strip()
+    previous = None
+    if args.compare:
+        try:
+            with open(args.compare, encoding="utf-8") as f:
+                previous = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"ERROR: cannot read {args.compare}: {e}", file=sys.stderr)
+            return 2
+
+    config = BenchConfig(
+        scenarios=args.scenarios or list(SCENARIOS),
+        scale=args.scale,
+        seed=args.seed,
+        server=args.server,
+        minio_exe=args.minio_exe,
+        backend=args.backend,
+        latency_ms=args.latency_ms,
+        bandwidth=args.bandwidth,
+        options=options,
+        warm=not args.no_warm,
+        workdir=args.workdir,
+        keep=args.keep,
+    )
+    try:
+        record = run_benchmarks(rclone_exe, config, on_result=_print_run)
+    except KeyboardInterrupt:
+        log_debug("❌ Benchmark cancelled.")
+        return 130
+    except (RuntimeError, ValueError, OSError) as e:
+        log_debug(f"❌ Benchmark failed: {e}")
+        return 1
+    path = write_results(record, args.output)
+    log_debug(f"Benchmark results written to {path}")
+    if previous is not None:
+        for line in compare_results(previous, record):
+            print(f"  {line}", flush=True)
+    return 1 if any(r["error"] for r in record["results"]) else 0
+
+
+def cmd_startup(args: argparse.Namespace) -> int:
+    """List the slowest imports of the GUI module; fail if the total is over budget."""
+    try:
+        entries = profile_imports(args.module)
+    except RuntimeError as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        return 2
+    if not entries:
+        print(f"ERROR: no import timings for {args.module}", file=sys.stderr)
+        return 2
+    total = entries[-1][2]
+    print(f"{'self ms':>9} {'cumul. ms':>10}  module")
+    for name, self_ms, cumulative_ms in sorted(entries, key=lambda e: e[2], reverse=True)[:args.top]:
+        print(f"{self_ms:9.1f} {cumulative_ms:10.1f}  {name}")
+    verdict = "over" if total > args.budget_ms else "within"
+    print(f"import {args.module}: {total:.0f} ms, {verdict} the {args.budget_ms:.0f} ms budget")
+    return 1 if total > args.budget_ms else 0
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = build_parser().parse_args(argv)
+    commands = {"upload": cmd_upload, "verify": cmd_verify, "bench": cmd_bench, "startup": cmd_startup}
+    try:
+        return commands[args.command](args) if args.command in commands else 2
+    finally:
+        flush_log()
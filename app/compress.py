@@ -0,0 +1,326 @@
+"""Compression of compressible file types before upload.
+
+Flight folders hold RINEX observation files, flight logs, CSV and XML next to
+images and video. With ``COMPRESS`` set in bucket.conf, files whose extension
+is on the allowlist (``COMPRESS_EXTENSIONS`` to change it) are compressed in
+a thread pool and uploaded as ``<name>.gz`` (or ``.zst`` with
+``COMPRESS_CODEC=zstd`` and the optional ``zstandard`` package). Each object
+carries metadata recording the original:
+
+    seabee-original-size, seabee-original-md5, seabee-encoding
+
+The compressed copy is staged under ``configs/staging/`` with a local
+``.meta.json`` sidecar holding the same facts. Uploaded copies are deleted;
+the sidecar stays, so a file that was uploaded compressed keeps its
+compressed name on later runs. Files that do not shrink by at least 10 % are
+uploaded as they are and are not tried again.
+
+``COMPRESS=on`` always compresses. ``COMPRESS=auto`` stops compressing new
+files once compressing costs more time than it saves on the wire. That is
+the case when the link, as measured by the last upload to the same
+destination and capped by BWLIMIT, is faster than
+``compression speed × (1 - compressed/original)``.
+"""
+
+import datetime
+import gzip
+import hashlib
+import importlib.util
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from app.bandwidth import BandwidthSchedule
+from app.log import log_debug
+from app.metrics import recent_upload_rate
+from app.scanner import FileEntry, FolderManifest
+
+COMPRESS_MODES = ("off", "auto", "on")
+CODECS = {"gzip": ".gz", "zstd": ".zst"}
+META_SUFFIX = ".meta.json"
+DEFAULT_EXTENSIONS = frozenset({
+    ".obs", ".nav", ".rnx", ".ubx", ".nmea", ".sbf",  # GNSS / RTK
+    ".log", ".bin", ".mrk",  # flight logs, timestamps
+    ".csv", ".txt", ".xml", ".json", ".kml", ".gpx",
+})
+# RINEX 2 names end in the year and the file type, e.g. ``.21o``, ``.21n``.
+_RINEX2_RE = re.compile(r"\.\d\d[ondglmph]$", re.IGNORECASE)
+
+# Not worth a compressed copy below this.
+MIN_COMPRESS_BYTES = 4096
+# Keep the compressed copy only if it is at most this fraction of the original.
+MAX_RATIO = 0.9
+# Compress this much before ``auto`` trusts its measured speed and ratio.
+_SAMPLE_BYTES = 4 * 1024 * 1024
+_CHUNK_BYTES = 1024 * 1024
+
+# ``(relpath, entry) -> True`` if ``entry`` is recorded as uploaded under ``relpath``.
+UploadedLookup = Callable[[str, FileEntry], bool]
+
+
+def compress_mode(options: dict[str, str]) -> str:
+    """COMPRESS in bucket.conf: ``off`` (default), ``auto`` or ``on``."""
+    mode = options.get("compress", "off").strip().lower()
+    if mode in ("true", "yes", "1"):
+        return "on"
+    if mode in ("false", "no", "0", ""):
+        return "off"
+    if mode not in COMPRESS_MODES:
+        log_debug(f"Ignoring invalid COMPRESS={mode!r} in bucket.conf")
+        return "off"
+    return mode
+
+
+def compress_codec(options: dict[str, str]) -> str:
+    """COMPRESS_CODEC in bucket.conf: ``gzip`` (default) or ``zstd`` if zstandard is installed."""
+    codec = options.get("compress_codec", "gzip").strip().lower()
+    if codec not in CODECS:
+        log_debug(f"Ignoring invalid COMPRESS_CODEC={codec!r} in bucket.conf")
+        return "gzip"
+    if codec == "zstd" and importlib.util.find_spec("zstandard") is None:
+        log_debug("COMPRESS_CODEC=zstd needs the zstandard package; using gzip")
+        return "gzip"
+    return codec
+
+
+def compress_extensions(options: dict[str, str]) -> frozenset[str]:
+    """COMPRESS_EXTENSIONS in bucket.conf, e.g. ``.obs,.nav,.log``."""
+    raw = options.get("compress_extensions", "").strip()
+    if not raw:
+        return DEFAULT_EXTENSIONS
+    return frozenset(
+        ext if ext.startswith(".") else f".{ext}"
+        for ext in (part.strip().lower() for part in raw.replace(" ", ",").split(","))
+        if ext
+    )
+
+
+def metadata_mapper_command(root: str) -> list[str]:
+    """rclone ``--metadata-mapper`` program that tags compressed objects under ``root``."""
+    return [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "metamapper.py"), root]
+
+
+def _compress_file(src_path: str, dst_path: str, codec: str, name: str, mtime: float) -> tuple[str, int]:
+    """Compress ``src_path`` to ``dst_path``; returns (MD5 of the original, compressed size)."""
+    md5 = hashlib.md5()
+    with open(src_path, "rb") as src, open(dst_path, "wb") as raw:
+        if codec == "zstd":
+            import zstandard
+
+            out = zstandard.ZstdCompressor(level=3).stream_writer(raw, closefd=False)
+        else:
+            # Name and modtime go in the gzip header, so the output is the same
+            # on every run and gunzip restores both.
+            out = gzip.GzipFile(filename=name, mode="wb", compresslevel=6, fileobj=raw, mtime=int(mtime))
+        with out:
+            while chunk := src.read(_CHUNK_BYTES):
+                md5.update(chunk)
+                out.write(chunk)
+    os.utime(dst_path, (mtime, mtime))
+    return md5.hexdigest(), os.path.getsize(dst_path)
+
+
+class Compressor:
+    """Replaces compressible files in folder manifests with staged compressed copies."""
+
+    def __init__(
+        self,
+        root: str,
+        codec: str = "gzip",
+        extensions: frozenset[str] = DEFAULT_EXTENSIONS,
+        auto: bool = False,
+        link_rate: float | None = None,
+        workers: int | None = None,
+    ):
+        self.root = root
+        self.codec = codec
+        self.suffix = CODECS[codec]
+        self.extensions = extensions
+        self.auto = auto
+        self.link_rate = link_rate  # bytes/s the link is expected to manage; None if unknown
+        self.workers = workers or os.cpu_count() or 1
+        self.enabled = True
+        self.compressed = 0  # files uploaded compressed (new and earlier)
+        self.bytes_in = 0  # compressed this run: original bytes
+        self.bytes_out = 0  # compressed this run: compressed bytes
+        self.seconds = 0.0  # wall time spent compressing this run
+
+    @classmethod
+    def from_options(cls, root: str, dest: str, options: dict[str, str], bandwidth: BandwidthSchedule | None):
+        link_rate = recent_upload_rate(dest)
+        if bandwidth is not None:
+            cap = bandwidth.bytes_per_s_at(datetime.datetime.now())
+            if cap is not None:
+                link_rate = min(link_rate, cap) if link_rate is not None else cap
+        return cls(
+            root,
+            codec=compress_codec(options),
+            extensions=compress_extensions(options),
+            auto=compress_mode(options) == "auto",
+            link_rate=link_rate,
+        )
+
+    def wants(self, f: FileEntry) -> bool:
+        if f.source is not None or f.size < MIN_COMPRESS_BYTES:
+            return False
+        ext = os.path.splitext(f.name)[1].lower()
+        return ext in self.extensions or bool(_RINEX2_RE.search(f.name))
+
+    def _worth_it(self) -> bool:
+        """In ``auto`` mode: does compressing save more wire time than it costs?"""
+        if not self.auto or self.link_rate is None or self.bytes_in < _SAMPLE_BYTES or self.seconds <= 0:
+            return True
+        speed = self.bytes_in / self.seconds
+        saved = 1 - self.bytes_out / self.bytes_in
+        return speed * saved > self.link_rate
+
+    def files_for(
+        self,
+        manifest: FolderManifest,
+        is_uploaded: UploadedLookup | None = None,
+        allow_new: bool = True,
+    ) -> list[FileEntry]:
+        """The folder's files as they are uploaded, compressible ones replaced by compressed copies.
+
+        Files compressed on an earlier run keep their compressed form; new
+        ones are compressed only with ``allow_new`` and while it pays off.
+        A missing staged copy is rebuilt unless ``is_uploaded`` says it is
+        on the remote; an uploaded one is deleted.
+        """
+        staging = os.path.join(self.root, *manifest.relpath.split("/"))
+        files: list[FileEntry] = []
+        todo: list[FileEntry] = []
+        rebuild: list[FileEntry] = []  # uploaded compressed before: keep that form
+        for f in manifest.files:
+            if not self.wants(f):
+                files.append(f)
+                continue
+            staged = os.path.join(staging, f.name + self.suffix)
+            meta = _read_meta(staged + META_SUFFIX, f)
+            if meta is None:
+                if allow_new and self.enabled:
+                    todo.append(f)
+                else:
+                    files.append(f)
+                continue
+            if meta["codec"] == "none":
+                files.append(f)  # did not compress well enough
+                continue
+            entry = FileEntry(
+                f.name + self.suffix, meta["compressed_size"], f.mtime, source=staged, compressed=True,
+            )
+            uploaded = is_uploaded is not None and is_uploaded(manifest.relpath, entry)
+            if os.path.exists(staged):
+                if uploaded:
+                    _remove(staged)
+            elif not uploaded:
+                rebuild.append(f)
+                continue
+            files.append(entry)
+            self.compressed += 1
+        if rebuild:
+            files.extend(self._compress(manifest.path, staging, rebuild, force=True))
+        if todo:
+            files.extend(self._compress(manifest.path, staging, todo))
+        files.sort(key=lambda f: f.name)
+        return files
+
+    def _compress(self, folder: str, staging: str, todo: list[FileEntry], force: bool = False) -> list[FileEntry]:
+        os.makedirs(staging, exist_ok=True)
+        result: list[FileEntry] = []
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(todo))) as pool:
+            # In batches of about one sample, so ``auto`` can stop part-way through a folder.
+            i = 0
+            while i < len(todo):
+                if not force and not self._worth_it():
+                    if self.enabled:
+                        self.enabled = False
+                        log_debug(
+                            f"Compression off: the link ({self.link_rate / 1e6:.1f} MB/s) is faster than "
+                            f"compressing saves ({self.bytes_in / self.seconds / 1e6:.1f} MB/s at "
+                            f"{self.bytes_out / self.bytes_in:.0%} of the size)"
+                        )
+                    result.extend(todo[i:])
+                    break
+                batch = [todo[i]]
+                nbytes = todo[i].size
+                i += 1
+                while i < len(todo) and len(batch) < self.workers * 4 and nbytes < _SAMPLE_BYTES:
+                    batch.append(todo[i])
+                    nbytes += todo[i].size
+                    i += 1
+                started = time.perf_counter()
+                done = list(pool.map(lambda f: self._compress_one(folder, staging, f), batch))
+                self.seconds += time.perf_counter() - started
+                for f, (entry, size) in zip(batch, done):
+                    if size is not None:
+                        self.bytes_in += f.size
+                        self.bytes_out += size
+                    if entry.source is not None:
+                        self.compressed += 1
+                    result.append(entry)
+        return result
+
+    def _compress_one(self, folder: str, staging: str, f: FileEntry) -> tuple[FileEntry, int | None]:
+        """Runs in the pool: the entry to upload, and the compressed size (None on failure)."""
+        staged = os.path.join(staging, f.name + self.suffix)
+        tmp = staged + ".tmp"
+        try:
+            md5, size = _compress_file(os.path.join(folder, f.name), tmp, self.codec, f.name, f.mtime)
+        except OSError as e:
+            log_debug(f"Could not compress {f.name}, uploading it as it is: {e}")
+            _remove(tmp)
+            return f, None
+        meta = {"size": f.size, "mtime": f.mtime, "md5": md5, "codec": self.codec, "compressed_size": size}
+        if size > f.size * MAX_RATIO:
+            _remove(tmp)
+            meta["codec"] = "none"
+        else:
+            os.replace(tmp, staged)
+        with open(staged + META_SUFFIX, "w", encoding="utf-8") as out:
+            json.dump(meta, out, sort_keys=True)
+        if meta["codec"] == "none":
+            return f, size
+        return FileEntry(f.name + self.suffix, size, f.mtime, source=staged, compressed=True), size
+
+    def release(self, list_path: str) -> None:
+        """Delete the staged compressed copies in an uploaded transfer list; their sidecars stay."""
+        with open(list_path, encoding="utf-8") as f:
+            for line in f:
+                path = os.path.join(self.root, *line.rstrip("\n").split("/"))
+                if os.path.exists(path + META_SUFFIX):
+                    _remove(path)
+
+    def summary(self) -> str:
+        text = f"{self.compressed} file(s) uploaded compressed ({self.codec})"
+        if self.bytes_in:
+            text += (
+                f"; {self.bytes_in // 1024} KiB compressed to {self.bytes_out // 1024} KiB "
+                f"in {self.seconds:.1f}s"
+            )
+        return text
+
+
+def _read_meta(path: str, f: FileEntry) -> dict | None:
+    """The sidecar of ``f``'s compressed copy, if it still describes ``f``."""
+    try:
+        with open(path, encoding="utf-8") as fh:
+            meta = json.load(fh)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(meta, dict) or meta.get("size") != f.size or meta.get("mtime") != f.mtime:
+        return None
+    if meta.get("codec") != "none" and not isinstance(meta.get("compressed_size"), int):
+        return None
+    return meta
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
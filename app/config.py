@@ -0,0 +1,340 @@
+import os
+import shutil
+import subprocess
+import sys
+import shlex
+
+from app.log import log_debug
+from app.paths import _safe_makedirs, get_app_root_dir, get_resources_dir, get_user_config_dir
+
+
+# ---------------------------------------------------------------------------
+# Config files
+# ---------------------------------------------------------------------------
+
+DEFAULT_REMOTE_NAME = "minio"
+DEFAULT_BUCKET_NAME = "fielduploads"
+DEFAULT_OBJECT_PREFIX = "seabirds/"
+DEFAULT_RCLONE_BACKEND = "process"
+RCLONE_BACKENDS = ("process", "rcd", "native")
+
+DEFAULTS_TEMPLATE_TEXT = """\
+# defaults.txt
+theme=Seabirds
+organisation=NINA
+creator_name=
+project=SEAPOP 3B - Kartlegging av hekkebestander
+"""
+
+RCLONE_TEMPLATE_TEXT = """\
+# Template rclone config for SeaBee FieldUploader
+#
+# Fill in the values below.
+
+[minio]
+type = s3
+provider = Minio
+env_auth = false
+access_key_id = <ACCESS_KEY_ID>
+secret_access_key = <SECRET_ACCESS_KEY>
+endpoint = https://<MINIO_HOST>
+"""
+
+BUCKET_TEMPLATE_TEXT = f"""\
+# bucket.conf
+# Controls where uploads go in rclone.
+#
+# Keys are case-insensitive.
+
+REMOTE_NAME={DEFAULT_REMOTE_NAME}
+BUCKET_NAME={DEFAULT_BUCKET_NAME}
+OBJECT_PREFIX={DEFAULT_OBJECT_PREFIX}
+
+# Optional: run one long-lived "rclone rcd" per session instead of one
+# rclone process per transfer.
+# RCLONE_BACKEND=rcd
+#
+# Or upload from this process over S3 with resumable multipart uploads for
+# large files (reads the remote's section of rclone.conf; needs
+# "pip install aiobotocore"). rclone is still used for listings.
+# RCLONE_BACKEND=native
+
+# Optional: fixed rclone transfer settings. By default they are chosen from the
+# file sizes being uploaded and adjusted from the measured speed during the run.
+# TRANSFERS=8
+# CHECKERS=16
+# S3_CHUNK_SIZE=32M
+# S3_UPLOAD_CONCURRENCY=4
+# AUTOTUNE=false
+
+# Optional: files are hashed (MD5) before upload and rclone compares checksums
+# rather than modtimes, which are unreliable after copying between drives.
+# CHECKSUM=false
+
+# Optional: with checksums on, a file whose content is already in the bucket
+# (another folder, an earlier run) is copied there server-side instead of
+# being uploaded again.
+# DEDUP=false
+
+# Optional: bandwidth cap, in rclone's --bwlimit timetable syntax. Rates are
+# bytes/s (2M = 2 MiB/s) unless given in bits. Example: 2 Mbit/s during the
+# day, unlimited overnight:
+# BWLIMIT=08:00,2Mbit 20:00,off
+
+# Optional: how many queued folders/drives upload at once (default 2), and a
+# cap on the bytes all of them have in flight together.
+# MAX_JOBS=2
+# MAX_BYTES_IN_FLIGHT=20G
+
+# Optional: after each upload, list the target prefix and check every file
+# (and each folder's nfiles) arrived; REPAIR=true also re-uploads any gaps.
+# VERIFY=true
+# REPAIR=true
+
+# Optional: flight folders are uploaded one after another, and each gets a
+# fielduploads.seabee.complete object once all its files are in the bucket.
+# UPLOAD_ORDER picks which go first: name (default), newest, oldest,
+# smallest, or mixed (everything at once, no markers). UPLOAD_FIRST lists
+# folders (name or pattern) to upload before all others.
+# UPLOAD_ORDER=newest
+# UPLOAD_FIRST=DJI_202405*_Runde,Flight_07
+
+# Optional: each folder's YAML lists its total_bytes, the capture time
+# range, GPS bounding box and camera models, read from the JPG/TIFF
+# headers (never the whole image). FOLDER_SUMMARY=false leaves them out.
+# FOLDER_SUMMARY=false
+
+# Optional: in watch mode ("Watch for new folders" / upload --watch), a
+# folder is uploaded once its files have not changed for WATCH_SETTLE
+# seconds; the drive is checked every WATCH_POLL seconds.
+# WATCH_SETTLE=30
+# WATCH_POLL=5
+
+# Optional: upload loose files at the drive root to a package folder that
+# only exists in the bucket, instead of moving them into one on the drive.
+# ROOT_FILES=virtual
+
+# Optional: pack files smaller than this in each folder into tar bundles
+# with a JSON index (fewer objects on slow, high-latency links).
+# BUNDLE_SMALL_FILES=1M
+
+# Optional: upload logs, RINEX and other text-like files gzip-compressed
+# (as <name>.gz). "auto" stops compressing when the link is fast enough
+# that it would not save time. COMPRESS_EXTENSIONS replaces the default list.
+# COMPRESS=auto
+# COMPRESS_EXTENSIONS=.obs,.nav,.rnx,.log,.bin,.csv,.txt,.xml
+
+# Optional: also write each run's phase times and counters (always saved as
+# JSON in configs/runs/) as a Prometheus textfile for node_exporter.
+# METRICS_TEXTFILE=/var/lib/node_exporter/textfile_collector/seabee.prom
+"""
+
+
+def ensure_config_file(filename: str, template_filename: str | None) -> str:
+    target_dir = get_user_config_dir()
+    _safe_makedirs(target_dir)
+
+    target_path = os.path.join(target_dir, filename)
+    if os.path.isfile(target_path):
+        return target_path
+
+    # Try copying from resources/ template first.
+    if template_filename:
+        template_path = os.path.join(get_resources_dir(), template_filename)
+        if os.path.isfile(template_path):
+            try:
+                shutil.copyfile(template_path, target_path)
+                log_debug(f"Config created from template: {target_path}")
+                return target_path
+            except Exception as e:
+                log_debug(f"Template copy failed: {e}")
+
+    # Fall back to embedded default text.
+    try:
+        with open(target_path, "w", encoding="utf-8") as f:
+            if filename.lower() == "defaults.txt":
+                f.write(DEFAULTS_TEMPLATE_TEXT)
+            elif filename.lower() == "rclone.conf":
+                f.write(RCLONE_TEMPLATE_TEXT)
+            elif filename.lower() == "bucket.conf":
+                f.write(BUCKET_TEMPLATE_TEXT)
+            else:
+                f.write("")
+        log_debug(f"Config created (embedded): {target_path}")
+    except Exception as e:
+        log_debug(f"Config write failed: {e}")
+    return target_path
+
+
+def bootstrap_config_files() -> None:
+    log_debug(f"Config dir: {get_user_config_dir()}")
+    log_debug(f"App root:   {get_app_root_dir()}")
+    ensure_config_file("defaults.txt", "defaults.txt")
+    ensure_config_file("rclone.conf", "rclone.conf.template")
+    ensure_config_file("bucket.conf", "bucket.conf.template")
+
+
+def write_diagnostics_snapshot() -> None:
+    cfg_dir = get_user_config_dir()
+    log_debug("--- Diagnostics ---")
+    log_debug(f"platform={sys.platform}  python={sys.version.split()[0]}  exe={sys.executable}")
+    log_debug(f"cwd={os.getcwd()}")
+    log_debug(f"config_dir={cfg_dir}")
+    for name in ["defaults.txt", "rclone.conf", "bucket.conf"]:
+        p = os.path.join(cfg_dir, name)
+        exists = os.path.isfile(p)
+        log_debug(f"  {name}: exists={exists}")
+
+
+# ---------------------------------------------------------------------------
+# Helpers: key=value files
+# ---------------------------------------------------------------------------
+
+def parse_kv_file(path: str) -> dict[str, str]:
+    data: dict[str, str] = {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for raw in f:
+                line = raw.strip()
+                if not line or line.startswith("#"):
+                    continue
+                if "=" not in line:
+                    continue
+                k, v = line.split("=", 1)
+                data[k.strip().lower()] = v.strip()
+    except Exception:
+        pass
+    return data
+
+
+_SIZE_UNITS = {"": 1, "k": 1024, "m": 1024 ** 2, "g": 1024 ** 3, "t": 1024 ** 4}
+
+
+def parse_size(raw: str) -> int | None:
+    """Parse ``20G`` / ``512M`` / ``20GiB`` / ``5Mi`` (binary units) into bytes; None if invalid."""
+    value = raw.strip().lower().removesuffix("b").removesuffix("i")
+    unit = value[-1:] if value[-1:] in _SIZE_UNITS else ""
+    try:
+        n = float(value[: len(value) - len(unit)])
+    except ValueError:
+        return None
+    return int(n * _SIZE_UNITS[unit]) if n > 0 else None
+
+
+# ---------------------------------------------------------------------------
+# Bucket config
+# ---------------------------------------------------------------------------
+
+def load_bucket_options() -> dict[str, str]:
+    """All keys in bucket.conf, lower-cased."""
+    return parse_kv_file(ensure_config_file("bucket.conf", "bucket.conf.template"))
+
+
+def load_rclone_backend() -> str:
+    backend = load_bucket_options().get("rclone_backend", DEFAULT_RCLONE_BACKEND).lower()
+    if backend not in RCLONE_BACKENDS:
+        log_debug(f"Unknown RCLONE_BACKEND={backend!r}, using {DEFAULT_RCLONE_BACKEND}")
+        return DEFAULT_RCLONE_BACKEND
+    return backend
+
+
+def load_bucket_config(options: dict[str, str] | None = None) -> tuple[str, str, str]:
+    cfg = load_bucket_options() if options is None else options
+    remote = cfg.get("remote_name", DEFAULT_REMOTE_NAME)
+    bucket = cfg.get("bucket_name", DEFAULT_BUCKET_NAME)
+    prefix = cfg.get("object_prefix", DEFAULT_OBJECT_PREFIX)
+    if prefix and not prefix.endswith("/"):
+        prefix += "/"
+    return remote, bucket, prefix
+
+
+# ---------------------------------------------------------------------------
+# Rclone resolution
+# ---------------------------------------------------------------------------
+
+def format_command_for_display(argv: list[str]) -> str:
+    if sys.platform.startswith("win"):
+        return subprocess.list2cmdline(argv)
+    return shlex.join(argv)
+
+
+def resolve_rclone_exe() -> str | None:
+    env_path = os.environ.get("SEABEE_RCLONE_EXE") or os.environ.get("RCLONE_EXE")
+    if env_path and os.path.isfile(env_path):
+        return env_path
+
+    local_name = "rclone.exe" if sys.platform.startswith("win") else "rclone"
+    root = get_app_root_dir()
+
+    # Portable runtime/ directory (created by setup.bat / setup.sh)
+    runtime_candidate = os.path.join(root, "runtime", "rclone", local_name)
+    if os.path.isfile(runtime_candidate):
+        return runtime_candidate
+
+    # Next to the app
+    root_candidate = os.path.join(root, local_name)
+    if os.path.isfile(root_candidate):
+        return root_candidate
+
+    # In configs/
+    config_candidate = os.path.join(get_user_config_dir(), local_name)
+    if os.path.isfile(config_candidate):
+        return config_candidate
+
+    return shutil.which("rclone")
+
+
+def resolve_rclone_conf() -> str | None:
+    env_path = os.environ.get("SEABEE_RCLONE_CONFIG") or os.environ.get("RCLONE_CONFIG")
+    if env_path and os.path.isfile(env_path):
+        return env_path
+
+    candidates = [
+        os.path.join(get_user_config_dir(), "rclone.conf"),
+        os.path.join(get_app_root_dir(), "rclone.conf"),
+    ]
+    for path in candidates:
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+# ---------------------------------------------------------------------------
+# Defaults
+# ---------------------------------------------------------------------------
+
+def resolve_defaults_path() -> str:
+    return os.path.join(get_user_config_dir(), "defaults.txt")
+
+
+def parse_defaults_file(path: str) -> dict:
+    defs: dict[str, str] = {}
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                if "=" in line:
+                    k, v = line.split("=", 1)
+                    defs[k.strip()] = v.strip()
+    except Exception:
+        pass
+    return defs
+
+
+def write_defaults_file(path: str, theme: str, organisation: str, creator_name: str, project: str) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("# defaults.txt\n")
+        f.write(f"theme={theme}\n")
+        f.write(f"organisation={organisation}\n")
+        f.write(f"creator_name={creator_name}\n")
+        f.write(f"project={project}\n")
+
+
+def ensure_defaults_ready() -> dict:
+    defaults_path = resolve_defaults_path()
+    if not os.path.isfile(defaults_path):
+        ensure_config_file("defaults.txt", "defaults.txt")
+    return parse_defaults_file(defaults_path)
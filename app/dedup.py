@@ -0,0 +1,55 @@
+"""Content-addressed deduplication across flight folders and runs.
+
+Field crews often copy the same DCIM folder to a drive twice, or re-copy
+root files that then go up again as another ``fielduploader_upload_*``
+package. With checksums on, the upload ledger already records every
+uploaded file's MD5, so it doubles as an index of the content on the
+remote: a file in the delta whose MD5 and size match an object recorded
+under the same rclone remote (by any folder or earlier run), or planned
+earlier in this run, is not uploaded. After the bulk upload, it is copied
+server-side from that object instead, with ``rclone copy`` between two paths
+of the remote (``operations/copyfile`` with rcd), so its bytes never cross
+the link again.
+
+A copy that fails, e.g. because its source was deleted from the bucket,
+falls back to a normal upload, and the source's ledger record is dropped so
+later runs do not pick it again. ``DEDUP=false`` in bucket.conf turns this
+off.
+"""
+
+from typing import Iterable, Iterator
+
+from app.plan import Copy
+
+# Below this, a server-side copy (one request per file) saves too little.
+MIN_DEDUP_BYTES = 256 * 1024
+
+
+def dedup_enabled(options: dict[str, str]) -> bool:
+    """DEDUP=false in bucket.conf uploads files again even if their content is on the remote."""
+    return options.get("dedup", "true").strip().lower() not in ("0", "false", "no", "off")
+
+
+def split_remote_path(path: str) -> tuple[str, str]:
+    """``minio:bucket/DJI_001/IMG.JPG`` -> (``minio:bucket/DJI_001``, ``IMG.JPG``)."""
+    folder, _, name = path.rpartition("/")
+    return folder, name
+
+
+def copy_groups(copies: Iterable[Copy]) -> Iterator[list[Copy]]:
+    """Group consecutive copies by source folder and remote destination folder.
+
+    A folder copied twice lists its files in the same order both times, so
+    a group is usually a whole folder, copied with one rclone call.
+    """
+    group: list[Copy] = []
+    key = None
+    for c in copies:
+        k = (split_remote_path(c.source)[0], c.remote_prefix, c.relpath.rpartition("/")[0])
+        if group and k != key:
+            yield group
+            group = []
+        key = k
+        group.append(c)
+    if group:
+        yield group
@@ -0,0 +1,1263 @@
+import datetime
+import functools
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, replace
+from typing import TYPE_CHECKING, Callable, Collection, Iterator
+
+from app.bandwidth import load_schedule
+from app.bundle import BUNDLE_PREFIX, Bundler, bundle_threshold
+from app.compress import Compressor, compress_mode, metadata_mapper_command
+from app.config import format_command_for_display
+from app.dedup import MIN_DEDUP_BYTES, copy_groups, dedup_enabled, split_remote_path
+from app.errors import UploadCancelled
+from app.exif import FolderSummarizer, folder_summary_enabled
+from app.hashing import HashCache, Hasher, checksum_enabled
+from app.ledger import UploadLedger, remote_dir_key
+from app.log import DEBUG, log, log_debug
+from app.metrics import RunMetrics, metrics_textfile
+from app.paths import get_user_config_dir
+from app.plan import Copy, FolderWork, TransferPlan, staging_root
+from app.progress import Progress, format_bytes
+from app.rcd import RcloneDaemon
+from app.scancache import ScanCache
+from app.scanner import COMPLETE_FILENAME, YAML_FILENAME, FileEntry, FolderManifest, scan_tree
+from app.schedule import completion_marker, order_folders, upload_first, upload_order
+from app.tuning import AutoTuner, TransferSettings, autotune_enabled, batch_bytes_for, parse_overrides
+from app.verify import (
+    VerificationReport,
+    Verifier,
+    parse_lsjson,
+    repair_enabled,
+    verify_enabled,
+    write_filter_file,
+)
+
+if TYPE_CHECKING:
+    from app.s3native import NativeS3
+
+ROOT_PACKAGE_PREFIX = "fielduploader_upload_"
+ROOT_FILES_MODES = ("move", "virtual")
+# Under the config dir: YAML files of virtual packages (one folder each), and
+# the package name chosen for each drive root (one ``<digest>.json`` file each).
+VIRTUAL_YAML_DIRNAME = "virtual_packages"
+
+# Up to this many files, the bulk copy checks each file on the remote
+# individually (--no-traverse) instead of listing the whole prefix.
+_NO_TRAVERSE_MAX_FILES = 1000
+
+
+# ---------------------------------------------------------------------------
+# Data
+# ---------------------------------------------------------------------------
+
+def _space_sep_list(args: list[str]) -> str:
+    """``args`` as one rclone SpaceSepList flag value (CSV-style quoting, space separated)."""
+    return " ".join('"' + a.replace('"', '""') + '"' for a in args)
+
+
+def root_files_mode(options: dict[str, str]) -> str:
+    """ROOT_FILES in bucket.conf: ``move`` loose root files into a package folder
+    on the drive (default), or upload them to a ``virtual`` package in place."""
+    mode = options.get("root_files", "move").strip().lower()
+    if mode not in ROOT_FILES_MODES:
+        log_debug(f"Ignoring invalid ROOT_FILES={mode!r} in bucket.conf")
+        return "move"
+    return mode
+
+
+@dataclass
+class UploadMetadata:
+    """Per-upload fields written to every fielduploads.seabee.yaml."""
+    theme: str
+    organisation: str
+    creator_name: str
+    project: str
+
+    def as_dict(self) -> dict:
+        return {
+            "theme": self.theme,
+            "organisation": self.organisation,
+            "creator_name": self.creator_name,
+            "project": self.project,
+        }
+
+
+@dataclass
+class UploadTarget:
+    remote: str
+    bucket: str
+    prefix: str
+
+    @property
+    def dest(self) -> str:
+        return f"{self.remote}:{self.bucket}/{self.prefix}"
+
+
+StatusCallback = Callable[[str], None]
+ProgressCallback = Callable[[Progress], None]
+
+
+class ByteBudget:
+    """Caps the bytes in flight across engines uploading at the same time.
+
+    Each batch is admitted before rclone starts on it and released when it
+    ends. A batch bigger than the cap is admitted once nothing else is in
+    flight, so it never waits forever.
+    """
+
+    def __init__(self, max_bytes: int | None = None):
+        self.max_bytes = max_bytes
+        self.in_flight = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, nbytes: int, should_stop: Callable[[], bool] | None = None) -> bool:
+        """Wait until ``nbytes`` fit; False if ``should_stop`` said so first."""
+        with self._cond:
+            while (
+                self.max_bytes is not None
+                and self.in_flight
+                and self.in_flight + nbytes > self.max_bytes
+            ):
+                if should_stop and should_stop():
+                    return False
+                self._cond.wait(0.5)
+            self.in_flight += nbytes
+            return True
+
+    def release(self, nbytes: int) -> None:
+        with self._cond:
+            self.in_flight -= nbytes
+            self._cond.notify_all()
+
+
+# ---------------------------------------------------------------------------
+# Helpers: YAML
+# ---------------------------------------------------------------------------
+
+def safe_load_yaml(path: str) -> dict:
+    import yaml
+
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = yaml.safe_load(f) or {}
+        return data if isinstance(data, dict) else {}
+    except Exception:
+        return {}
+
+
+def dump_yaml(meta: dict) -> str:
+    import yaml
+
+    return yaml.dump(meta, sort_keys=False, allow_unicode=True)
+
+
+# ---------------------------------------------------------------------------
+# Engine
+# ---------------------------------------------------------------------------
+
+class UploadEngine:
+    """Headless upload pipeline shared by the GUI and the CLI.
+
+    The engine never touches tkinter. Status text and progress are reported
+    through the optional callbacks; failures are raised as exceptions.
+    """
+
+    def __init__(
+        self,
+        rclone_exe: str,
+        rclone_conf: str,
+        target: UploadTarget,
+        on_status: StatusCallback | None = None,
+        on_progress: ProgressCallback | None = None,
+        use_scan_cache: bool = True,
+        use_ledger: bool = True,
+        reconcile: bool = False,
+        daemon: "RcloneDaemon | NativeS3 | None" = None,
+        options: dict[str, str] | None = None,
+        budget: ByteBudget | None = None,
+    ):
+        self.rclone_exe = rclone_exe
+        self.rclone_conf = rclone_conf
+        self.target = target
+        self.use_scan_cache = use_scan_cache
+        self.use_ledger = use_ledger
+        self.reconcile = reconcile
+        self.daemon = daemon
+        self.options = options or {}
+        self.bandwidth = load_schedule(self.options)
+        self.checksum = checksum_enabled(self.options)
+        # Duplicates are found by MD5, so only with checksums on.
+        self.dedup = self.checksum and dedup_enabled(self.options)
+        self.repair = repair_enabled(self.options)
+        self.verify = self.repair or verify_enabled(self.options)
+        self.virtual_root = root_files_mode(self.options) == "virtual"
+        self.bundle_below = bundle_threshold(self.options)
+        self.compress = compress_mode(self.options) != "off"
+        self.upload_order = upload_order(self.options)
+        self.upload_first = upload_first(self.options)
+        self.folder_summary = folder_summary_enabled(self.options)
+        self.budget = budget
+        self._on_status = on_status
+        self._on_progress = on_progress
+        self._last_progress: Progress | None = None
+        # (bytes, files) finished by earlier batches, and the whole upload's
+        # totals, so progress covers the upload rather than one batch.
+        self._progress_base: tuple[int, int, int, int] | None = None
+        # rclone --metadata-mapper for staged batches while compressing.
+        self._metadata_mapper: list[str] | None = None
+        self._cancel = threading.Event()
+        self._process: subprocess.Popen | None = None
+        self.metrics = self._new_metrics("")
+
+    def _new_metrics(self, folder: str) -> RunMetrics:
+        return RunMetrics(folder, self.target.dest, self.daemon.backend if self.daemon is not None else "process")
+
+    def cancel(self) -> None:
+        """Stop the running upload. Safe to call from any thread."""
+        self._cancel.set()
+        process = self._process
+        if process is not None and process.poll() is None:
+            process.terminate()
+
+    def _check_cancelled(self) -> None:
+        if self._cancel.is_set():
+            raise UploadCancelled("Upload cancelled")
+
+    def _emit_progress(self, p: Progress) -> None:
+        self._last_progress = p
+        if not self._on_progress:
+            return
+        if self._progress_base is not None:
+            done_bytes, done_files, total_bytes, total_files = self._progress_base
+            p = replace(
+                p,
+                bytes=done_bytes + p.bytes,
+                transfers=done_files + p.transfers,
+                total_bytes=total_bytes,
+                total_transfers=total_files,
+            )
+            if p.speed > 0:
+                p.eta = max(0.0, (p.total_bytes - p.bytes) / p.speed)
+        self._on_progress(p)
+
+    def _status(self, message: str) -> None:
+        log_debug(message)
+        if self._on_status:
+            self._on_status(message)
+
+    # -- stages --
+
+    def package_root_files(self, root: FolderManifest) -> FolderManifest | None:
+        """Move loose files at the root into a timestamped package folder.
+
+        Returns the manifest of the new package folder, built from the root
+        manifest so the package does not have to be listed again.
+        """
+        if not root.files:
+            return None
+        ts = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+        pkg_name = f"{ROOT_PACKAGE_PREFIX}{ts}"
+        pkg_path = os.path.join(root.path, pkg_name)
+        os.makedirs(pkg_path, exist_ok=True)
+        for f in root.files:
+            shutil.move(os.path.join(root.path, f.name), os.path.join(pkg_path, f.name))
+        log_debug(f"Moved {root.nfiles} root file(s) into {pkg_name}")
+        return FolderManifest(path=pkg_path, relpath=pkg_name, files=list(root.files))
+
+    def _virtual_yaml_dir(self, pkg_name: str) -> str:
+        key = remote_dir_key(self.target.dest, pkg_name)
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+        return os.path.join(get_user_config_dir(), VIRTUAL_YAML_DIRNAME, digest)
+
+    def _virtual_package_name(self, root: FolderManifest) -> str:
+        """The virtual package name of the drive root ``root``, chosen once and then reused.
+
+        Deriving it afresh would rename the package, and upload everything
+        again under the new name, whenever an older file is added to the
+        root or the oldest one removed. The name is kept per destination and
+        volume (path and device) together with the loose files seen under
+        it; another drive mounted at the same letter later shares none of
+        those files and gets a package of its own.
+        """
+        try:
+            dev = os.stat(root.path).st_dev
+        except OSError:
+            dev = 0
+        key = f"{self.target.dest}\n{os.path.normcase(os.path.abspath(root.path))}\n{dev}"
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+        path = os.path.join(get_user_config_dir(), VIRTUAL_YAML_DIRNAME, f"{digest}.json")
+        # Name, size and modtime: card file names such as DJI_0001.JPG recur across drives.
+        files = {(f.name, f.size, f.mtime) for f in root.files}
+        try:
+            with open(path, encoding="utf-8") as f:
+                saved = json.load(f)
+            name, seen = saved["name"], {tuple(entry) for entry in saved["files"]}
+        except (OSError, ValueError, KeyError, TypeError):
+            name, seen = None, set()
+        if not name or not files & seen:
+            oldest = min(f.mtime for f in root.files)
+            name = ROOT_PACKAGE_PREFIX + datetime.datetime.fromtimestamp(oldest).strftime("%Y%m%d%H%M%S")
+            seen = set()
+        if files <= seen:
+            return name
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump({"name": name, "files": sorted(seen | files)}, f)
+            os.replace(path + ".tmp", path)
+        except OSError as e:
+            log_debug(f"Could not save the virtual package name of {root.path}: {e}")
+        return name
+
+    def virtual_root_package(self, root: FolderManifest) -> FolderManifest | None:
+        """Map loose files at the root to a package folder that exists only remotely.
+
+        Nothing on the drive is touched: the files are copied from the root to
+        the package's remote folder, and the package YAML is kept under the
+        config dir. The name comes from the oldest loose file the first time
+        and is then kept for the drive root (see ``_virtual_package_name``).
+        """
+        if not root.files:
+            return None
+        pkg_name = self._virtual_package_name(root)
+        yaml_dir = self._virtual_yaml_dir(pkg_name)
+        return FolderManifest(
+            path=root.path,
+            relpath=pkg_name,
+            files=list(root.files),
+            has_yaml=os.path.isfile(os.path.join(yaml_dir, YAML_FILENAME)),
+            yaml_dir=yaml_dir,
+        )
+
+    def write_folder_yaml(
+        self,
+        manifest: FolderManifest,
+        meta: UploadMetadata,
+        now_iso: str,
+        nfiles: int | None = None,
+        summarizer: FolderSummarizer | None = None,
+    ) -> bool:
+        """Write fielduploads.seabee.yaml for one folder if its file count changed.
+
+        ``nfiles`` is the number of objects the folder is uploaded as, if that
+        differs from its file count (small files in bundles). With a
+        ``summarizer``, the folder's capture times, GPS footprint, cameras
+        and total bytes are added (see app.exif), and a YAML written without
+        them is written again. Returns True if the YAML file was written.
+        """
+        if nfiles is None:
+            nfiles = manifest.nfiles
+        if nfiles == 0:
+            return False
+        if manifest.has_yaml and manifest.yaml_nfiles == nfiles:
+            return False
+
+        yaml_path = manifest.yaml_path
+        if manifest.has_yaml:
+            existing = safe_load_yaml(yaml_path)
+            if existing.get("nfiles") == nfiles and (summarizer is None or "total_bytes" in existing):
+                manifest.yaml_nfiles = nfiles
+                return False
+
+        folder_meta = meta.as_dict()
+        folder_meta["nfiles"] = nfiles
+        folder_meta["lastupdated"] = now_iso
+        if summarizer is not None:
+            folder_meta.update(summarizer.summary(manifest.path, manifest.files))
+
+        if manifest.is_virtual:
+            os.makedirs(manifest.yaml_dir, exist_ok=True)
+        with open(yaml_path, "w", encoding="utf-8") as yf:
+            yf.write(dump_yaml(folder_meta))
+        if not manifest.has_yaml:
+            manifest.has_yaml = True
+            if not manifest.is_virtual:
+                # Creating the file moved the directory mtime.
+                manifest.refresh_dir_stat()
+        manifest.yaml_nfiles = nfiles
+        return True
+
+    def _open_scan_cache(self) -> ScanCache | None:
+        if not self.use_scan_cache:
+            return None
+        try:
+            return ScanCache()
+        except Exception as e:
+            log_debug(f"Scan cache unavailable, scanning everything: {e}")
+            return None
+
+    def _open_ledger(self) -> UploadLedger | None:
+        if not self.use_ledger:
+            return None
+        try:
+            return UploadLedger()
+        except Exception as e:
+            log_debug(f"Upload ledger unavailable, rclone will compare everything: {e}")
+            return None
+
+    def _open_bundler(self) -> Bundler | None:
+        if self.bundle_below is None:
+            return None
+        return Bundler(staging_root(self.target.dest), self.bundle_below)
+
+    def _open_compressor(self) -> Compressor | None:
+        if not self.compress:
+            return None
+        dest = self.target.dest
+        return Compressor.from_options(staging_root(dest), dest, self.options, self.bandwidth)
+
+    def _staged_files(
+        self,
+        manifest: FolderManifest,
+        ledger: UploadLedger | None,
+        bundler: Bundler | None,
+        compressor: Compressor | None,
+        allow_new: bool = True,
+    ) -> list[FileEntry]:
+        """``manifest``'s files as uploaded: small ones bundled, compressible ones compressed.
+
+        The ledger spares rebuilding staged files that are already uploaded.
+        ``allow_new=False`` only keeps files compressed on earlier runs compressed.
+        """
+        dest = self.target.dest
+
+        def recorded(relpath: str, f: FileEntry) -> bool:
+            return ledger is not None and ledger.recorded(remote_dir_key(dest, relpath), f)
+
+        is_uploaded = recorded if ledger is not None else None
+        files = manifest.files
+        if bundler is not None:
+            with self.metrics.phase("bundle"):
+                files = bundler.files_for(manifest, is_uploaded)
+        if compressor is not None:
+            with self.metrics.phase("compress"):
+                files = compressor.files_for(replace(manifest, files=files), is_uploaded, allow_new)
+        return files
+
+    def _open_summarizer(self) -> FolderSummarizer | None:
+        return FolderSummarizer() if self.folder_summary else None
+
+    def _open_hasher(self) -> Hasher:
+        try:
+            cache = HashCache()
+        except Exception as e:
+            log_debug(f"Hash cache unavailable, hashing without it: {e}")
+            cache = None
+        return Hasher(cache)
+
+    def prepare_folders(
+        self,
+        folder: str,
+        meta: UploadMetadata,
+        plan: TransferPlan,
+        ledger: UploadLedger | None = None,
+        bundler: Bundler | None = None,
+        compressor: Compressor | None = None,
+        folders: Collection[str] | None = None,
+    ) -> None:
+        """Scan ``folder`` once, packaging root files, writing YAML and filling ``plan``.
+
+        With a ``ledger``, files already recorded as uploaded are left out of
+        the plan; with checksums enabled, the rest are hashed first so that
+        files whose only change is their modtime are left out too. With a
+        ``bundler``, each folder's small files are planned as bundles; with a
+        ``compressor``, compressible files as compressed copies. With dedup
+        on, files whose content is already on the remote are planned as
+        server-side copies. With ``folders``, only those top-level folders
+        are scanned and root files are left alone (see app.watch).
+        """
+        now_iso = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        nfolders = written = 0
+
+        metrics = self.metrics
+        hasher = self._open_hasher() if ledger is not None and self.checksum else None
+        self._status("Scanning folders and computing checksums…" if hasher else "Scanning folders…")
+        cache = self._open_scan_cache()
+        summarizer = self._open_summarizer()
+        try:
+            for scanned in scan_tree(folder, cache, folders):
+                manifest = scanned
+                metrics.count("folders_scanned")
+                metrics.count("files_scanned", manifest.nfiles)
+                if manifest.cached:
+                    metrics.count("folders_cached")
+                # The cache lookup stats the folder; a listing stats it and every file.
+                metrics.count(
+                    "stat_calls",
+                    (cache is not None) + (0 if manifest.cached else manifest.nfiles + 1),
+                )
+                if manifest.is_root:
+                    with metrics.phase("package"):
+                        if self.virtual_root:
+                            pkg = self.virtual_root_package(manifest)
+                        else:
+                            pkg = self.package_root_files(manifest)
+                    if (pkg is None or pkg.is_virtual) and cache is not None:
+                        # The root folder itself is unchanged.
+                        cache.store(manifest)
+                    if pkg is None:
+                        continue
+                    manifest = pkg
+                if manifest.nfiles > 0:
+                    nfolders += 1
+                    files = manifest.files
+                    if bundler is not None or compressor is not None:
+                        files = self._staged_files(manifest, ledger, bundler, compressor)
+                    with metrics.phase("write_yaml"):
+                        if self.write_folder_yaml(manifest, meta, now_iso, len(files), summarizer):
+                            written += 1
+                    if files is not manifest.files:
+                        manifest = replace(manifest, files=files)
+                    if ledger is not None:
+                        self._check_cancelled()
+                        with metrics.phase("checksum"):
+                            delta = ledger.filter_folder(
+                                self.target.dest,
+                                manifest,
+                                hasher.md5s if hasher is not None else None,
+                                MIN_DEDUP_BYTES if self.dedup else None,
+                            )
+                        plan.nskipped += manifest.nfiles - delta.nfiles
+                        manifest = delta
+                    plan.add_folder(manifest)
+                # The listing as scanned, not the delta or the bundled form.
+                if cache is not None and not scanned.is_root:
+                    cache.store(scanned)
+        finally:
+            if cache is not None:
+                cache.close()
+            if summarizer is not None:
+                metrics.count("image_headers_read", summarizer.read)
+                summarizer.close()
+            if hasher is not None:
+                metrics.count("files_hashed", hasher.hashed)
+                hasher.close()
+
+        metrics.count("yaml_written", written)
+        metrics.count("files_skipped", plan.nskipped)
+        if bundler is not None:
+            metrics.count("files_bundled", bundler.bundled_files)
+            metrics.count("bundles_built", bundler.built)
+            log_debug(
+                f"Bundles: {bundler.bundled_files} small file(s) in bundles, "
+                f"{bundler.built} bundle(s) built"
+            )
+        if compressor is not None:
+            metrics.count("files_compressed", compressor.compressed)
+            metrics.count("compress_bytes_saved", compressor.bytes_in - compressor.bytes_out)
+            log_debug(f"Compression: {compressor.summary()}")
+
+        log_debug(
+            f"Scan: {nfolders} folder(s), {written} YAML file(s) written; "
+            f"{plan.nfiles} file(s) / {plan.nbytes} bytes to upload, "
+            f"{plan.ncopies} file(s) / {plan.copy_bytes} bytes to copy on the remote, "
+            f"{plan.nskipped} already uploaded"
+        )
+
+    # -- rclone --
+
+    def list_remote(self, dest: str) -> Iterator[tuple[str, int]]:
+        """Stream ``(relpath, size)`` for every object under ``dest``."""
+        command = [
+            self.rclone_exe, "lsf", dest,
+            "--config", self.rclone_conf,
+            "--recursive", "--files-only",
+            "--format", "sp", "--separator", "\t",
+        ]
+        log_debug("rclone: " + format_command_for_display(command))
+        process = subprocess.Popen(
+            command,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            encoding="utf-8",
+        )
+        assert process.stdout is not None
+        for line in process.stdout:
+            size, sep, relpath = line.rstrip("\n").partition("\t")
+            if sep and size.isdigit():
+                yield relpath, int(size)
+        _, err = process.communicate()
+        if process.returncode:
+            raise RuntimeError(f"rclone lsf failed with exit code {process.returncode}: {err.strip()}")
+
+    def list_remote_json(
+        self,
+        dest: str,
+        filter_from: str | None = None,
+        with_hashes: bool = False,
+    ) -> Iterator[tuple[str, int, str | None]]:
+        """Stream ``(relpath, size, md5)`` for objects under ``dest`` via ``rclone lsjson``."""
+        command = [
+            self.rclone_exe, "lsjson", dest,
+            "--config", self.rclone_conf,
+            "--recursive", "--files-only",
+            "--no-mimetype", "--no-modtime",
+        ]
+        if filter_from:
+            command += ["--filter-from", filter_from]
+        if with_hashes:
+            command += ["--hash", "--hash-type", "MD5"]
+        log_debug("rclone: " + format_command_for_display(command))
+        process = subprocess.Popen(
+            command,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            encoding="utf-8",
+        )
+        assert process.stdout is not None
+        yield from parse_lsjson(process.stdout)
+        _, err = process.communicate()
+        if process.returncode:
+            raise RuntimeError(f"rclone lsjson failed with exit code {process.returncode}: {err.strip()}")
+
+    def run_rclone_with_progress(
+        self,
+        source: str,
+        dest: str,
+        files_from: str,
+        no_traverse: bool = False,
+        on_file_done: Callable[[str], None] | None = None,
+        settings: TransferSettings | None = None,
+        metadata_mapper: list[str] | None = None,
+    ) -> None:
+        """Copy the files listed in ``files_from`` (relative to ``source``) to ``dest``.
+
+        rclone does not walk ``source``; with ``no_traverse`` it does not list
+        ``dest`` either and checks each listed file individually instead.
+        ``on_file_done`` is called with the relative path of every file rclone
+        reports as copied. ``metadata_mapper`` is a program rclone runs to set
+        each object's metadata.
+        """
+        command = [
+            self.rclone_exe, "copy", source, dest,
+            "--config", self.rclone_conf,
+            "--files-from-raw", files_from,
+            "--use-json-log",
+            "--stats", "1s",
+            "--stats-log-level", "NOTICE",
+        ]
+        if no_traverse:
+            command.append("--no-traverse")
+        if on_file_done:
+            command.append("-v")
+        if settings is not None:
+            command += settings.rclone_args()
+        if self.bandwidth is not None:
+            command += ["--bwlimit", self.bandwidth.rclone_timetable()]
+        if self.checksum:
+            command.append("--checksum")
+        if metadata_mapper:
+            command += ["--metadata", "--metadata-mapper", _space_sep_list(metadata_mapper)]
+
+        print(
+            "\n[SeaBee] rclone: " + format_command_for_display(command) + "\n",
+            flush=True,
+        )
+
+        self._check_cancelled()
+        process = subprocess.Popen(
+            command,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            encoding="utf-8",
+            errors="replace",
+        )
+        self._process = process
+
+        debug = bool(os.environ.get("SEABEE_RCLONE_DEBUG"))
+        assert process.stdout is not None
+        for line in process.stdout:
+            if debug:
+                log(line.rstrip(), DEBUG)
+            if "Attempt " in line and "failed with" in line:
+                self.metrics.count("rclone_retries")
+            # Cheap substring checks first: most lines are neither stats nor
+            # per-file completions and are never JSON-decoded.
+            if '"stats"' in line:
+                try:
+                    stats = json.loads(line).get("stats")
+                except ValueError:
+                    continue
+                if isinstance(stats, dict):
+                    self._emit_progress(Progress.from_rclone_stats(stats))
+            elif on_file_done and "Copied (" in line:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if entry.get("object"):
+                    on_file_done(entry["object"])
+
+        process.wait()
+        self._process = None
+        self._check_cancelled()
+        if process.returncode and process.returncode != 0:
+            raise RuntimeError(f"rclone failed with exit code {process.returncode}")
+
+    # -- rcd --
+
+    def _report_stats(self, stats: dict) -> None:
+        self._emit_progress(Progress.from_rclone_stats(stats))
+
+    def _copy_single_yaml(self, source_dir: str, remote_dir: str) -> None:
+        """Copy one folder's YAML, e.g. a virtual package's from the config dir."""
+        if self.daemon is not None:
+            self.daemon.copy_file(source_dir, YAML_FILENAME, remote_dir + "/", YAML_FILENAME)
+            return
+        fd, list_path = tempfile.mkstemp(prefix="seabee-yaml-", suffix=".lst")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(YAML_FILENAME + "\n")
+            self.copy_files(source_dir, remote_dir + "/", list_path, no_traverse=True)
+        finally:
+            os.unlink(list_path)
+
+    def _copy_list_via_daemon(self, source: str, dest: str, files_from: str) -> None:
+        assert self.daemon is not None
+        with open(files_from, encoding="utf-8") as f:
+            for line in f:
+                self._check_cancelled()
+                rel = line.rstrip("\n")
+                if rel:
+                    self.daemon.copy_file(source, rel, dest, rel)
+
+    # -- transfer --
+
+    def copy_files(
+        self,
+        source: str,
+        dest: str,
+        files_from: str,
+        no_traverse: bool = False,
+        on_file_done: Callable[[str], None] | None = None,
+        settings: TransferSettings | None = None,
+        metadata_mapper: list[str] | None = None,
+    ) -> None:
+        """Copy a transfer list with whichever rclone backend is configured."""
+        self._last_progress = None
+        self.metrics.count("rclone_calls")
+        try:
+            self._copy_files(source, dest, files_from, no_traverse, on_file_done, settings, metadata_mapper)
+        finally:
+            p = self._last_progress
+            if p is not None:
+                self.metrics.count("files_uploaded", p.transfers)
+                self.metrics.count("bytes_uploaded", p.bytes)
+                self.metrics.count("rclone_errors", p.errors)
+
+    def _copy_files(
+        self,
+        source: str,
+        dest: str,
+        files_from: str,
+        no_traverse: bool,
+        on_file_done: Callable[[str], None] | None,
+        settings: TransferSettings | None,
+        metadata_mapper: list[str] | None,
+    ) -> None:
+        if self.daemon is None:
+            self.run_rclone_with_progress(
+                source, dest, files_from, no_traverse, on_file_done, settings, metadata_mapper,
+            )
+            return
+        self._check_cancelled()
+        config = {"CheckSum": True} if self.checksum else {}
+        if settings is not None:
+            config.update(settings.rc_config())
+            dest = settings.remote_with_options(dest)
+        if metadata_mapper:
+            config.update({"Metadata": True, "MetadataMapper": metadata_mapper})
+        jobid = self.daemon.start_copy(source, dest, files_from, no_traverse, config)
+        log_debug(f"{self.daemon.backend} job {jobid}: copy {source} -> {dest}")
+        self.daemon.wait_job(
+            jobid,
+            on_stats=self._report_stats,
+            on_file_done=on_file_done,
+            should_stop=self._cancel.is_set,
+        )
+
+    def _acquire_budget(self, nbytes: int) -> None:
+        """Wait for room under the shared bytes-in-flight cap, if there is one."""
+        if self.budget is None:
+            return
+        budget = self.budget
+        waiting = (
+            budget.max_bytes is not None
+            and budget.in_flight > 0
+            and budget.in_flight + nbytes > budget.max_bytes
+        )
+        if waiting:
+            self._status("Waiting for other uploads to make room…")
+        if not budget.acquire(nbytes, should_stop=self._cancel.is_set):
+            raise UploadCancelled("Upload cancelled")
+        if waiting:
+            self._status("Uploading all files via rclone…")
+
+    def upload_batches(
+        self,
+        source: str,
+        dest: str,
+        plan: TransferPlan,
+        ledger: UploadLedger | None = None,
+    ) -> None:
+        """Copy the plan's data list in batches, re-tuning rclone between them.
+
+        With a ``ledger``, each finished batch is recorded before the next one
+        starts, so a failure loses at most the batch in flight. Unless the
+        upload order is ``mixed``, batches go folder by folder in priority
+        order, and each folder gets its completion marker once its last
+        batch is done.
+        """
+        tuner = AutoTuner(plan.histogram, parse_overrides(self.options), autotune_enabled(self.options))
+        no_traverse = ledger is not None and plan.nfiles <= _NO_TRAVERSE_MAX_FILES
+        folders = None
+        if self.upload_order != "mixed":
+            folders = order_folders(plan.folders, self.upload_order, self.upload_first)
+            log_debug(
+                f"Upload order: {self.upload_order}"
+                + (f", first {', '.join(self.upload_first)}" if self.upload_first else "")
+                + f" ({len(folders)} folder(s))"
+            )
+        works = {w.relpath: w for w in plan.folders}
+        done_bytes = done_files = 0
+        try:
+            for batch in plan.batches(batch_bytes_for(plan.nbytes), folders):
+                self._check_cancelled()
+                self._acquire_budget(batch.nbytes)
+                self._progress_base = (done_bytes, done_files, plan.nbytes, plan.nfiles)
+                started = time.monotonic()
+                on_file_done = None
+                if ledger is not None:
+                    on_file_done = functools.partial(ledger.mark_done, prefix=batch.remote_prefix)
+                try:
+                    self.copy_files(
+                        batch.source or source,
+                        remote_dir_key(dest, batch.remote_prefix) + "/" if batch.remote_prefix else dest,
+                        batch.list_path,
+                        no_traverse=no_traverse,
+                        on_file_done=on_file_done,
+                        settings=tuner.current,
+                        metadata_mapper=self._metadata_mapper if batch.compressed else None,
+                    )
+                except Exception:
+                    if ledger is not None:
+                        n = ledger.commit_pending(all_done=False)
+                        log_debug(f"Ledger: recorded {n} file(s) copied before the failure")
+                    raise
+                finally:
+                    if self.budget is not None:
+                        self.budget.release(batch.nbytes)
+                if ledger is not None:
+                    ledger.mark_list_done(batch.list_path, batch.remote_prefix)
+                    ledger.commit_pending(all_done=False)
+                errors = self._last_progress.errors if self._last_progress else 0
+                tuner.record(batch.nbytes, time.monotonic() - started, batch.nfiles, errors)
+                done_bytes += batch.nbytes
+                done_files += batch.nfiles
+                if batch.completes:
+                    self._progress_base = (done_bytes, done_files, plan.nbytes, plan.nfiles)
+                    self.mark_folders_complete(dest, [works[relpath] for relpath in batch.completes])
+        finally:
+            self._progress_base = None
+
+    def mark_folders_complete(self, dest: str, works: list[FolderWork]) -> None:
+        """Write the completion marker of each folder in ``works`` to the remote (see app.schedule)."""
+        works = [w for w in works if w.relpath]
+        if not works:
+            return
+        marker_dir = tempfile.mkdtemp(prefix="seabee-complete-")
+        fd, list_path = tempfile.mkstemp(prefix="seabee-complete-", suffix=".lst")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8", newline="\n") as lst:
+                for w in works:
+                    folder = os.path.join(marker_dir, *w.relpath.split("/"))
+                    os.makedirs(folder, exist_ok=True)
+                    with open(os.path.join(folder, COMPLETE_FILENAME), "w", encoding="utf-8", newline="\n") as f:
+                        f.write(completion_marker(w))
+                    lst.write(f"{w.relpath}/{COMPLETE_FILENAME}\n")
+            if self.daemon is not None:
+                self._copy_list_via_daemon(marker_dir, dest, list_path)
+            else:
+                self.copy_files(marker_dir, dest, list_path, no_traverse=True)
+        finally:
+            os.unlink(list_path)
+            shutil.rmtree(marker_dir, ignore_errors=True)
+        for w in works:
+            self.metrics.folder_completed()
+            log_debug(f"Folder complete: {w.relpath} ({w.nfiles} file(s) uploaded, {w.ncopies} copied on the remote)")
+
+    def copy_duplicates(self, source: str, dest: str, plan: TransferPlan, ledger: UploadLedger) -> None:
+        """Copy the plan's duplicate files on the remote from objects with the same content.
+
+        Copies that fail are uploaded from ``source`` instead, and their
+        sources are dropped from the ledger.
+        """
+        self._status(f"Copying {plan.ncopies} duplicate file(s) on the remote…")
+        failed: list[Copy] = []
+        copied = saved = 0
+        for group in copy_groups(plan.copies()):
+            self._check_cancelled()
+            done = self._server_side_copy(dest, group)
+            for c in group:
+                if c.relpath.rpartition("/")[2] in done:
+                    ledger.mark_done(c.relpath, c.remote_prefix)
+                    copied += 1
+                    saved += c.size
+                else:
+                    failed.append(c)
+            ledger.commit_pending(all_done=False)
+        self.metrics.count("files_deduplicated", copied)
+        self.metrics.count("dedup_bytes_saved", saved)
+        log_debug(f"Dedup: {copied} file(s) copied on the remote, {format_bytes(saved)} not uploaded")
+        if not failed:
+            return
+
+        log_debug(f"Dedup: uploading {len(failed)} file(s) whose server-side copy failed")
+        for c in failed:
+            src_dir, src_name = split_remote_path(c.source)
+            ledger.forget(src_dir, [src_name])
+        by_prefix: dict[str, list[str]] = {}
+        for c in failed:
+            by_prefix.setdefault(c.remote_prefix, []).append(c.relpath)
+        for prefix, relpaths in by_prefix.items():
+            fd, list_path = tempfile.mkstemp(prefix="seabee-dedup-", suffix=".lst")
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    f.writelines(r + "\n" for r in relpaths)
+                self.copy_files(
+                    source,
+                    remote_dir_key(dest, prefix) + "/" if prefix else dest,
+                    list_path,
+                    no_traverse=True,
+                    on_file_done=functools.partial(ledger.mark_done, prefix=prefix),
+                )
+                ledger.mark_list_done(list_path, prefix)
+            finally:
+                ledger.commit_pending(all_done=False)
+                os.unlink(list_path)
+
+    def _server_side_copy(self, dest: str, group: list[Copy]) -> set[str]:
+        """Copy one group (same source and destination folder); returns the names copied.
+
+        Files keeping their name go in one ``rclone copy`` between the two
+        remote folders; renamed ones need an ``rclone copyto`` each.
+        """
+        src_dir = split_remote_path(group[0].source)[0]
+        relfolder = group[0].relpath.rpartition("/")[0]
+        dst_dir = remote_dir_key(dest, "/".join(p for p in (group[0].remote_prefix, relfolder) if p))
+        done: set[str] = set()
+        same_name = []
+        for c in group:
+            src_name = split_remote_path(c.source)[1]
+            name = c.relpath.rpartition("/")[2]
+            if self.daemon is None and src_name == name:
+                same_name.append(name)
+                continue
+            try:
+                if self.daemon is not None:
+                    self.daemon.copy_file(src_dir, src_name, dst_dir, name)
+                else:
+                    self.metrics.count("rclone_calls")
+                    command = [self.rclone_exe, "copyto", c.source, f"{dst_dir}/{name}", "--config", self.rclone_conf]
+                    log_debug("rclone: " + format_command_for_display(command))
+                    proc = subprocess.run(command, capture_output=True, text=True, encoding="utf-8", errors="replace")
+                    if proc.returncode:
+                        raise RuntimeError(proc.stderr.strip() or f"exit code {proc.returncode}")
+            except (RuntimeError, OSError) as e:
+                log_debug(f"Server-side copy of {c.source} failed: {e}")
+                continue
+            done.add(name)
+        if same_name:
+            fd, list_path = tempfile.mkstemp(prefix="seabee-dedup-", suffix=".lst")
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    f.writelines(n + "\n" for n in same_name)
+                self.metrics.count("rclone_calls")
+                self.run_rclone_with_progress(src_dir, dst_dir + "/", list_path, no_traverse=True, on_file_done=done.add)
+                # rclone only logs "Copied" for files it transferred; one already
+                # there with the same content is skipped silently but is in place.
+                done.update(same_name)
+            except RuntimeError as e:
+                self._check_cancelled()
+                log_debug(f"Server-side copy from {src_dir} failed: {e}")
+            finally:
+                os.unlink(list_path)
+        return done
+
+    def delete_remote_files(self, remote_dir: str, names: list[str]) -> None:
+        """Delete ``names`` in ``remote_dir`` from the remote."""
+        if self.daemon is not None:
+            for name in names:
+                self._check_cancelled()
+                self.daemon.delete_file(remote_dir + "/", name)
+            return
+        fd, list_path = tempfile.mkstemp(prefix="seabee-delete-", suffix=".lst")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.writelines(n + "\n" for n in names)
+            self.metrics.count("rclone_calls")
+            command = [
+                self.rclone_exe, "delete", remote_dir + "/", "--config", self.rclone_conf,
+                "--files-from-raw", list_path, "--no-traverse",
+            ]
+            log_debug("rclone: " + format_command_for_display(command))
+            proc = subprocess.run(command, capture_output=True, text=True, encoding="utf-8", errors="replace")
+            if proc.returncode:
+                raise RuntimeError(proc.stderr.strip() or f"exit code {proc.returncode}")
+        finally:
+            os.unlink(list_path)
+
+    def delete_superseded_bundles(self, dest: str, bundler: Bundler, ledger: UploadLedger) -> None:
+        """Delete bundles replaced by this run's from the remote and the ledger (see app.bundle)."""
+        deleted = 0
+        for relpath in list(bundler.small_entries):
+            remote_dir = remote_dir_key(dest, relpath)
+            recorded = ledger.names_starting(remote_dir, BUNDLE_PREFIX)
+            stale = bundler.superseded(relpath, recorded, lambda _, f: ledger.recorded(remote_dir, f))
+            if not stale:
+                continue
+            try:
+                self.delete_remote_files(remote_dir, stale)
+            except (RuntimeError, OSError) as e:
+                self._check_cancelled()
+                log_debug(f"Could not delete superseded bundles in {remote_dir}: {e}")
+                continue
+            ledger.forget(dest, [f"{relpath}/{name}" for name in stale])
+            deleted += len(stale)
+        if deleted:
+            log_debug(f"Bundles: {deleted} superseded bundle object(s) deleted from the remote")
+
+    # -- pipeline --
+
+    def verify_upload(self, folder: str, folders: Collection[str] | None = None) -> VerificationReport:
+        """Compare ``folder`` with what is under the target prefix, folder by folder.
+
+        Only the local top-level folders (or just ``folders``) are listed
+        remotely. The report is also written to configs/verify_report.json.
+        """
+        with self.metrics.phase("verify"):
+            return self._verify_upload(folder, folders)
+
+    def _verify_upload(self, folder: str, folders: Collection[str] | None) -> VerificationReport:
+        dest = self.target.dest
+        self._status("Verifying upload against the remote…")
+        started = time.monotonic()
+        verifier = Verifier(dest, folder)
+        ledger = self._open_ledger()
+        bundler = self._open_bundler()
+        compressor = self._open_compressor()
+        cache = self._open_scan_cache()
+        fd, filter_path = tempfile.mkstemp(prefix="seabee-verify-", suffix=".txt")
+        os.close(fd)
+        try:
+            for scanned in scan_tree(folder, cache, folders):
+                self._check_cancelled()
+                manifest = scanned
+                if manifest.is_root and self.virtual_root and manifest.files:
+                    manifest = self.virtual_root_package(manifest)
+                if manifest.has_yaml and manifest.yaml_nfiles is None:
+                    nfiles = safe_load_yaml(manifest.yaml_path).get("nfiles")
+                    manifest.yaml_nfiles = nfiles if isinstance(nfiles, int) else None
+                if (bundler is not None or compressor is not None) and manifest.nfiles > 0:
+                    files = self._staged_files(manifest, ledger, bundler, compressor, allow_new=False)
+                    if files is not manifest.files:
+                        manifest = replace(manifest, files=files)
+                md5s = {}
+                if ledger is not None and not manifest.is_root:
+                    records = ledger.uploaded_in(remote_dir_key(dest, manifest.relpath))
+                    md5s = {
+                        f.name: rec[2]
+                        for f in manifest.files
+                        if (rec := records.get(f.name)) and rec[2] and rec[:2] == (f.size, f.mtime)
+                    }
+                verifier.add_local(manifest, md5s)
+                if cache is not None:
+                    cache.store(scanned)
+            if cache is not None:
+                cache.close()
+                cache = None
+
+            write_filter_file(filter_path, verifier.top_folders)
+            if verifier.top_folders:
+                with_hashes = self.checksum and ledger is not None
+                verifier.add_remote(self.list_remote_json(dest, filter_path, with_hashes))
+            report = verifier.report(time.monotonic() - started)
+            report.gaps = list(verifier.gaps())
+        finally:
+            os.unlink(filter_path)
+            verifier.close()
+            if cache is not None:
+                cache.close()
+            if ledger is not None:
+                ledger.close()
+
+        path = report.write_json()
+        log_debug(f"Verify: {report.summary()} in {report.seconds:.1f}s (report: {path})")
+        return report
+
+    def repair_upload(
+        self,
+        folder: str,
+        meta: UploadMetadata,
+        report: VerificationReport,
+        folders: Collection[str] | None = None,
+    ) -> VerificationReport:
+        """Re-upload only the gaps ``report`` found, then verify again."""
+        self._status(f"Re-uploading {len(report.gaps)} missing or mismatched file(s)…")
+        self._repair_gaps(folder, report.gaps)
+        self._upload(folder, meta, folders)
+        return self.verify_upload(folder, folders)
+
+    def _repair_gaps(self, folder: str, gaps: list[str]) -> None:
+        """Make the next upload pass pick up ``gaps``.
+
+        Data files are dropped from the ledger, so the delta includes them
+        again. YAML files are not in the ledger and are copied right away,
+        a virtual package's from the config dir.
+        """
+        yaml_gaps = []
+        for gap in gaps:
+            relfolder, _, name = gap.rpartition("/")
+            if name != YAML_FILENAME:
+                continue
+            yaml_dir = self._virtual_yaml_dir(relfolder)
+            if not os.path.exists(os.path.join(folder, gap)) and os.path.isfile(os.path.join(yaml_dir, name)):
+                self._copy_single_yaml(yaml_dir, remote_dir_key(self.target.dest, relfolder))
+            else:
+                yaml_gaps.append(gap)
+        if yaml_gaps:
+            fd, list_path = tempfile.mkstemp(prefix="seabee-repair-", suffix=".lst")
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    f.writelines(g + "\n" for g in yaml_gaps)
+                self.copy_files(folder, self.target.dest, list_path, no_traverse=True)
+            finally:
+                os.unlink(list_path)
+        ledger = self._open_ledger()
+        if ledger is None:
+            return
+        try:
+            n = ledger.forget(self.target.dest, gaps)
+            log_debug(f"Ledger: forgot {n} record(s) to re-upload")
+        finally:
+            ledger.close()
+
+    def upload_folder(self, folder: str, meta: UploadMetadata, folders: Collection[str] | None = None) -> None:
+        """Upload ``folder``, then verify it against the remote if enabled.
+
+        With ``folders``, only those top-level folders of ``folder`` are
+        uploaded (watch mode, see app.watch). With repair enabled, missing or
+        mismatched files are re-uploaded once (and verified again) instead of
+        copying everything a second time. Raises RuntimeError if verification
+        still finds gaps. Phase times and counters are saved as a run record
+        (see app.metrics) either way.
+        """
+        self.metrics = self._new_metrics(folder)
+        error: Exception | None = None
+        try:
+            self._upload(folder, meta, folders)
+            if not self.verify:
+                return
+            report = self.verify_upload(folder, folders)
+            if not report.ok and self.repair and report.gaps:
+                report = self.repair_upload(folder, meta, report, folders)
+            if not report.ok:
+                self._status(f"⚠️ Verification: {report.summary()}")
+                raise RuntimeError(f"Verification failed: {report.summary()}")
+            self._status(f"✅ Upload complete and verified ({report.summary()}).")
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self.metrics.finish(error)
+            self.metrics.save(metrics_textfile(self.options))
+
+    def _upload(self, folder: str, meta: UploadMetadata, folders: Collection[str] | None = None) -> None:
+        """Run the upload itself: package root files, write YAML, copy via rclone.
+
+        YAML files go first, as a small no-listing copy, so every folder's
+        metadata lands before its bulk data; the bulk copy then lists the
+        remote prefix once. rclone cannot order a single copy by an external
+        list, so this is the cheapest way to keep the guarantee.
+        """
+        dest = self.target.dest
+        ledger = self._open_ledger()
+        bundler = self._open_bundler()
+        compressor = self._open_compressor()
+        plan = TransferPlan(folder)
+        if bundler is not None or compressor is not None:
+            plan.staged_root = staging_root(dest)
+        if compressor is not None:
+            self._metadata_mapper = metadata_mapper_command(plan.staged_root)
+        if self.bandwidth is not None:
+            log_debug(f"Bandwidth cap: {self.bandwidth.describe()} ({self.bandwidth.spec})")
+        # rcd has no per-job timetable: the daemon switches its global cap as slots change.
+        hold_bwlimit = self.daemon is not None and self.bandwidth is not None
+        if hold_bwlimit:
+            self.daemon.hold_bwlimit(self.bandwidth)
+        try:
+            if ledger is not None and self.reconcile:
+                self._status("Checking upload ledger against the remote…")
+                with self.metrics.phase("reconcile"):
+                    ledger.reconcile(dest, self.list_remote(dest))
+
+            with self.metrics.phase("scan"):
+                self.prepare_folders(folder, meta, plan, ledger, bundler, compressor, folders)
+                plan.finish()
+            self.metrics.count("files_planned", plan.nfiles)
+            self.metrics.count("bytes_planned", plan.nbytes)
+
+            if plan.nyaml or plan.virtual_yaml_dir:
+                self._status("Uploading YAML config files via rclone…")
+                with self.metrics.phase("upload_yaml"):
+                    if plan.virtual_yaml_dir:
+                        self._copy_single_yaml(plan.virtual_yaml_dir, remote_dir_key(dest, plan.virtual_prefix))
+                    if plan.nyaml and self.daemon is not None:
+                        self._copy_list_via_daemon(folder, dest, plan.yaml_list_path)
+                    elif plan.nyaml:
+                        self.copy_files(folder, dest, plan.yaml_list_path, no_traverse=True)
+
+            if plan.nfiles == 0 and plan.ncopies == 0:
+                if bundler is not None and ledger is not None:
+                    # A run stopped after uploading new bundles left the old ones.
+                    self.delete_superseded_bundles(dest, bundler, ledger)
+                self._status("✅ Nothing new to upload.")
+                return
+
+            if plan.nfiles:
+                self._status("Uploading all files via rclone…")
+                with self.metrics.phase("upload"):
+                    self.upload_batches(folder, dest, plan, ledger)
+            if plan.ncopies and ledger is not None:
+                # After the bulk upload: duplicates within this run copy from its objects.
+                with self.metrics.phase("dedup"):
+                    self.copy_duplicates(folder, dest, plan, ledger)
+                    if self.upload_order != "mixed":
+                        self.mark_folders_complete(dest, [w for w in plan.folders if w.ncopies])
+            if bundler is not None and ledger is not None:
+                self.delete_superseded_bundles(dest, bundler, ledger)
+            if ledger is not None and plan.nstaged:
+                # Recorded in the ledger, so later runs do not need the staged copies.
+                if bundler is not None:
+                    bundler.release(plan.staged_list_path)
+                if compressor is not None:
+                    compressor.release(plan.compressed_list_path)
+        finally:
+            self._metadata_mapper = None
+            if hold_bwlimit:
+                self.daemon.release_bwlimit()
+            plan.cleanup()
+            if ledger is not None:
+                ledger.close()
+
+        self._status("✅ Upload complete.")
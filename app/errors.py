@@ -0,0 +1,9 @@
+"""Exceptions shared by the engine, the queue and the upload backends.
+
+Kept free of imports so the backends (app.rcd, app.s3native) can raise them
+without depending on the engine.
+"""
+
+
+class UploadCancelled(RuntimeError):
+    """Raised when an upload stops because the user cancelled it."""
@@ -0,0 +1,341 @@
+"""Per-folder capture summary from EXIF/XMP headers, for fielduploads.seabee.yaml.
+
+Downstream processing plans its jobs from each flight folder's YAML. Without
+a summary it has to list and open every object to learn when and where a
+flight was captured. When a folder's YAML is written, its images' headers
+are read for:
+
+* ``capture_start`` / ``capture_end``: the range of ``DateTimeOriginal``
+  (with ``OffsetTimeOriginal`` when the camera records it)
+* ``gps_bbox``: the bounding box of the GPS positions
+* ``cameras``: the ``Make Model`` strings seen (the camera of a DJI drone,
+  e.g. ``DJI FC3582``)
+
+alongside ``total_bytes`` for the whole folder.
+
+Only the header is read: JPGs are memory-mapped and their marker segments
+walked up to the first non-APP segment, so just the pages holding the EXIF
+and XMP blocks are ever read from disk; TIFF/DNG files are read through their
+IFDs. Pixel data is never touched. XMP (``drone-dji:GpsLatitude`` and the
+like) fills in what EXIF lacks. Large folders are read in a process pool,
+as for hashing. ``FOLDER_SUMMARY=false`` in bucket.conf turns this off.
+"""
+
+import mmap
+import os
+import re
+import struct
+import time
+from typing import TYPE_CHECKING, NamedTuple
+
+from app.log import log_debug
+from app.scanner import FileEntry
+
+if TYPE_CHECKING:
+    from concurrent.futures import ProcessPoolExecutor
+
+JPEG_EXTENSIONS = (".jpg", ".jpeg")
+TIFF_EXTENSIONS = (".tif", ".tiff", ".dng")
+
+# Below this, starting worker processes costs more than it saves.
+_INLINE_MAX_FILES = 32
+
+_EXIF_ID = b"Exif\x00\x00"
+_XMP_ID = b"http://ns.adobe.com/xap/1.0/\x00"
+
+_TAG_MAKE = 0x010F
+_TAG_MODEL = 0x0110
+_TAG_DATETIME = 0x0132
+_TAG_XMP = 0x02BC
+_TAG_EXIF_IFD = 0x8769
+_TAG_GPS_IFD = 0x8825
+_TAG_DATETIME_ORIGINAL = 0x9003
+_TAG_OFFSET_TIME_ORIGINAL = 0x9011
+_TAG_GPS_LAT_REF = 1
+_TAG_GPS_LAT = 2
+_TAG_GPS_LON_REF = 3
+_TAG_GPS_LON = 4
+
+# TIFF field type -> size in bytes of one value.
+_TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 7: 1, 9: 4, 10: 8}
+# Guards against corrupt offsets sending the reader around in circles.
+_MAX_IFD_ENTRIES = 1024
+
+_EXIF_TIME_RE = re.compile(r"(\d{4})[:-](\d{2})[:-](\d{2})[ T](\d{2}):(\d{2}):(\d{2})")
+_OFFSET_RE = re.compile(r"[+-]\d{2}:\d{2}$")
+
+
+class ImageHeader(NamedTuple):
+    taken: tuple[str, str] | None  # (local ISO time, offset or "")
+    lat: float | None
+    lon: float | None
+    camera: str | None
+
+
+def folder_summary_enabled(options: dict[str, str]) -> bool:
+    """FOLDER_SUMMARY=false in bucket.conf leaves capture details out of the YAML."""
+    return options.get("folder_summary", "true").strip().lower() not in ("0", "false", "no", "off")
+
+
+# ---------------------------------------------------------------------------
+# Header parsing
+# ---------------------------------------------------------------------------
+
+def _iso_time(raw: str) -> str | None:
+    m = _EXIF_TIME_RE.match(raw.strip())
+    if m is None or m.group(1) == "0000":
+        return None
+    y, mo, d, h, mi, s = m.groups()
+    return f"{y}-{mo}-{d}T{h}:{mi}:{s}"
+
+
+class _Tiff:
+    """Reads tags from a TIFF structure (an EXIF block or a whole TIFF file)."""
+
+    def __init__(self, buf, base: int = 0):
+        self.buf = buf
+        self.base = base
+        order = bytes(buf[base:base + 2])
+        if order == b"II":
+            self.endian = "<"
+        elif order == b"MM":
+            self.endian = ">"
+        else:
+            raise ValueError("not a TIFF header")
+        self.ifd0 = self._unpack("I", base + 4)
+
+    def _unpack(self, fmt: str, pos: int):
+        return struct.unpack_from(self.endian + fmt, self.buf, pos)[0]
+
+    def ifd(self, offset: int) -> dict[int, tuple[int, int, int]]:
+        """Tag -> (type, count, position of the value) for the IFD at ``offset``."""
+        pos = self.base + offset
+        n = min(self._unpack("H", pos), _MAX_IFD_ENTRIES)
+        entries = {}
+        for i in range(n):
+            entry = pos + 2 + 12 * i
+            tag, typ, count = struct.unpack_from(self.endian + "HHI", self.buf, entry)
+            size = _TYPE_SIZES.get(typ)
+            if size is None:
+                continue
+            value_pos = entry + 8
+            if size * count > 4:
+                value_pos = self.base + self._unpack("I", entry + 8)
+            entries[tag] = (typ, count, value_pos)
+        return entries
+
+    def text(self, entries: dict, tag: int) -> str | None:
+        if tag not in entries:
+            return None
+        _, count, pos = entries[tag]
+        raw = bytes(self.buf[pos:pos + count]).split(b"\x00", 1)[0]
+        return raw.decode("utf-8", "replace").strip() or None
+
+    def long(self, entries: dict, tag: int) -> int | None:
+        if tag not in entries:
+            return None
+        typ, _, pos = entries[tag]
+        return self._unpack("H" if typ == 3 else "I", pos)
+
+    def rationals(self, entries: dict, tag: int) -> list[float] | None:
+        if tag not in entries or entries[tag][0] != 5:
+            return None
+        _, count, pos = entries[tag]
+        values = []
+        for i in range(count):
+            num, den = struct.unpack_from(self.endian + "II", self.buf, pos + 8 * i)
+            values.append(num / den if den else 0.0)
+        return values
+
+
+def _degrees(dms: list[float] | None, ref: str | None) -> float | None:
+    if not dms:
+        return None
+    value = dms[0] + (dms[1] if len(dms) > 1 else 0) / 60 + (dms[2] if len(dms) > 2 else 0) / 3600
+    return -value if ref in ("S", "W") else value
+
+
+def _parse_tiff(buf, base: int = 0) -> tuple[dict, str | None]:
+    """EXIF fields found in a TIFF structure, and its XMP packet if it has one."""
+    tiff = _Tiff(buf, base)
+    ifd0 = tiff.ifd(tiff.ifd0)
+    fields: dict = {}
+    make, model = tiff.text(ifd0, _TAG_MAKE), tiff.text(ifd0, _TAG_MODEL)
+    if model:
+        fields["camera"] = model if not make or model.startswith(make) else f"{make} {model}"
+
+    taken, offset = tiff.text(ifd0, _TAG_DATETIME), None
+    exif_offset = tiff.long(ifd0, _TAG_EXIF_IFD)
+    if exif_offset:
+        exif = tiff.ifd(exif_offset)
+        taken = tiff.text(exif, _TAG_DATETIME_ORIGINAL) or taken
+        offset = tiff.text(exif, _TAG_OFFSET_TIME_ORIGINAL)
+    if taken and (iso := _iso_time(taken)):
+        fields["taken"] = (iso, offset if offset and _OFFSET_RE.match(offset) else "")
+
+    gps_offset = tiff.long(ifd0, _TAG_GPS_IFD)
+    if gps_offset:
+        gps = tiff.ifd(gps_offset)
+        lat = _degrees(tiff.rationals(gps, _TAG_GPS_LAT), tiff.text(gps, _TAG_GPS_LAT_REF))
+        lon = _degrees(tiff.rationals(gps, _TAG_GPS_LON), tiff.text(gps, _TAG_GPS_LON_REF))
+        if lat is not None and lon is not None:
+            fields["lat"], fields["lon"] = lat, lon
+
+    xmp = None
+    if _TAG_XMP in ifd0:
+        _, count, pos = ifd0[_TAG_XMP]
+        xmp = bytes(buf[pos:pos + count]).decode("utf-8", "replace")
+    return fields, xmp
+
+
+def _xmp_value(xmp: str, name: str) -> str | None:
+    """An XMP property, written as an attribute or as an element."""
+    m = re.search(rf'{name}\s*=\s*"([^"]*)"|<{name}>([^<]*)</{name}>', xmp)
+    if m is None:
+        return None
+    return (m.group(1) if m.group(1) is not None else m.group(2)).strip() or None
+
+
+def _parse_xmp(xmp: str) -> dict:
+    fields: dict = {}
+    try:
+        lat = float(_xmp_value(xmp, "drone-dji:GpsLatitude") or "")
+        lon = float(_xmp_value(xmp, "drone-dji:GpsLongitude") or _xmp_value(xmp, "drone-dji:GpsLongtitude") or "")
+        fields["lat"], fields["lon"] = lat, lon
+    except ValueError:
+        pass
+    model = _xmp_value(xmp, "tiff:Model")
+    if model:
+        make = _xmp_value(xmp, "tiff:Make")
+        fields["camera"] = model if not make or model.startswith(make) else f"{make} {model}"
+    taken = _xmp_value(xmp, "exif:DateTimeOriginal") or _xmp_value(xmp, "xmp:CreateDate")
+    if taken and (iso := _iso_time(taken)):
+        offset = _OFFSET_RE.search(taken)
+        fields["taken"] = (iso, offset.group(0) if offset else "")
+    return fields
+
+
+def _jpeg_segments(m) -> tuple[int | None, str | None]:
+    """Start of the EXIF TIFF header and the XMP packet of a JPEG, from its APP segments."""
+    if m[:2] != b"\xff\xd8":
+        raise ValueError("not a JPEG")
+    exif_base, xmp = None, None
+    pos, end = 2, len(m)
+    while pos + 4 <= end:
+        if m[pos] != 0xFF:
+            break
+        marker = m[pos + 1]
+        if marker == 0xFF:
+            pos += 1
+            continue
+        # Only APPn and COM segments come before the image data we never read.
+        if not (0xE0 <= marker <= 0xEF or marker == 0xFE):
+            break
+        length = struct.unpack_from(">H", m, pos + 2)[0]
+        body = pos + 4
+        if marker == 0xE1:
+            if exif_base is None and m[body:body + 6] == _EXIF_ID:
+                exif_base = body + 6
+            elif xmp is None and m[body:body + len(_XMP_ID)] == _XMP_ID:
+                xmp = bytes(m[body + len(_XMP_ID):pos + 2 + length]).decode("utf-8", "replace")
+        pos += 2 + length
+    return exif_base, xmp
+
+
+def read_header(path: str) -> ImageHeader | None:
+    """Capture time, GPS position and camera of one JPG or TIFF, from its header only."""
+    ext = os.path.splitext(path)[1].lower()
+    with open(path, "rb") as f:
+        if not os.fstat(f.fileno()).st_size:
+            return None
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            fields: dict = {}
+            xmp = None
+            if ext in JPEG_EXTENSIONS:
+                exif_base, xmp = _jpeg_segments(m)
+                if exif_base is not None:
+                    fields = _parse_tiff(m, exif_base)[0]
+            else:
+                fields, xmp = _parse_tiff(m)
+    if xmp:
+        fields = {**_parse_xmp(xmp), **fields}
+    if not fields:
+        return None
+    lat, lon = fields.get("lat"), fields.get("lon")
+    if lat is None or lon is None or (lat == 0 and lon == 0) or not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        # DJI writes 0/0 before the GPS has a fix.
+        lat = lon = None
+    return ImageHeader(fields.get("taken"), lat, lon, fields.get("camera"))
+
+
+def _read_header_or_none(path: str) -> ImageHeader | None:
+    # Runs in worker processes: one unreadable or corrupt file must not fail the folder.
+    try:
+        return read_header(path)
+    except (OSError, ValueError, struct.error, IndexError):
+        return None
+
+
+# ---------------------------------------------------------------------------
+# Folder summaries
+# ---------------------------------------------------------------------------
+
+class FolderSummarizer:
+    """Builds the capture summary of a folder, fanning large folders out to a process pool."""
+
+    def __init__(self, workers: int | None = None):
+        self.workers = workers or os.cpu_count() or 1
+        self._pool: "ProcessPoolExecutor | None" = None
+        self.read = 0
+        self.seconds = 0.0
+
+    def _read_many(self, paths: list[str]) -> list[ImageHeader | None]:
+        if self.workers == 1 or len(paths) <= _INLINE_MAX_FILES:
+            return [_read_header_or_none(p) for p in paths]
+        if self._pool is None:
+            from concurrent.futures import ProcessPoolExecutor
+
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        chunksize = max(1, len(paths) // (self.workers * 4))
+        return list(self._pool.map(_read_header_or_none, paths, chunksize=chunksize))
+
+    def summary(self, folder: str, files: list[FileEntry]) -> dict:
+        """YAML fields describing ``files`` in ``folder``; see the module docstring."""
+        result: dict = {"total_bytes": sum(f.size for f in files)}
+        paths = [
+            f.source or os.path.join(folder, f.name)
+            for f in files
+            if f.name.lower().endswith(JPEG_EXTENSIONS + TIFF_EXTENSIONS)
+        ]
+        if not paths:
+            return result
+
+        started = time.monotonic()
+        headers = [h for h in self._read_many(paths) if h is not None]
+        self.seconds += time.monotonic() - started
+        self.read += len(paths)
+
+        times = sorted(h.taken for h in headers if h.taken)
+        if times:
+            result["capture_start"] = "".join(times[0])
+            result["capture_end"] = "".join(times[-1])
+        lats = [h.lat for h in headers if h.lat is not None]
+        lons = [h.lon for h in headers if h.lon is not None]
+        if lats:
+            result["gps_bbox"] = {
+                "min_lat": round(min(lats), 7),
+                "min_lon": round(min(lons), 7),
+                "max_lat": round(max(lats), 7),
+                "max_lon": round(max(lons), 7),
+            }
+        cameras = sorted({h.camera for h in headers if h.camera})
+        if cameras:
+            result["cameras"] = cameras
+        return result
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+        if self.read:
+            log_debug(f"Folder summaries: {self.read} image header(s) read in {self.seconds:.1f}s")
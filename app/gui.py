@@ -1,12 +1,8 @@
-import datetime
 import os
-import re
-import shutil
 import subprocess
 import sys
 import threading
-import time
-import shlex
+from typing import TYPE_CHECKING
 
 # tkinter requires a system package on Linux (e.g. apt install python3-tk).
 # The portable setup.sh downloads a Python that includes tkinter.
@@ -30,75 +26,38 @@ except ImportError:
     )
     sys.exit(1)
 
-import yaml
-
-APP_NAME = "SeaBee-FieldUploader"
-
-
-# ---------------------------------------------------------------------------
-# Paths
-# ---------------------------------------------------------------------------
-
-def get_app_root_dir() -> str:
-    """Return the repository / distribution root directory."""
-    if getattr(sys, "frozen", False):
-        return os.path.dirname(sys.executable)
-    return os.path.abspath(os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir))
-
-
-def get_resources_dir() -> str:
-    return os.path.join(get_app_root_dir(), "resources")
-
-
-def get_user_config_dir() -> str:
-    """Config lives in <app_root>/configs — portable, no surprises."""
-    override = os.environ.get("SEABEE_CONFIG_DIR")
-    if override:
-        return override
-    return os.path.join(get_app_root_dir(), "configs")
-
-
-def _safe_makedirs(path: str) -> bool:
-    try:
-        os.makedirs(path, exist_ok=True)
-        return True
-    except Exception:
-        return False
-
-
-# ---------------------------------------------------------------------------
-# Logging
-# ---------------------------------------------------------------------------
-
-def _debug_log_path() -> str | None:
-    try:
-        cfg_dir = get_user_config_dir()
-        if _safe_makedirs(cfg_dir):
-            return os.path.join(cfg_dir, "debug.log")
-    except Exception:
-        pass
-    try:
-        import tempfile
-        return os.path.join(tempfile.gettempdir(), "seabee-fielduploader-debug.log")
-    except Exception:
-        return None
-
-
-def log_debug(message: str) -> None:
-    ts = time.strftime("%Y-%m-%d %H:%M:%S")
-    line = f"[{ts}] {message}"
-    try:
-        print(line, flush=True)
-    except Exception:
-        pass
-    path = _debug_log_path()
-    if not path:
-        return
-    try:
-        with open(path, "a", encoding="utf-8") as f:
-            f.write(line + "\n")
-    except Exception:
-        pass
+from app.config import (
+    bootstrap_config_files,
+    ensure_config_file,
+    ensure_defaults_ready,
+    load_bucket_config,
+    load_bucket_options,
+    load_rclone_backend,
+    resolve_rclone_conf,
+    resolve_rclone_exe,
+    write_defaults_file,
+    write_diagnostics_snapshot,
+)
+from app.bandwidth import BandwidthSchedule, load_schedule
+from app.engine import (
+    ProgressCallback,
+    StatusCallback,
+    UploadEngine,
+    UploadMetadata,
+    UploadTarget,
+)
+from app.jobs import DONE, FAILED, QUEUED, RUNNING, UploadJob, UploadQueue, queue_limits
+from app.ingest import CardIngest, open_hash_cache, open_tee
+from app.log import _debug_log_path, log_debug
+from app.rcd import RcloneDaemon, open_backend
+from app.startup import StartupClock
+from app.verify import default_report_path, verify_enabled
+from app.watch import FolderWatcher, watch_timing
+from app.paths import get_app_root_dir, get_resources_dir, get_user_config_dir
+from app.progress import Progress, ProgressQueue, format_bytes, format_eta
+
+if TYPE_CHECKING:
+    from app.s3native import NativeS3
 
 
 # ---------------------------------------------------------------------------
@@ -187,10 +146,15 @@ def _find_icon_path() -> str | None:
     return None
 
 
-def set_window_icon(root: tk.Tk) -> None:
+def set_window_icon(root: tk.Tk) -> str | None:
+    """Set the title-bar icon; returns its path for the taskbar icon, if found.
+
+    The Windows taskbar icon needs the window's handle, so it is set after the
+    first paint with ``_try_set_windows_taskbar_icon``.
+    """
     icon_path = _find_icon_path()
     if not icon_path:
-        return
+        return None
 
     try:
         root.iconbitmap(icon_path)
@@ -200,165 +164,8 @@ def set_window_icon(root: tk.Tk) -> None:
             root.iconphoto(True, img)
         except Exception:
             pass
+    return icon_path
 
-    _try_set_windows_taskbar_icon(root, icon_path)
-
-
-# ---------------------------------------------------------------------------
-# Config files
-# ---------------------------------------------------------------------------
-
-DEFAULT_REMOTE_NAME = "minio"
-DEFAULT_BUCKET_NAME = "fielduploads"
-DEFAULT_OBJECT_PREFIX = "seabirds/"
-
-DEFAULTS_TEMPLATE_TEXT = """\
-# defaults.txt
-theme=Seabirds
-organisation=NINA
-creator_name=
-project=SEAPOP 3B - Kartlegging av hekkebestander
-"""
-
-RCLONE_TEMPLATE_TEXT = """\
-# Template rclone config for SeaBee FieldUploader
-#
-# Fill in the values below.
-
-[minio]
-type = s3
-provider = Minio
-env_auth = false
-access_key_id = <ACCESS_KEY_ID>
-secret_access_key = <SECRET_ACCESS_KEY>
-endpoint = https://<MINIO_HOST>
-"""
-
-BUCKET_TEMPLATE_TEXT = f"""\
-# bucket.conf
-# Controls where uploads go in rclone.
-#
-# Keys are case-insensitive.
-
-REMOTE_NAME={DEFAULT_REMOTE_NAME}
-BUCKET_NAME={DEFAULT_BUCKET_NAME}
-OBJECT_PREFIX={DEFAULT_OBJECT_PREFIX}
-"""
-
-
-def ensure_config_file(filename: str, template_filename: str | None) -> str:
-    target_dir = get_user_config_dir()
-    _safe_makedirs(target_dir)
-
-    target_path = os.path.join(target_dir, filename)
-    if os.path.isfile(target_path):
-        return target_path
-
-    # Try copying from resources/ template first.
-    if template_filename:
-        template_path = os.path.join(get_resources_dir(), template_filename)
-        if os.path.isfile(template_path):
-            try:
-                shutil.copyfile(template_path, target_path)
-                log_debug(f"Config created from template: {target_path}")
-                return target_path
-            except Exception as e:
-                log_debug(f"Template copy failed: {e}")
-
-    # Fall back to embedded default text.
-    try:
-        with open(target_path, "w", encoding="utf-8") as f:
-            if filename.lower() == "defaults.txt":
-                f.write(DEFAULTS_TEMPLATE_TEXT)
-            elif filename.lower() == "rclone.conf":
-                f.write(RCLONE_TEMPLATE_TEXT)
-            elif filename.lower() == "bucket.conf":
-                f.write(BUCKET_TEMPLATE_TEXT)
-            else:
-                f.write("")
-        log_debug(f"Config created (embedded): {target_path}")
-    except Exception as e:
-        log_debug(f"Config write failed: {e}")
-    return target_path
-
-
-def bootstrap_config_files() -> None:
-    log_debug(f"Config dir: {get_user_config_dir()}")
-    log_debug(f"App root:   {get_app_root_dir()}")
-    ensure_config_file("defaults.txt", "defaults.txt")
-    ensure_config_file("rclone.conf", "rclone.conf.template")
-    ensure_config_file("bucket.conf", "bucket.conf.template")
-
-
-def write_diagnostics_snapshot() -> None:
-    cfg_dir = get_user_config_dir()
-    log_debug("--- Diagnostics ---")
-    log_debug(f"platform={sys.platform}  python={sys.version.split()[0]}  exe={sys.executable}")
-    log_debug(f"cwd={os.getcwd()}")
-    log_debug(f"config_dir={cfg_dir}")
-    for name in ["defaults.txt", "rclone.conf", "bucket.conf"]:
-        p = os.path.join(cfg_dir, name)
-        exists = os.path.isfile(p)
-        log_debug(f"  {name}: exists={exists}")
-
-
-# ---------------------------------------------------------------------------
-# Helpers: key=value files, YAML
-# ---------------------------------------------------------------------------
-
-def parse_kv_file(path: str) -> dict[str, str]:
-    data: dict[str, str] = {}
-    try:
-        with open(path, "r", encoding="utf-8") as f:
-            for raw in f:
-                line = raw.strip()
-                if not line or line.startswith("#"):
-                    continue
-                if "=" not in line:
-                    continue
-                k, v = line.split("=", 1)
-                data[k.strip().lower()] = v.strip()
-    except Exception:
-        pass
-    return data
-
-
-def safe_load_yaml(path: str) -> dict:
-    try:
-        with open(path, "r", encoding="utf-8") as f:
-            data = yaml.safe_load(f) or {}
-        return data if isinstance(data, dict) else {}
-    except Exception:
-        return {}
-
-
-def count_files_in_folder(folder_path: str, yaml_filename: str) -> int:
-    n = 0
-    try:
-        for name in os.listdir(folder_path):
-            full = os.path.join(folder_path, name)
-            if os.path.isfile(full) and name != yaml_filename:
-                if name.lower() == "thumbs.db":
-                    continue
-                n += 1
-    except Exception:
-        pass
-    return n
-
-
-# ---------------------------------------------------------------------------
-# Bucket config
-# ---------------------------------------------------------------------------
-
-def load_bucket_config() -> tuple[str, str, str]:
-    path = ensure_config_file("bucket.conf", "bucket.conf.template")
-    cfg = parse_kv_file(path)
-    remote = cfg.get("remote_name", DEFAULT_REMOTE_NAME)
-    bucket = cfg.get("bucket_name", DEFAULT_BUCKET_NAME)
-    prefix = cfg.get("object_prefix", DEFAULT_OBJECT_PREFIX)
-    if prefix and not prefix.endswith("/"):
-        prefix += "/"
-    return remote, bucket, prefix
 
 
 # ---------------------------------------------------------------------------
@@ -391,101 +198,15 @@ def open_folder(path: str) -> None:
         pass
 
 
-# ---------------------------------------------------------------------------
-# Rclone resolution
-# ---------------------------------------------------------------------------
-
-def format_command_for_display(argv: list[str]) -> str:
-    if sys.platform.startswith("win"):
-        return subprocess.list2cmdline(argv)
-    return shlex.join(argv)
-
-
-def resolve_rclone_exe() -> str | None:
-    env_path = os.environ.get("SEABEE_RCLONE_EXE") or os.environ.get("RCLONE_EXE")
-    if env_path and os.path.isfile(env_path):
-        return env_path
-
-    local_name = "rclone.exe" if sys.platform.startswith("win") else "rclone"
-    root = get_app_root_dir()
-
-    # Portable runtime/ directory (created by setup.bat / setup.sh)
-    runtime_candidate = os.path.join(root, "runtime", "rclone", local_name)
-    if os.path.isfile(runtime_candidate):
-        return runtime_candidate
-
-    # Next to the app
-    root_candidate = os.path.join(root, local_name)
-    if os.path.isfile(root_candidate):
-        return root_candidate
-
-    # In configs/
-    config_candidate = os.path.join(get_user_config_dir(), local_name)
-    if os.path.isfile(config_candidate):
-        return config_candidate
-
-    return shutil.which("rclone")
-
-
-def resolve_rclone_conf() -> str | None:
-    env_path = os.environ.get("SEABEE_RCLONE_CONFIG") or os.environ.get("RCLONE_CONFIG")
-    if env_path and os.path.isfile(env_path):
-        return env_path
-
-    candidates = [
-        os.path.join(get_user_config_dir(), "rclone.conf"),
-        os.path.join(get_app_root_dir(), "rclone.conf"),
-    ]
-    for path in candidates:
-        if os.path.isfile(path):
-            return path
-    return None
-
 
 # ---------------------------------------------------------------------------
-# Defaults
+# GUI
 # ---------------------------------------------------------------------------
 
-def resolve_defaults_path() -> str:
-    return os.path.join(get_user_config_dir(), "defaults.txt")
-
-
-def parse_defaults_file(path: str) -> dict:
-    defs: dict[str, str] = {}
-    try:
-        with open(path, encoding="utf-8") as f:
-            for line in f:
-                line = line.strip()
-                if not line or line.startswith("#"):
-                    continue
-                if "=" in line:
-                    k, v = line.split("=", 1)
-                    defs[k.strip()] = v.strip()
-    except Exception:
-        pass
-    return defs
-
+_UI_POLL_MS = 200
+_BWLIMIT_REFRESH_MS = 30_000
+_MAX_TRANSFERS_SHOWN = 4
 
-def write_defaults_file(path: str, theme: str, organisation: str, creator_name: str, project: str) -> None:
-    os.makedirs(os.path.dirname(path), exist_ok=True)
-    with open(path, "w", encoding="utf-8") as f:
-        f.write("# defaults.txt\n")
-        f.write(f"theme={theme}\n")
-        f.write(f"organisation={organisation}\n")
-        f.write(f"creator_name={creator_name}\n")
-        f.write(f"project={project}\n")
-
-
-def ensure_defaults_ready() -> dict:
-    defaults_path = resolve_defaults_path()
-    if not os.path.isfile(defaults_path):
-        ensure_config_file("defaults.txt", "defaults.txt")
-    return parse_defaults_file(defaults_path)
-
-
-# ---------------------------------------------------------------------------
-# GUI
-# ---------------------------------------------------------------------------
 
 class S3UploaderApp(ttk.Frame):
     def __init__(self, master: tk.Tk):
@@ -501,7 +222,9 @@ class S3UploaderApp(ttk.Frame):
         style.configure("TEntry", padding=4)
         style.configure("TButton", padding=6)
 
-        self.remote_name, self.bucket_name, self.object_prefix = load_bucket_config()
+        # bucket.conf is read once here; later reads only happen on demand.
+        options = load_bucket_options()
+        self.remote_name, self.bucket_name, self.object_prefix = load_bucket_config(options)
 
         defs = ensure_defaults_ready()
         theme_default = defs.get("theme", "Seabirds")
@@ -545,28 +268,87 @@ class S3UploaderApp(ttk.Frame):
             row=6, column=2, padx=5, pady=(12, 4),
         )
 
-        ttk.Button(self, text="Upload to S3", command=self.start_upload).grid(
-            row=7, column=1, pady=(10, 0),
+        ttk.Button(self, text="Cancel", command=self.cancel_upload).grid(
+            row=7, column=0, sticky="W", pady=(10, 0),
+        )
+        buttons = ttk.Frame(self)
+        buttons.grid(row=7, column=1, pady=(10, 0))
+        ttk.Button(buttons, text="Upload to S3", command=self.start_upload).pack(side="left")
+        ttk.Button(buttons, text="Copy SD card & upload…", command=self.start_card_ingest).pack(
+            side="left", padx=(6, 0),
         )
+        self.reconcile_var = tk.BooleanVar(master=self, value=False)
+        self.verify_var = tk.BooleanVar(master=self, value=verify_enabled(options))
+        checks = ttk.Frame(self)
+        checks.grid(row=7, column=2, sticky="E", pady=(10, 0))
+        ttk.Checkbutton(checks, text="Re-check remote", variable=self.reconcile_var).pack(anchor="w")
+        ttk.Checkbutton(checks, text="Verify & repair", variable=self.verify_var).pack(anchor="w")
+        self.watch_var = tk.BooleanVar(master=self, value=False)
+        ttk.Checkbutton(checks, text="Watch for new folders", variable=self.watch_var).pack(anchor="w")
 
         self.status_var = tk.StringVar(master=self, value="Idle")
+        self.progress_var = tk.StringVar(master=self, value="")
         self.speed_var = tk.StringVar(master=self, value="")
-        self.eta_var = tk.StringVar(master=self, value="")
+        self.transfers_var = tk.StringVar(master=self, value="")
+        self.bwlimit_var = tk.StringVar(master=self, value="")
 
         ttk.Label(self, textvariable=self.status_var, wraplength=620).grid(
             row=8, column=0, columnspan=3, sticky="W", pady=(15, 2),
         )
-        ttk.Label(self, textvariable=self.speed_var, wraplength=620).grid(
-            row=9, column=0, columnspan=3, sticky="W",
+        self.jobs_view = ttk.Treeview(
+            self, columns=("folder", "status", "progress"), show="headings", height=4, selectmode="browse",
         )
-        ttk.Label(self, textvariable=self.eta_var, wraplength=620).grid(
+        for col, heading, width in (("folder", "Folder", 220), ("status", "Status", 280), ("progress", "Progress", 90)):
+            self.jobs_view.heading(col, text=heading)
+            self.jobs_view.column(col, width=width, stretch=col == "status")
+        self.jobs_view.grid(row=9, column=0, columnspan=3, sticky="EW", pady=(0, 6))
+        self.jobs_view.bind("<<TreeviewSelect>>", lambda _e: self._show_selected_job())
+
+        ttk.Label(self, textvariable=self.progress_var, wraplength=620).grid(
             row=10, column=0, columnspan=3, sticky="W",
         )
+        ttk.Label(self, textvariable=self.speed_var, wraplength=620).grid(
+            row=11, column=0, columnspan=3, sticky="W",
+        )
+        ttk.Label(self, textvariable=self.transfers_var, wraplength=620, justify="left").grid(
+            row=12, column=0, columnspan=3, sticky="W",
+        )
+        ttk.Label(self, textvariable=self.bwlimit_var, wraplength=620).grid(
+            row=13, column=0, columnspan=3, sticky="W", pady=(6, 0),
+        )
 
         self.columnconfigure(1, weight=1)
 
         self._rclone_exe: str | None = None
         self._rclone_conf: str | None = None
+        self._daemon: "RcloneDaemon | NativeS3 | None" = None
+        self._daemon_lock = threading.Lock()
+        # Set while watch mode is on; setting it stops the watcher.
+        self._watch_stop: threading.Event | None = None
+        self._watch_folder = ""
+        # Set while an SD card is being copied; setting it stops the copy.
+        self._ingest_stop: threading.Event | None = None
+        self._ingest_message = ""
+
+        # Upload threads never touch Tk directly; the main loop drains this.
+        self._events = ProgressQueue()
+
+        max_jobs, max_bytes = queue_limits(options)
+        self._queue = UploadQueue(
+            self._make_engine,
+            max_jobs=max_jobs,
+            max_bytes_in_flight=max_bytes,
+            on_update=lambda job: self._events.put("job", job.id),
+        )
+        # The job whose details are shown: the selected one, else the last
+        # one that reported anything.
+        self._detail_job: int | None = None
+        self._announced: set[int] = set()
+
+        self.after(_UI_POLL_MS, self._drain_events)
+        self._bwlimit_spec: str | None = None
+        self._bwlimit_schedule: BandwidthSchedule | None = None
+        self._refresh_bwlimit(options)
 
     # -- button handlers --
 
@@ -638,133 +420,298 @@ class S3UploaderApp(ttk.Frame):
             return
         if not self.ensure_rclone_ready():
             return
-        threading.Thread(target=self.upload_folder, args=(fld,), daemon=True).start()
+        if self.watch_var.get():
+            self._start_watch(fld)
+            return
+        job, merged = self._queue.submit(
+            fld, self._current_metadata(), self.reconcile_var.get(), self.verify_var.get(),
+        )
+        if merged:
+            messagebox.showinfo("Already queued", f"{fld} is already {job.state}; it was not added again.")
+        self.jobs_view.selection_set(str(job.id))
+
+    def _start_watch(self, fld: str) -> None:
+        """Upload each top-level folder of ``fld`` once it stops changing, until Cancel."""
+        if self._watch_stop is not None:
+            messagebox.showinfo("Already watching", f"{self._watch_folder} is already being watched.")
+            return
+        meta, verify = self._current_metadata(), self.verify_var.get()
+        watcher = FolderWatcher(fld, *watch_timing(load_bucket_options()))
+        stop = threading.Event()
 
-    # -- rclone --
+        def submit(names: list[str]) -> None:
+            self._queue.submit(fld, meta, verify=verify, folders=names)
 
-    def run_rclone_with_progress(self, source: str, dest: str, include_yaml_only: bool = False) -> None:
-        if not self._rclone_exe or not self._rclone_conf:
-            raise RuntimeError("rclone not initialised")
+        self._watch_stop, self._watch_folder = stop, fld
+        threading.Thread(target=watcher.run, args=(submit, stop), daemon=True).start()
+        self._update_summary()
 
-        command = [
-            self._rclone_exe, "copy", source, dest,
-            "--config", self._rclone_conf,
-            "--progress",
-            "--exclude", "$RECYCLE.BIN/**",
-        ]
-        if include_yaml_only:
-            command += ["--include", "*.yaml"]
+    def start_card_ingest(self) -> None:
+        """Copy an SD card's DCIM folder into the selected folder, uploading each flight folder once copied."""
+        fld = self.folder_var.get().strip()
+        if not fld or not os.path.isdir(fld):
+            messagebox.showwarning("Select Folder", "Please choose the hard drive to copy the card to first.")
+            return
+        if self._ingest_stop is not None:
+            messagebox.showinfo("Already copying", "An SD card is already being copied.")
+            return
+        if not self.ensure_rclone_ready():
+            return
+        card = filedialog.askdirectory(title="Select the SD card (or its DCIM folder)")
+        if not card:
+            return
+        meta = self._current_metadata()
+        dest = UploadTarget(self.remote_name, self.bucket_name, self.object_prefix).dest
+        stop = threading.Event()
 
-        print(
-            "\n[SeaBee] rclone: " + format_command_for_display(command) + "\n",
-            flush=True,
-        )
+        def submit(names: list[str]) -> None:
+            # Always verified: it is what checks the drive copy against the card.
+            self._queue.submit(fld, meta, verify=True, folders=names)
 
-        process = subprocess.Popen(
-            command,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            text=True,
-        )
+        def on_status(message: str) -> None:
+            self._ingest_message = message
+            self._events.put("ingest")
 
-        assert process.stdout is not None
-        for line in process.stdout:
-            line = line.strip()
-            match = re.search(
-                r"Transferred:\s+([\d.]+\s\w+)\s*/\s*([\d.]+\s\w+),.*?([\d.]+\s\w+/s),\s*ETA\s*([\dhms]+)",
-                line,
-            )
-            if match:
-                self.speed_var.set(f"Speed: {match.group(3)}")
-                self.eta_var.set(f"ETA: {match.group(4)}")
-                self.status_var.set(f"Transferred: {match.group(1)} / {match.group(2)}")
-            if os.environ.get("SEABEE_RCLONE_DEBUG"):
-                print(line, flush=True)
-
-        process.wait()
-        if process.returncode and process.returncode != 0:
-            raise RuntimeError(f"rclone failed with exit code {process.returncode}")
-
-    def upload_folder(self, folder: str) -> None:
+        def run() -> None:
+            try:
+                options = load_bucket_options()
+                try:
+                    tee = open_tee(self._session_daemon(), dest, options)
+                except Exception as e:
+                    log_debug(f"Upload backend unavailable, the card will not be streamed: {e}")
+                    tee = None
+                CardIngest(card, fld, open_hash_cache(options), tee).run(submit, stop, on_status)
+            except (OSError, RuntimeError) as e:
+                log_debug(f"❌ Copy from card failed: {e}")
+                on_status(f"❌ Copy from card failed: {e}")
+            finally:
+                self._ingest_stop = None
+                self._events.put("ingest")
+
+        self._ingest_stop = stop
+        threading.Thread(target=run, daemon=True).start()
+
+    def _stop_ingest(self) -> None:
+        if self._ingest_stop is not None:
+            self._ingest_stop.set()
+            log_debug("Stopped copying the SD card")
+
+    def _stop_watch(self) -> None:
+        if self._watch_stop is not None:
+            self._watch_stop.set()
+            self._watch_stop = None
+            log_debug(f"Stopped watching {self._watch_folder}")
+            self._update_summary()
+
+    # -- progress (main thread) --
+
+    def _drain_events(self) -> None:
         try:
-            files_at_root = [f for f in os.listdir(folder) if os.path.isfile(os.path.join(folder, f))]
-            if files_at_root:
-                ts = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
-                pkg_name = f"fielduploader_upload_{ts}"
-                pkg_path = os.path.join(folder, pkg_name)
-                os.makedirs(pkg_path, exist_ok=True)
-                for fname in files_at_root:
-                    shutil.move(os.path.join(folder, fname), os.path.join(pkg_path, fname))
-
-            yaml_filename = "fielduploads.seabee.yaml"
-            now_iso = datetime.datetime.now(datetime.timezone.utc).isoformat()
-
-            base_meta = {
-                "theme": self.theme_var.get(),
-                "organisation": self.org_var.get(),
-                "creator_name": self.creator_var.get(),
-                "project": self.project_var.get(),
-            }
-
-            for root, dirs, files in os.walk(folder):
-                if os.path.abspath(root) == os.path.abspath(folder):
-                    continue
-                if "$RECYCLE.BIN" in root.upper():
-                    continue
-
-                nfiles = count_files_in_folder(root, yaml_filename)
-                if nfiles == 0:
-                    continue
-
-                yaml_path = os.path.join(root, yaml_filename)
-                existing = safe_load_yaml(yaml_path) if os.path.exists(yaml_path) else {}
-                if os.path.exists(yaml_path) and existing.get("nfiles") == nfiles:
+            _, _, events = self._events.drain()
+            if any(k == "ingest" for k, _ in events):
+                self._update_summary()
+            # Many updates per job may be queued; each row is redrawn once.
+            changed = [self._queue.get(job_id) for job_id in dict.fromkeys(p for k, p in events if k == "job")]
+            jobs = [job for job in changed if job is not None]
+            if not jobs:
+                return
+            for job in jobs:
+                self._update_job_row(job)
+            self._update_summary()
+            self._show_selected_job()
+            for job in jobs:
+                if job.active or job.id in self._announced:
                     continue
+                self._announced.add(job.id)
+                if job.state == DONE and job.folders is None:
+                    messagebox.showinfo(
+                        "Upload Complete", f"All files uploaded successfully via rclone.\n\n{job.folder}",
+                    )
+                elif job.state == FAILED:
+                    detail = f"{job.error}"
+                    if str(job.error).startswith("Verification failed"):
+                        detail += f"\n\nDetails: {default_report_path()}"
+                    messagebox.showerror("Upload Failed", f"Upload failed.\n\n{job.folder}\n\n{detail}")
+        finally:
+            self.after(_UI_POLL_MS, self._drain_events)
+
+    def _update_job_row(self, job: UploadJob) -> None:
+        p = job.progress
+        pct = f"{100 * p.bytes // p.total_bytes}%" if p is not None and p.total_bytes else ""
+        values = (job.folder, job.message, pct)
+        iid = str(job.id)
+        if self.jobs_view.exists(iid):
+            self.jobs_view.item(iid, values=values)
+        else:
+            self.jobs_view.insert("", "end", iid=iid, values=values)
+        if job.active:
+            self._detail_job = job.id
+
+    def _update_summary(self) -> None:
+        jobs = self._queue.jobs()
+        running = sum(j.state == RUNNING for j in jobs)
+        queued = sum(j.state == QUEUED for j in jobs)
+        watching = f"Watching {self._watch_folder} for new folders; " if self._watch_stop is not None else ""
+        if self._ingest_message:
+            watching = f"{self._ingest_message} " + watching
+        if running or queued:
+            self.status_var.set(f"{watching}{running} upload(s) running, {queued} queued")
+        else:
+            self.status_var.set(f"{watching}idle" if watching else "Idle")
+
+    def _show_selected_job(self) -> None:
+        selected = self.jobs_view.selection()
+        job_id = int(selected[0]) if selected else self._detail_job
+        job = self._queue.get(job_id) if job_id is not None else None
+        if job is None or job.progress is None:
+            for var in (self.progress_var, self.speed_var, self.transfers_var):
+                var.set("")
+            return
+        self._show_progress(job.progress)
 
-                meta = dict(base_meta)
-                meta["nfiles"] = nfiles
-                meta["lastupdated"] = now_iso
-
-                with open(yaml_path, "w", encoding="utf-8") as yf:
-                    yf.write(yaml.dump(meta, sort_keys=False, allow_unicode=True))
-
-            self.status_var.set("Uploading YAML config files via rclone…")
-            self.run_rclone_with_progress(
-                folder,
-                f"{self.remote_name}:{self.bucket_name}/{self.object_prefix}",
-                include_yaml_only=True,
+    def _show_progress(self, p: Progress) -> None:
+        pct = f" ({100 * p.bytes // p.total_bytes}%)" if p.total_bytes else ""
+        self.progress_var.set(
+            f"Transferred: {format_bytes(p.bytes)} / {format_bytes(p.total_bytes)}{pct}, "
+            f"files {p.transfers} / {p.total_transfers}"
+        )
+        self.speed_var.set(f"Speed: {format_bytes(p.speed)}/s    ETA: {format_eta(p.eta)}")
+        lines = [f"  {t.name}  {t.percentage}%" for t in p.transferring[:_MAX_TRANSFERS_SHOWN]]
+        if len(p.transferring) > _MAX_TRANSFERS_SHOWN:
+            lines.append(f"  … and {len(p.transferring) - _MAX_TRANSFERS_SHOWN} more")
+        if p.errors:
+            lines.append(f"Errors: {p.errors}")
+        self.transfers_var.set("\n".join(lines))
+
+    def _refresh_bwlimit(self, options: dict[str, str] | None = None) -> None:
+        """Show the bandwidth cap in force; re-read so bucket.conf edits show up."""
+        try:
+            spec = (options if options is not None else load_bucket_options()).get("bwlimit", "")
+            if spec != self._bwlimit_spec:
+                self._bwlimit_spec = spec
+                self._bwlimit_schedule = load_schedule({"bwlimit": spec})
+            schedule = self._bwlimit_schedule
+            self.bwlimit_var.set(
+                f"Bandwidth cap: {schedule.describe()}" if schedule else "Bandwidth cap: unlimited"
             )
+        finally:
+            self.after(_BWLIMIT_REFRESH_MS, self._refresh_bwlimit)
 
-            self.status_var.set("Uploading all files via rclone…")
-            self.run_rclone_with_progress(
-                folder,
-                f"{self.remote_name}:{self.bucket_name}/{self.object_prefix}",
-                include_yaml_only=False,
-            )
+    # -- uploads --
+
+    def _current_metadata(self) -> UploadMetadata:
+        return UploadMetadata(
+            theme=self.theme_var.get(),
+            organisation=self.org_var.get(),
+            creator_name=self.creator_var.get(),
+            project=self.project_var.get(),
+        )
 
-            self.status_var.set("✅ Upload complete.")
-            messagebox.showinfo("Upload Complete", "All files uploaded successfully via rclone.")
+    def cancel_upload(self) -> None:
+        """Cancel the selected job, or stop watching and cancel every job if none is selected."""
+        selected = self.jobs_view.selection()
+        if selected:
+            self._queue.cancel(int(selected[0]))
+        else:
+            self._stop_watch()
+            self._stop_ingest()
+            self._queue.cancel_all()
+
+    def _session_daemon(self) -> "RcloneDaemon | NativeS3 | None":
+        """The rclone rcd or native S3 backend shared by every upload in this session, if configured.
+
+        The backend is opened once per session: queued jobs may still be
+        running on it, so a later change to RCLONE_BACKEND or rclone.conf
+        only takes effect after a restart.
+        """
+        backend = load_rclone_backend()
+        if backend == "process":
+            return None
+        assert self._rclone_exe and self._rclone_conf
+        with self._daemon_lock:
+            if self._daemon is None:
+                self._daemon = open_backend(backend, self._rclone_exe, self._rclone_conf)
+            elif self._daemon.backend != backend or self._daemon.rclone_conf != self._rclone_conf:
+                log_debug(
+                    f"Upload backend changed to {backend} ({self._rclone_conf}); keeping "
+                    f"{self._daemon.backend} ({self._daemon.rclone_conf}) until the uploader is restarted"
+                )
+            self._daemon.start()
+            return self._daemon
+
+    def shutdown(self) -> None:
+        self._stop_watch()
+        self._stop_ingest()
+        self._queue.cancel_all()
+        if self._daemon is not None:
+            self._daemon.stop()
+
+    def _make_engine(self, job: UploadJob, on_status: StatusCallback, on_progress: ProgressCallback) -> UploadEngine:
+        """Build the engine for one queued job (called on the job's worker thread)."""
+        if not self._rclone_exe or not self._rclone_conf:
+            raise RuntimeError("rclone not initialised")
+        try:
+            daemon = self._session_daemon()
         except Exception as e:
-            self.status_var.set("❌ Upload failed.")
-            try:
-                messagebox.showerror("Upload Failed", f"Upload failed.\n\n{e}")
-            except Exception:
-                pass
+            log_debug(f"Upload backend unavailable, using one rclone process per transfer: {e}")
+            daemon = None
+        options = load_bucket_options()
+        if job.verify:
+            options["repair"] = "true"
+        return UploadEngine(
+            self._rclone_exe,
+            self._rclone_conf,
+            UploadTarget(self.remote_name, self.bucket_name, self.object_prefix),
+            on_status=on_status,
+            on_progress=on_progress,
+            reconcile=job.reconcile,
+            daemon=daemon,
+            options=options,
+            budget=self._queue.budget,
+        )
 
 
 # ---------------------------------------------------------------------------
 # Entry point
 # ---------------------------------------------------------------------------
 
-def main() -> None:
-    log_debug(f"debug log: {_debug_log_path()!r}")
-    bootstrap_config_files()
-    write_diagnostics_snapshot()
+def _background_startup() -> None:
+    """Start-up work nothing on screen waits for: config templates and diagnostics."""
+    try:
+        log_debug(f"debug log: {_debug_log_path()!r}")
+        bootstrap_config_files()
+        write_diagnostics_snapshot()
+    except Exception as e:
+        log_debug(f"Startup diagnostics failed: {e}")
+
 
+def main(clock: StartupClock | None = None) -> None:
+    clock = clock or StartupClock()
     _try_set_windows_appusermodel_id("NINA.SeaBee.FieldUploader")
 
     root = tk.Tk()
-    set_window_icon(root)
-    S3UploaderApp(root)
-    root.after(200, lambda: set_window_icon(root))
+    clock.mark("Tk")
+    icon_path = set_window_icon(root)
+    app = S3UploaderApp(root)
+    clock.mark("window")
+
+    def on_close() -> None:
+        app.shutdown()
+        root.destroy()
+
+    def on_first_paint() -> None:
+        clock.mark("first paint")
+        clock.report()
+        threading.Thread(target=_background_startup, name="seabee-startup", daemon=True).start()
+        if icon_path:
+            _try_set_windows_taskbar_icon(root, icon_path)
+
+    def on_map(event: tk.Event) -> None:
+        # <Map> comes before the window is drawn; the idle queue runs after.
+        if event.widget is root:
+            root.unbind("<Map>", map_binding)
+            root.after_idle(on_first_paint)
+
+    map_binding = root.bind("<Map>", on_map, add="+")
+    root.protocol("WM_DELETE_WINDOW", on_close)
     root.mainloop()
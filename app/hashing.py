@@ -0,0 +1,207 @@
+"""Content hashes for checksum-based upload verification.
+
+File modtimes do not survive the trip from SD card to exFAT drive reliably, so
+size + modtime alone either re-uploads unchanged files or misses changed ones.
+Before upload, every file in the delta is hashed with MD5, which S3 reports
+as the ETag of single-part uploads (and rclone stores as metadata on multipart
+ones). Files are read through a memory map, in a process pool for large
+batches. Results are cached per file keyed by (size, mtime, inode), so a file
+is only ever hashed once.
+"""
+
+import hashlib
+import mmap
+import os
+import sqlite3
+import time
+from typing import TYPE_CHECKING
+
+from app.log import log_debug
+from app.paths import _safe_makedirs, get_user_config_dir
+from app.scanner import FileEntry
+
+if TYPE_CHECKING:
+    from concurrent.futures import ProcessPoolExecutor
+
+HASH_CACHE_FILENAME = "hashcache.sqlite3"
+_SCHEMA_VERSION = 2
+
+_CHUNK_BYTES = 8 * 1024 * 1024
+
+# Below this, starting worker processes costs more than it saves.
+_INLINE_MAX_FILES = 8
+_INLINE_MAX_BYTES = 64 * 1024 * 1024
+
+
+def hash_file(path: str) -> str:
+    """Return the MD5 hex digest of one file."""
+    md5 = hashlib.md5()
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                view = memoryview(m)
+                try:
+                    for offset in range(0, len(view), _CHUNK_BYTES):
+                        chunk = view[offset:offset + _CHUNK_BYTES]
+                        md5.update(chunk)
+                        chunk.release()
+                finally:
+                    view.release()
+    return md5.hexdigest()
+
+
+def _hash_file_or_none(path: str) -> str | None:
+    # Runs in worker processes: one unreadable file must not fail the batch.
+    try:
+        return hash_file(path)
+    except OSError:
+        return None
+
+
+def checksum_enabled(options: dict[str, str]) -> bool:
+    """CHECKSUM=false in bucket.conf goes back to size + modtime comparison."""
+    return options.get("checksum", "true").strip().lower() not in ("0", "false", "no", "off")
+
+
+def default_hash_cache_path() -> str:
+    return os.path.join(get_user_config_dir(), HASH_CACHE_FILENAME)
+
+
+class HashCache:
+    def __init__(self, path: str | None = None):
+        self.path = path or default_hash_cache_path()
+        _safe_makedirs(os.path.dirname(self.path))
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._init_schema()
+
+    def _init_schema(self) -> None:
+        version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+        if version == 1:
+            # Version 1 also kept a second, unused digest; keep the MD5s.
+            self._conn.execute("ALTER TABLE hashes RENAME TO hashes_v1")
+        elif version != _SCHEMA_VERSION:
+            self._conn.execute("DROP TABLE IF EXISTS hashes")
+        self._conn.executescript(
+            f"""
+            CREATE TABLE IF NOT EXISTS hashes (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                ino INTEGER NOT NULL,
+                md5 TEXT NOT NULL
+            );
+            PRAGMA user_version = {_SCHEMA_VERSION};
+            """
+        )
+        if version == 1:
+            self._conn.executescript(
+                """
+                INSERT OR REPLACE INTO hashes (path, size, mtime_ns, ino, md5)
+                    SELECT path, size, mtime_ns, ino, md5 FROM hashes_v1;
+                DROP TABLE hashes_v1;
+                """
+            )
+        self._conn.commit()
+
+    @staticmethod
+    def _key(path: str) -> str:
+        return os.path.normcase(os.path.abspath(path))
+
+    def lookup(self, path: str, st: os.stat_result) -> str | None:
+        """Return the cached MD5 if the file is unchanged since it was hashed."""
+        row = self._conn.execute(
+            "SELECT size, mtime_ns, ino, md5 FROM hashes WHERE path = ?",
+            (self._key(path),),
+        ).fetchone()
+        if row is None or row[:3] != (st.st_size, st.st_mtime_ns, st.st_ino):
+            return None
+        return row[3]
+
+    def store_many(self, rows: list[tuple[str, os.stat_result, str]]) -> None:
+        """Record ``(path, stat, md5)`` for freshly hashed files."""
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO hashes (path, size, mtime_ns, ino, md5) VALUES (?, ?, ?, ?, ?)",
+                [(self._key(path), st.st_size, st.st_mtime_ns, st.st_ino, md5) for path, st, md5 in rows],
+            )
+
+    def close(self) -> None:
+        try:
+            self._conn.close()
+        except Exception:
+            pass
+
+
+class Hasher:
+    """Hashes files through the cache, fanning cache misses out to a process pool."""
+
+    def __init__(self, cache: HashCache | None = None, workers: int | None = None):
+        self.cache = cache
+        self.workers = workers or os.cpu_count() or 1
+        self._pool: "ProcessPoolExecutor | None" = None
+        self.hits = 0
+        self.hashed = 0
+        self.hashed_bytes = 0
+        self.seconds = 0.0
+
+    def _hash_many(self, paths: list[str], nbytes: int) -> list[str | None]:
+        if self.workers == 1 or (len(paths) <= _INLINE_MAX_FILES and nbytes <= _INLINE_MAX_BYTES):
+            return [_hash_file_or_none(p) for p in paths]
+        if self._pool is None:
+            # multiprocessing is slow to import; only pay for it once a batch needs it.
+            from concurrent.futures import ProcessPoolExecutor
+
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        chunksize = max(1, len(paths) // (self.workers * 4))
+        return list(self._pool.map(_hash_file_or_none, paths, chunksize=chunksize))
+
+    def md5s(self, folder: str, files: list[FileEntry]) -> dict[str, str]:
+        """MD5 of each of ``files`` in ``folder`` by name; unreadable files are left out."""
+        result: dict[str, str] = {}
+        misses: list[tuple[str, str, os.stat_result]] = []
+        for f in files:
+            path = f.source or os.path.join(folder, f.name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            cached = self.cache.lookup(path, st) if self.cache is not None else None
+            if cached is not None:
+                result[f.name] = cached
+                self.hits += 1
+            else:
+                misses.append((f.name, path, st))
+        if not misses:
+            return result
+
+        nbytes = sum(st.st_size for _, _, st in misses)
+        started = time.monotonic()
+        digests = self._hash_many([path for _, path, _ in misses], nbytes)
+        self.seconds += time.monotonic() - started
+
+        rows = []
+        for (name, path, st), digest in zip(misses, digests):
+            if digest is None:
+                continue
+            result[name] = digest
+            rows.append((path, st, digest))
+            self.hashed += 1
+            self.hashed_bytes += st.st_size
+        if self.cache is not None and rows:
+            self.cache.store_many(rows)
+        return result
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+        if self.cache is not None:
+            self.cache.close()
+        if self.hashed or self.hits:
+            rate = self.hashed_bytes / self.seconds / (1024 * 1024) if self.seconds > 0 else 0.0
+            log_debug(
+                f"Checksums: {self.hashed} file(s) hashed ({self.hashed_bytes // (1024 * 1024)} MiB "
+                f"in {self.seconds:.1f}s, {rate:.0f} MiB/s), {self.hits} from cache"
+            )
@@ -0,0 +1,282 @@
+"""Direct SD-card ingest: copy the card to the drive and queue each folder for upload.
+
+The manual workflow reads every byte twice: once from the card when the crew
+copies ``DCIM`` to the drive, and again from the drive when the uploader
+hashes and uploads it. Ingest does the copy itself, one flight folder at a
+time:
+
+* each file is read from the card once; the same chunks are written to the
+  drive and fed to the MD5, so the checksum stage finds every copied file in
+  the hash cache instead of reading the drive again;
+* with ``RCLONE_BACKEND=native`` the chunks are also streamed to S3 as they
+  are read (see ``UploadTee``), so the folder's upload only has to find the
+  objects in place and record them;
+* each copy is flushed to disk under a temporary name and renamed when
+  complete, with the card's modtime, so an interrupted ingest is resumed by
+  skipping files already on the drive;
+* as soon as a folder is copied it is queued for upload (with its
+  ``fielduploads.seabee.yaml``, as in watch mode) while the next folder is
+  copied.
+
+The rclone backends read the files they upload themselves, so without the
+native backend the upload reads the drive copy again; only the hashing pass
+is saved. Ingest jobs are always verified: the ledger records the MD5 of what
+was read from the card, and verification compares it with the MD5 the remote
+reports, which checks the drive copy and the upload together.
+
+Loose files in ``DCIM`` are copied to the drive root but left for a normal
+upload afterwards, like in watch mode.
+"""
+import hashlib
+import os
+import shutil
+import threading
+import time
+from typing import TYPE_CHECKING, Callable
+
+from app.bundle import bundle_threshold
+from app.compress import compress_mode
+from app.hashing import HashCache, checksum_enabled
+from app.log import log_debug
+from app.scanner import scan_folder, scan_tree
+
+if TYPE_CHECKING:
+    import concurrent.futures
+
+    from app.rcd import RcloneDaemon
+    from app.s3native import NativeS3, StreamUpload
+
+DCIM_DIRNAME = "DCIM"
+_CHUNK_BYTES = 8 * 1024 * 1024
+_PART_SUFFIX = ".seabee-part"
+# exFAT and FAT store modtimes in 10 ms / 2 s steps.
+_MTIME_SLACK_S = 2.0
+# Streamed bytes held in memory before further files are left to the upload.
+_TEE_MAX_BYTES = 256 * 1024 * 1024
+
+
+def card_dcim(source: str) -> str:
+    """The ``DCIM`` folder of a card given as its root, or ``source`` itself."""
+    dcim = os.path.join(source, DCIM_DIRNAME)
+    return dcim if os.path.isdir(dcim) else source
+
+
+def open_hash_cache(options: dict[str, str]) -> HashCache | None:
+    """The hash cache to record copied files in, unless CHECKSUM=false."""
+    if not checksum_enabled(options):
+        return None
+    try:
+        return HashCache()
+    except Exception as e:
+        log_debug(f"Hash cache unavailable, copied files will be hashed again: {e}")
+        return None
+
+
+def copy_file(
+    src: str, dest: str, buf: bytearray | None = None, stream: "StreamUpload | None" = None,
+) -> str:
+    """Copy ``src`` to ``dest`` in one read, returning its MD5 hex digest.
+
+    The copy is written under a temporary name, flushed to disk and renamed,
+    so ``dest`` only ever holds a complete file, with ``src``'s modtime. Each
+    chunk is also written to ``stream``, if given.
+    """
+    md5 = hashlib.md5()
+    buf = buf if buf is not None else bytearray(_CHUNK_BYTES)
+    view = memoryview(buf)
+    part = dest + _PART_SUFFIX
+    try:
+        with open(src, "rb") as fin, open(part, "wb") as fout:
+            while n := fin.readinto(buf):
+                chunk = view[:n]
+                fout.write(chunk)
+                if stream is not None:
+                    stream.write(chunk)
+                md5.update(chunk)
+            fout.flush()
+            os.fsync(fout.fileno())
+        shutil.copystat(src, part)
+        os.replace(part, dest)
+    except BaseException:
+        try:
+            os.unlink(part)
+        except OSError:
+            pass
+        raise
+    finally:
+        view.release()
+    return md5.hexdigest()
+
+
+def _already_copied(dest: str, size: int, mtime: float) -> bool:
+    try:
+        st = os.stat(dest)
+    except FileNotFoundError:
+        return False
+    if st.st_size == size and abs(st.st_mtime - mtime) <= _MTIME_SLACK_S:
+        return True
+    raise RuntimeError(f"{dest} already exists and differs from the file on the card")
+
+
+class UploadTee:
+    """Streams files to S3 through the native backend as they are copied from the card.
+
+    Each file goes to the key the folder's upload will give it, with the
+    card's modtime, so that upload finds the object in place and only
+    records it. A file the tee cannot send (over 5 GiB, a failed request, or
+    a link slower than the card) is uploaded from the drive as usual.
+    """
+
+    def __init__(self, backend: "NativeS3", dest: str):
+        self.backend = backend
+        self.dest = dest
+        self.sent = 0
+        self.sent_bytes = 0
+        self.left = 0
+        self._finishing: list[tuple["StreamUpload", "concurrent.futures.Future"]] = []
+
+    def open(self, remote: str, size: int, mtime_ns: int) -> "StreamUpload | None":
+        """A stream for the file uploaded as ``remote``, or None to leave it to the upload."""
+        stream = None
+        if sum(s.in_flight for s, _ in self._finishing) < _TEE_MAX_BYTES:
+            try:
+                stream = self.backend.open_stream(self.dest, remote, size, mtime_ns)
+            except RuntimeError as e:
+                log_debug(f"Ingest: cannot stream {remote}: {e}")
+        if stream is None:
+            self.left += 1
+        return stream
+
+    def close(self, stream: "StreamUpload", md5: str) -> None:
+        future = stream.finish(md5)
+        if future is None:
+            self.left += 1
+        else:
+            self._finishing.append((stream, future))
+
+    def wait(self) -> None:
+        """Wait for the files streamed so far to be in place."""
+        for stream, future in self._finishing:
+            try:
+                future.result()
+            except Exception as e:
+                log_debug(f"Ingest: streaming {stream.key} failed, it will be uploaded from the drive: {e}")
+                self.left += 1
+                continue
+            self.sent += 1
+            self.sent_bytes += stream.size
+        self._finishing = []
+
+
+def open_tee(backend: "RcloneDaemon | NativeS3 | None", dest: str, options: dict[str, str]) -> UploadTee | None:
+    """An ``UploadTee`` to ``dest`` if ``backend`` is the native one and files go up as they are."""
+    if backend is None or backend.backend != "native":
+        return None
+    if bundle_threshold(options) is not None or compress_mode(options) != "off":
+        # Those upload staged bundles and compressed copies, not the card's files.
+        return None
+    return UploadTee(backend, dest)
+
+
+class CardIngest:
+    """Copies the flight folders of an SD card to ``dest_root``, one at a time."""
+
+    def __init__(
+        self, source: str, dest_root: str, hash_cache: HashCache | None = None, tee: UploadTee | None = None,
+    ):
+        self.source = card_dcim(source)
+        self.dest_root = dest_root
+        self.hash_cache = hash_cache
+        self.tee = tee
+        self.copied = 0
+        self.copied_bytes = 0
+        self.skipped = 0
+        self.seconds = 0.0
+        self._buf = bytearray(_CHUNK_BYTES)
+
+    def _copy_tree(
+        self, src_root: str, dest_root: str, stop: threading.Event, recursive: bool, remote_dir: str | None = None,
+    ) -> bool:
+        """Copy ``src_root`` into ``dest_root``; False if stopped part-way.
+
+        With ``remote_dir``, the remote folder of ``dest_root``, files are
+        also streamed through the tee.
+        """
+        manifests = scan_tree(src_root) if recursive else [scan_folder(src_root)]
+        for manifest in manifests:
+            if stop.is_set():
+                return False
+            dest_dir = os.path.join(dest_root, *manifest.relpath.split("/")) if manifest.relpath else dest_root
+            os.makedirs(dest_dir, exist_ok=True)
+            rows = []
+            for f in manifest.files:
+                if stop.is_set():
+                    return False
+                src = os.path.join(manifest.path, f.name)
+                dest = os.path.join(dest_dir, f.name)
+                if _already_copied(dest, f.size, f.mtime):
+                    self.skipped += 1
+                    continue
+                stream = None
+                if self.tee is not None and remote_dir is not None:
+                    remote = "/".join(p for p in (remote_dir, manifest.relpath, f.name) if p)
+                    stream = self.tee.open(remote, f.size, os.stat(src).st_mtime_ns)
+                started = time.monotonic()
+                try:
+                    md5 = copy_file(src, dest, self._buf, stream)
+                except BaseException:
+                    if stream is not None:
+                        stream.abort("the copy from the card failed")
+                    raise
+                if stream is not None:
+                    self.tee.close(stream, md5)
+                self.seconds += time.monotonic() - started
+                self.copied += 1
+                self.copied_bytes += f.size
+                rows.append((dest, os.stat(dest), md5))
+            if self.hash_cache is not None and rows:
+                self.hash_cache.store_many(rows)
+        return True
+
+    def run(
+        self,
+        submit: Callable[[list[str]], None],
+        stop: threading.Event,
+        on_status: Callable[[str], None] | None = None,
+    ) -> bool:
+        """Copy every folder, passing each to ``submit`` once it is on the drive.
+
+        Returns False if ``stop`` was set before the card was copied. Raises
+        OSError or RuntimeError (a different file of the same name on the
+        drive) on the first file that cannot be copied.
+        """
+        status = on_status or log_debug
+        names = scan_folder(self.source).subdirs
+        log_debug(f"Ingest: {len(names)} folder(s) from {self.source} to {self.dest_root}")
+        try:
+            for i, name in enumerate(names, 1):
+                status(f"Copying {name} from the card ({i}/{len(names)})…")
+                src, dest = os.path.join(self.source, name), os.path.join(self.dest_root, name)
+                if not self._copy_tree(src, dest, stop, True, name):
+                    return False
+                if self.tee is not None:
+                    self.tee.wait()
+                submit([name])
+            if not self._copy_tree(self.source, self.dest_root, stop, False):
+                return False
+        finally:
+            if self.hash_cache is not None:
+                self.hash_cache.close()
+            rate = self.copied_bytes / self.seconds / (1024 * 1024) if self.seconds > 0 else 0.0
+            log_debug(
+                f"Ingest: {self.copied} file(s) copied ({self.copied_bytes // (1024 * 1024)} MiB "
+                f"in {self.seconds:.1f}s, {rate:.0f} MiB/s), {self.skipped} already on the drive"
+            )
+            if self.tee is not None:
+                tee = self.tee
+                log_debug(
+                    f"Ingest: {tee.sent} file(s) streamed to S3 ({tee.sent_bytes // (1024 * 1024)} MiB), "
+                    f"{tee.left} left to the upload"
+                )
+        status(f"✅ Card copied to {self.dest_root}.")
+        return True
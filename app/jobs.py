@@ -0,0 +1,262 @@
+"""Queue of upload jobs across several drives and folders.
+
+Each submitted folder becomes an ``UploadJob`` run by its own ``UploadEngine``
+on a worker thread. At most ``max_jobs`` run at once, so one source can be
+scanned while another uploads, and every engine shares one ``ByteBudget``
+that caps the bytes in flight across all of them. Submitting a root that is
+already queued or running returns the existing job instead of a second
+one; jobs whose trees overlap (a drive and a folder on it) never run at
+the same time. Watch mode (app.watch) submits a root with the folders to
+upload; those queue behind a running job of the same root.
+"""
+
+import itertools
+import os
+import threading
+from dataclasses import dataclass, field
+from typing import Callable
+
+from app.config import parse_size
+from app.engine import (
+    ByteBudget,
+    ProgressCallback,
+    StatusCallback,
+    UploadEngine,
+    UploadMetadata,
+)
+from app.errors import UploadCancelled
+from app.log import log_debug
+from app.progress import Progress
+
+DEFAULT_MAX_JOBS = 2
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+ACTIVE_STATES = (QUEUED, RUNNING)
+
+
+def queue_limits(options: dict[str, str]) -> tuple[int, int | None]:
+    """MAX_JOBS and MAX_BYTES_IN_FLIGHT from bucket.conf."""
+    max_jobs = DEFAULT_MAX_JOBS
+    if options.get("max_jobs"):
+        try:
+            max_jobs = max(1, int(options["max_jobs"]))
+        except ValueError:
+            log_debug(f"Ignoring invalid MAX_JOBS={options['max_jobs']!r} in bucket.conf")
+    max_bytes = None
+    if options.get("max_bytes_in_flight"):
+        max_bytes = parse_size(options["max_bytes_in_flight"])
+        if max_bytes is None:
+            log_debug(
+                f"Ignoring invalid MAX_BYTES_IN_FLIGHT={options['max_bytes_in_flight']!r} in bucket.conf"
+            )
+    return max_jobs, max_bytes
+
+
+def normalize_root(folder: str) -> str:
+    return os.path.normcase(os.path.realpath(folder))
+
+
+def _overlaps(a: str, b: str) -> bool:
+    if a == b:
+        return True
+    a_dir, b_dir = a.rstrip(os.sep) + os.sep, b.rstrip(os.sep) + os.sep
+    return a.startswith(b_dir) or b.startswith(a_dir)
+
+
+@dataclass
+class UploadJob:
+    id: int
+    folder: str
+    root: str
+    meta: UploadMetadata
+    reconcile: bool = False
+    verify: bool = False
+    # Top-level folders to upload; None for the whole root.
+    folders: list[str] | None = None
+    state: str = QUEUED
+    message: str = "Queued"
+    progress: Progress | None = None
+    error: Exception | None = None
+    cancel_requested: bool = False
+    engine: UploadEngine | None = field(default=None, repr=False)
+
+    @property
+    def active(self) -> bool:
+        return self.state in ACTIVE_STATES
+
+
+EngineFactory = Callable[[UploadJob, StatusCallback, ProgressCallback], UploadEngine]
+JobCallback = Callable[[UploadJob], None]
+
+
+class UploadQueue:
+    """Runs upload jobs with a global cap on jobs and bytes in flight.
+
+    ``make_engine(job, on_status, on_progress)`` builds the engine for a job
+    with those callbacks, ``job.reconcile``, ``job.verify`` and
+    ``budget=queue.budget`` so that the byte cap is shared. ``on_update`` is called from worker threads
+    whenever a job's state, status or progress changes.
+    """
+
+    def __init__(
+        self,
+        make_engine: EngineFactory,
+        max_jobs: int = DEFAULT_MAX_JOBS,
+        max_bytes_in_flight: int | None = None,
+        on_update: JobCallback | None = None,
+    ):
+        self._make_engine = make_engine
+        self.max_jobs = max(1, max_jobs)
+        self.budget = ByteBudget(max_bytes_in_flight)
+        self._on_update = on_update
+        self._jobs: list[UploadJob] = []
+        self._threads: dict[int, threading.Thread] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    # -- submission --
+
+    def submit(
+        self,
+        folder: str,
+        meta: UploadMetadata,
+        reconcile: bool = False,
+        verify: bool = False,
+        folders: list[str] | None = None,
+    ) -> tuple[UploadJob, bool]:
+        """Queue ``folder`` (only its top-level ``folders``, if given); returns ``(job, merged)``.
+
+        If the same root is already queued or running, that job is returned
+        with ``merged`` True. Reconcile, verify and folder requests are folded
+        into a job that has not started yet. ``folders`` are not merged into
+        a running job, which may have scanned them before they changed; they
+        get a new job that waits for it.
+        """
+        root = normalize_root(folder)
+        with self._lock:
+            for job in self._jobs:
+                if not (job.active and job.root == root):
+                    continue
+                if job.state == QUEUED:
+                    job.reconcile = job.reconcile or reconcile
+                    job.verify = job.verify or verify
+                    if job.folders is not None:
+                        job.folders = None if folders is None else sorted({*job.folders, *folders})
+                elif folders is not None:
+                    continue
+                log_debug(f"Job {job.id}: {folder} is already {job.state}, not queued again")
+                return job, True
+            job = UploadJob(
+                id=next(self._ids), folder=folder, root=root, meta=meta, reconcile=reconcile, verify=verify,
+                folders=folders,
+            )
+            self._jobs.append(job)
+            log_debug(f"Job {job.id}: queued {folder}" + (f" ({', '.join(folders)})" if folders else ""))
+        self._notify(job)
+        self._dispatch()
+        return job, False
+
+    def jobs(self) -> list[UploadJob]:
+        with self._lock:
+            return list(self._jobs)
+
+    def get(self, job_id: int) -> UploadJob | None:
+        with self._lock:
+            return next((j for j in self._jobs if j.id == job_id), None)
+
+    @property
+    def busy(self) -> bool:
+        with self._lock:
+            return any(j.active for j in self._jobs)
+
+    # -- control --
+
+    def cancel(self, job_id: int) -> None:
+        with self._lock:
+            job = next((j for j in self._jobs if j.id == job_id), None)
+            if job is None or not job.active:
+                return
+            if job.state == QUEUED:
+                job.state, job.message = CANCELLED, "Cancelled"
+                engine = None
+            else:
+                job.cancel_requested = True
+                job.message = "Cancelling…"
+                engine = job.engine
+        if engine is not None:
+            engine.cancel()
+        self._notify(job)
+
+    def cancel_all(self) -> None:
+        for job in self.jobs():
+            self.cancel(job.id)
+
+    def wait(self) -> None:
+        """Block until every submitted job has finished."""
+        while True:
+            with self._lock:
+                threads = list(self._threads.values())
+            if not threads:
+                return
+            for t in threads:
+                t.join()
+
+    # -- running --
+
+    def _notify(self, job: UploadJob) -> None:
+        if self._on_update:
+            self._on_update(job)
+
+    def _dispatch(self) -> None:
+        started = []
+        with self._lock:
+            running = [j for j in self._jobs if j.state == RUNNING]
+            for job in self._jobs:
+                if len(running) >= self.max_jobs:
+                    break
+                if job.state != QUEUED or any(_overlaps(job.root, r.root) for r in running):
+                    continue
+                job.state, job.message = RUNNING, "Starting…"
+                running.append(job)
+                t = threading.Thread(target=self._run, args=(job,), daemon=True)
+                self._threads[job.id] = t
+                started.append((job, t))
+        for job, t in started:
+            self._notify(job)
+            t.start()
+
+    def _run(self, job: UploadJob) -> None:
+        def on_status(message: str) -> None:
+            job.message = message
+            self._notify(job)
+
+        def on_progress(p: Progress) -> None:
+            job.progress = p
+            self._notify(job)
+
+        try:
+            engine = self._make_engine(job, on_status, on_progress)
+            with self._lock:
+                job.engine = engine
+                cancelled = job.cancel_requested
+            if cancelled:
+                engine.cancel()
+            engine.upload_folder(job.folder, job.meta, job.folders)
+            job.state = DONE
+        except Exception as e:
+            log_debug(f"Job {job.id} failed: {e}")
+            job.error = e
+            job.state = CANCELLED if isinstance(e, UploadCancelled) else FAILED
+            job.message = "Cancelled" if job.state == CANCELLED else f"❌ {e}"
+        finally:
+            job.engine = None
+            self._notify(job)
+            # Start the next job before leaving _threads, so wait() never
+            # sees an empty queue in between.
+            self._dispatch()
+            with self._lock:
+                self._threads.pop(job.id, None)
@@ -0,0 +1,352 @@
+"""Local record of files confirmed uploaded, for delta uploads.
+
+Every file rclone confirms is recorded with its size, mtime and remote location.
+On the next run only files that are new or changed since then are handed to
+rclone, with ``--no-traverse`` when the delta is small, so the remote prefix
+does not have to be listed. ``reconcile`` re-syncs the ledger with an actual
+remote listing when it may have drifted (objects deleted server-side, a ledger
+copied from another laptop, …). The recorded MD5s double as an index of the
+content already on the remote, for deduplication (see app.dedup).
+"""
+
+import os
+import sqlite3
+import time
+from dataclasses import replace
+from typing import Callable, Iterable
+
+from app.log import log_debug
+from app.paths import _safe_makedirs, get_user_config_dir
+from app.scanner import FileEntry, FolderManifest
+
+LEDGER_FILENAME = "ledger.sqlite3"
+_SCHEMA_VERSION = 2
+
+# ``(folder, files) -> {name: md5}``, e.g. ``Hasher.md5s``.
+Md5Lookup = Callable[[str, list[FileEntry]], dict[str, str]]
+
+
+def default_ledger_path() -> str:
+    return os.path.join(get_user_config_dir(), LEDGER_FILENAME)
+
+
+def remote_dir_key(dest: str, relfolder: str) -> str:
+    """Remote folder for a manifest, e.g. ``minio:fielduploads/seabirds/DJI_001``."""
+    return f"{dest.rstrip('/')}/{relfolder}" if relfolder else dest.rstrip("/")
+
+
+def _like_escape(text: str) -> str:
+    """``text`` as a literal SQL LIKE prefix (with ``ESCAPE '\\'``)."""
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+class UploadLedger:
+    def __init__(self, path: str | None = None):
+        self.path = path or default_ledger_path()
+        _safe_makedirs(os.path.dirname(self.path))
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._init_schema()
+        self._has_remote_listing = False
+        self.adopted = 0
+
+    def _init_schema(self) -> None:
+        version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+        if version == 1:
+            self._conn.execute("ALTER TABLE uploads ADD COLUMN md5 TEXT")
+        elif version not in (0, _SCHEMA_VERSION):
+            self._conn.execute("DROP TABLE IF EXISTS uploads")
+        self._conn.executescript(
+            f"""
+            CREATE TABLE IF NOT EXISTS uploads (
+                remote_dir TEXT NOT NULL,
+                name TEXT NOT NULL,
+                local_path TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                uploaded_at REAL NOT NULL,
+                md5 TEXT,
+                PRIMARY KEY (remote_dir, name)
+            ) WITHOUT ROWID;
+            CREATE TEMP TABLE IF NOT EXISTS pending (
+                relpath TEXT PRIMARY KEY,
+                remote_dir TEXT NOT NULL,
+                name TEXT NOT NULL,
+                local_path TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                md5 TEXT,
+                copy_of TEXT,
+                done INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS uploads_md5 ON uploads (md5, size);
+            CREATE INDEX IF NOT EXISTS temp.pending_md5 ON pending (md5, size);
+            PRAGMA user_version = {_SCHEMA_VERSION};
+            """
+        )
+        self._conn.commit()
+
+    # -- planning --
+
+    def uploaded_in(self, remote_dir: str) -> dict[str, tuple[int, float, str | None]]:
+        """Return ``{name: (size, mtime, md5)}`` for files recorded under ``remote_dir``."""
+        return {
+            name: (size, mtime, md5)
+            for name, size, mtime, md5 in self._conn.execute(
+                "SELECT name, size, mtime, md5 FROM uploads WHERE remote_dir = ?", (remote_dir,),
+            )
+        }
+
+    def names_starting(self, remote_dir: str, prefix: str) -> list[str]:
+        """Names recorded under ``remote_dir`` that start with ``prefix`` (a primary-key range scan)."""
+        return [
+            name for (name,) in self._conn.execute(
+                "SELECT name FROM uploads WHERE remote_dir = ? AND name >= ? AND name < ?",
+                (remote_dir, prefix, prefix + "\U0010ffff"),
+            )
+        ]
+
+    def recorded(self, remote_dir: str, f: FileEntry) -> bool:
+        """True if ``f`` is recorded under ``remote_dir`` with its current size and mtime."""
+        row = self._conn.execute(
+            "SELECT size, mtime FROM uploads WHERE remote_dir = ? AND name = ?", (remote_dir, f.name),
+        ).fetchone()
+        return row is not None and tuple(row) == (f.size, f.mtime)
+
+    def filter_folder(
+        self,
+        dest: str,
+        manifest: FolderManifest,
+        md5s: Md5Lookup | None = None,
+        dedup_min_bytes: int | None = None,
+    ) -> FolderManifest:
+        """Return a copy of ``manifest`` without the files already uploaded.
+
+        Files left in the result are staged as pending, to be recorded once
+        rclone confirms them. With ``md5s``, the remaining files are hashed:
+        one whose content matches its record despite a new modtime is not
+        uploaded again, and the rest are recorded with their MD5.
+
+        With ``dedup_min_bytes`` as well, a file at least that large whose
+        content is already on the same remote (recorded under another name,
+        or pending earlier in this run) keeps its place in the result with
+        ``copy_of`` set to that object's path.
+        """
+        rdir = remote_dir_key(dest, manifest.relpath)
+        done = self.uploaded_in(rdir)
+        remote = self._remote_sizes(rdir) if self._has_remote_listing else {}
+        todo = []
+        adopt = []
+        for f in manifest.files:
+            prev = done.get(f.name)
+            if prev is not None and prev[0] == f.size and prev[1] == f.mtime:
+                continue
+            if remote.get(f.name) == f.size:
+                # Found by reconcile: already on the remote, record it.
+                adopt.append(f)
+                continue
+            todo.append(f)
+
+        hashes = md5s(manifest.path, todo) if md5s is not None and todo else {}
+        if hashes:
+            unchanged = [
+                f for f in todo
+                if (prev := done.get(f.name)) is not None
+                and prev[0] == f.size
+                and prev[2] is not None
+                and prev[2] == hashes.get(f.name)
+            ]
+            if unchanged:
+                # Only the modtime moved (copied between drives): keep the record.
+                adopt.extend(unchanged)
+                names = {f.name for f in unchanged}
+                todo = [f for f in todo if f.name not in names]
+            if dedup_min_bytes is not None:
+                todo = self._find_copies(rdir, todo, hashes, dedup_min_bytes)
+
+        now = time.time()
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO uploads (remote_dir, name, local_path, size, mtime, uploaded_at, md5) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (rdir, f.name, f.source or os.path.join(manifest.path, f.name), f.size, f.mtime, now,
+                     hashes.get(f.name))
+                    for f in adopt
+                ],
+            )
+            prefix = f"{manifest.relpath}/" if manifest.relpath else ""
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO pending (relpath, remote_dir, name, local_path, size, mtime, md5, copy_of) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        prefix + f.name, rdir, f.name, f.source or os.path.join(manifest.path, f.name),
+                        f.size, f.mtime, hashes.get(f.name), f.copy_of,
+                    )
+                    for f in todo
+                ],
+            )
+        self.adopted += len(adopt)
+        return FolderManifest(
+            path=manifest.path,
+            relpath=manifest.relpath,
+            files=todo,
+            has_yaml=manifest.has_yaml,
+            yaml_dir=manifest.yaml_dir,
+        )
+
+    def _find_copies(
+        self,
+        rdir: str,
+        files: list[FileEntry],
+        hashes: dict[str, str],
+        min_bytes: int,
+    ) -> list[FileEntry]:
+        """``files`` with ``copy_of`` set on those whose content is already on the remote."""
+        remote = rdir.partition(":")[0] + ":"
+        like = _like_escape(remote) + "%"
+        # Files of this folder planned for upload, not yet in the pending table.
+        planned: dict[tuple[str, int], str] = {}
+        result = []
+        for f in files:
+            md5 = hashes.get(f.name)
+            if md5 is None or f.source is not None or f.size < min_bytes:
+                result.append(f)
+                continue
+            row = self._conn.execute(
+                "SELECT remote_dir, name FROM uploads "
+                "WHERE md5 = ? AND size = ? AND remote_dir LIKE ? ESCAPE '\\' "
+                "AND NOT (remote_dir = ? AND name = ?) "
+                "ORDER BY uploaded_at DESC LIMIT 1",
+                (md5, f.size, like, rdir, f.name),
+            ).fetchone() or self._conn.execute(
+                "SELECT remote_dir, name FROM pending "
+                "WHERE md5 = ? AND size = ? AND copy_of IS NULL AND NOT (remote_dir = ? AND name = ?) LIMIT 1",
+                (md5, f.size, rdir, f.name),
+            ).fetchone()
+            source = f"{row[0]}/{row[1]}" if row is not None else planned.get((md5, f.size))
+            if source is None:
+                planned[(md5, f.size)] = f"{rdir}/{f.name}"
+                result.append(f)
+            else:
+                result.append(replace(f, copy_of=source))
+        return result
+
+    # -- recording --
+
+    def mark_done(self, relpath: str, prefix: str = "") -> None:
+        """Flag one pending file as confirmed by rclone (copied under ``prefix``, if any)."""
+        if prefix:
+            relpath = f"{prefix}/{relpath}"
+        self._conn.execute("UPDATE pending SET done = 1 WHERE relpath = ?", (relpath,))
+
+    def mark_list_done(self, list_path: str, prefix: str = "") -> None:
+        """Flag every file in a transfer list (one relative path per line) as confirmed.
+
+        ``prefix`` is the folder the list's entries were copied under, if any.
+        """
+        head = f"{prefix}/" if prefix else ""
+        with open(list_path, encoding="utf-8") as f:
+            self._conn.executemany(
+                "UPDATE pending SET done = 1 WHERE relpath = ?",
+                ((head + line.rstrip("\n"),) for line in f),
+            )
+
+    def commit_pending(self, all_done: bool) -> int:
+        """Move confirmed pending files into the ledger.
+
+        With ``all_done`` every pending file is recorded (rclone exited 0);
+        otherwise only those flagged done, and the rest stay pending.
+        """
+        where = "" if all_done else "WHERE done = 1"
+        with self._conn:
+            cur = self._conn.execute(
+                "INSERT OR REPLACE INTO uploads (remote_dir, name, local_path, size, mtime, uploaded_at, md5) "
+                f"SELECT remote_dir, name, local_path, size, mtime, ?, md5 FROM pending {where}",
+                (time.time(),),
+            )
+            n = cur.rowcount
+            self._conn.execute(f"DELETE FROM pending {where}")
+        return n
+
+    def forget(self, dest: str, relpaths: Iterable[str]) -> int:
+        """Drop the records of ``relpaths`` under ``dest`` so they are uploaded again."""
+        def keys():
+            for relpath in relpaths:
+                folder, _, name = relpath.rpartition("/")
+                yield remote_dir_key(dest, folder), name
+
+        with self._conn:
+            n = self._conn.executemany(
+                "DELETE FROM uploads WHERE remote_dir = ? AND name = ?", keys(),
+            ).rowcount
+        return n
+
+    # -- reconcile --
+
+    def _remote_sizes(self, remote_dir: str) -> dict[str, int]:
+        return dict(self._conn.execute(
+            "SELECT name, size FROM remote_listing WHERE remote_dir = ?", (remote_dir,),
+        ))
+
+    def reconcile(self, dest: str, listing: Iterable[tuple[str, int]]) -> tuple[int, int]:
+        """Re-sync the ledger for ``dest`` with a remote listing.
+
+        ``listing`` yields ``(relpath, size)`` for every object under ``dest``.
+        Ledger rows whose object is missing or has another size are dropped, so
+        those files are uploaded again. The listing is kept for this session so
+        that planning can adopt files that exist remotely but were never
+        recorded. Returns ``(kept, dropped)``.
+        """
+        base = dest.rstrip("/")
+        self._conn.executescript(
+            """
+            DROP TABLE IF EXISTS temp.remote_listing;
+            CREATE TEMP TABLE remote_listing (
+                remote_dir TEXT NOT NULL,
+                name TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                PRIMARY KEY (remote_dir, name)
+            );
+            """
+        )
+
+        def rows():
+            for relpath, size in listing:
+                folder, _, name = relpath.rpartition("/")
+                yield (f"{base}/{folder}" if folder else base, name, size)
+
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO remote_listing (remote_dir, name, size) VALUES (?, ?, ?)",
+                rows(),
+            )
+            like = _like_escape(base) + "/%"
+            dropped = self._conn.execute(
+                """
+                DELETE FROM uploads
+                WHERE (remote_dir = ? OR remote_dir LIKE ? ESCAPE '\\')
+                  AND NOT EXISTS (
+                      SELECT 1 FROM remote_listing r
+                      WHERE r.remote_dir = uploads.remote_dir
+                        AND r.name = uploads.name
+                        AND r.size = uploads.size
+                  )
+                """,
+                (base, like),
+            ).rowcount
+            kept = self._conn.execute(
+                "SELECT COUNT(*) FROM uploads WHERE remote_dir = ? OR remote_dir LIKE ? ESCAPE '\\'",
+                (base, like),
+            ).fetchone()[0]
+        self._has_remote_listing = True
+        log_debug(f"Ledger reconcile: {kept} record(s) confirmed, {dropped} dropped")
+        return kept, dropped
+
+    def close(self) -> None:
+        try:
+            self._conn.close()
+        except Exception:
+            pass
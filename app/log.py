@@ -0,0 +1,218 @@
+"""Debug log: console echo plus configs/debug.log.
+
+Callers only format a line and put it on a queue; one background thread
+writes batches of lines to the console and to the log file, which it keeps
+open, and rotates the file by size. Logging therefore never blocks an
+upload thread on disk I/O. If the queue is full (the disk stalls), lines are
+dropped and counted instead of blocking.
+
+Lines below the level in ``SEABEE_LOG_LEVEL`` (debug, info, warning, error;
+default info, or debug when ``SEABEE_RCLONE_DEBUG`` is set) are discarded
+before they are queued.
+"""
+
+import atexit
+import os
+import queue
+import sys
+import threading
+import time
+
+from app.paths import _safe_makedirs, get_user_config_dir
+
+DEBUG, INFO, WARNING, ERROR = 10, 20, 30, 40
+_LEVEL_NAMES = {"debug": DEBUG, "info": INFO, "warning": WARNING, "error": ERROR}
+
+LOG_FILENAME = "debug.log"
+# debug.log is rotated to debug.log.1 … debug.log.<_BACKUPS> past this size.
+_MAX_BYTES = 5 * 1024 * 1024
+_BACKUPS = 3
+_QUEUE_SIZE = 10000
+_BATCH_LINES = 500
+
+
+# ---------------------------------------------------------------------------
+# Logging
+# ---------------------------------------------------------------------------
+
+def _level_from_env() -> int:
+    name = os.environ.get("SEABEE_LOG_LEVEL", "").strip().lower()
+    if name in _LEVEL_NAMES:
+        return _LEVEL_NAMES[name]
+    return DEBUG if os.environ.get("SEABEE_RCLONE_DEBUG") else INFO
+
+
+def _debug_log_path() -> str | None:
+    try:
+        cfg_dir = get_user_config_dir()
+        if _safe_makedirs(cfg_dir):
+            return os.path.join(cfg_dir, LOG_FILENAME)
+    except Exception:
+        pass
+    try:
+        import tempfile
+        return os.path.join(tempfile.gettempdir(), "seabee-fielduploader-debug.log")
+    except Exception:
+        return None
+
+
+class _LogWriter:
+    """The single background thread that owns the console echo and the log file."""
+
+    def __init__(self):
+        self.level = _level_from_env()
+        self._queue: queue.Queue[tuple[float, str] | None] = queue.Queue(maxsize=_QUEUE_SIZE)
+        self._dropped = 0
+        self._dropped_lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self._start_lock = threading.Lock()
+        self._file = None
+        self._path: str | None = None
+        self._config_dir: str | None = None
+        self._size = 0
+
+    # -- producer side --
+
+    def submit(self, line: str) -> None:
+        if self._thread is None:
+            self._start()
+        try:
+            self._queue.put_nowait((time.time(), line))
+        except queue.Full:
+            with self._dropped_lock:
+                self._dropped += 1
+
+    def _start(self) -> None:
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="seabee-log", daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def flush(self, timeout: float = 5.0) -> None:
+        """Wait until every line queued so far has been written."""
+        if self._thread is None:
+            return
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=timeout)  # type: ignore[arg-type]
+        except queue.Full:
+            return
+        done.wait(timeout)
+
+    def close(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            return
+        try:
+            self._queue.put(None, timeout=2)
+        except queue.Full:
+            return
+        self._thread.join(timeout=5)
+
+    # -- writer thread --
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < _BATCH_LINES:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            lines: list[str] = []
+            stop = False
+            events = []
+            for item in batch:
+                if item is None:
+                    stop = True
+                elif isinstance(item, threading.Event):
+                    events.append(item)
+                else:
+                    ts, line = item
+                    lines.append(f"[{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(ts))}] {line}\n")
+            with self._dropped_lock:
+                dropped, self._dropped = self._dropped, 0
+            if dropped:
+                lines.append(f"[log] {dropped} line(s) dropped: log writer fell behind\n")
+            if lines:
+                self._write("".join(lines))
+            for event in events:
+                event.set()
+            if stop:
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
+                return
+
+    def _write(self, text: str) -> None:
+        try:
+            if sys.stdout is not None:
+                sys.stdout.write(text)
+                sys.stdout.flush()
+        except Exception:
+            pass
+        f = self._open_file()
+        if f is None:
+            return
+        try:
+            f.write(text)
+            f.flush()
+            self._size += len(text.encode("utf-8", "replace"))
+            if self._size >= _MAX_BYTES:
+                self._rotate()
+        except Exception:
+            pass
+
+    def _open_file(self):
+        # The config dir can be redirected at run time (SEABEE_CONFIG_DIR), so
+        # it is checked per batch; the directory is only created when it changes.
+        try:
+            config_dir = get_user_config_dir()
+        except Exception:
+            config_dir = None
+        if self._file is not None and config_dir == self._config_dir:
+            return self._file
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._config_dir = config_dir
+        self._path = _debug_log_path()
+        if not self._path:
+            return None
+        try:
+            self._file = open(self._path, "a", encoding="utf-8", errors="replace")
+            self._size = self._file.tell()
+        except Exception:
+            self._file = None
+        return self._file
+
+    def _rotate(self) -> None:
+        assert self._file is not None and self._path is not None
+        self._file.close()
+        self._file = None
+        for i in range(_BACKUPS, 0, -1):
+            src = self._path if i == 1 else f"{self._path}.{i - 1}"
+            try:
+                os.replace(src, f"{self._path}.{i}")
+            except OSError:
+                pass
+        self._config_dir = None  # reopen on the next batch
+
+
+_writer = _LogWriter()
+
+
+def log(message: str, level: int = INFO) -> None:
+    """Queue ``message`` for the console and debug.log if ``level`` passes the filter."""
+    if level >= _writer.level:
+        _writer.submit(message)
+
+
+def log_debug(message: str) -> None:
+    """Status and diagnostics that always go to the console and debug.log."""
+    log(message, INFO)
+
+
+def flush_log(timeout: float = 5.0) -> None:
+    """Block until every line logged so far has been written."""
+    _writer.flush(timeout)
@@ -0,0 +1,43 @@
+"""rclone ``--metadata-mapper`` for compressed uploads (see app.compress).
+
+rclone runs this once per object with a JSON description of it on stdin and
+takes the object's metadata from the JSON printed back. For an object staged
+by the compressor, the original's size and MD5 are added from its
+``.meta.json`` sidecar; anything else passes through unchanged.
+
+Run as a script (``python metamapper.py <staging root>``), so it must only
+import the standard library.
+"""
+
+import json
+import os
+import sys
+
+META_SUFFIX = ".meta.json"  # app.compress.META_SUFFIX
+
+
+def map_metadata(blob: dict, root: str) -> dict:
+    metadata = dict(blob.get("Metadata") or {})
+    remote = blob.get("Remote") or ""
+    try:
+        with open(os.path.join(root, *remote.split("/")) + META_SUFFIX, encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        meta = None
+    if isinstance(meta, dict) and meta.get("codec") not in (None, "none"):
+        metadata["seabee-original-size"] = str(meta["size"])
+        metadata["seabee-original-md5"] = str(meta["md5"])
+        metadata["seabee-encoding"] = str(meta["codec"])
+    return {"Metadata": metadata}
+
+
+def main() -> int:
+    if len(sys.argv) != 2:
+        print("usage: metamapper.py <staging root>", file=sys.stderr)
+        return 2
+    json.dump(map_metadata(json.load(sys.stdin), sys.argv[1]), sys.stdout)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
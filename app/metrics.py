@@ -0,0 +1,280 @@
+"""Per-run timing and counters for uploads.
+
+Every upload run gets a ``RunMetrics``: wall time per phase (moving root
+files, scanning, bundling small files, compression, checksums, writing
+YAML, uploading YAML, bulk upload, server-side copies of duplicates,
+verification) and counters such as files scanned, stat calls, bytes moved,
+bytes saved by deduplication and rclone retries, plus how long the first
+folder took to finish uploading. Phases nest; time
+spent in an inner phase is not counted in the outer one, so the phase times
+add up to the run's wall time.
+
+At the end of a run the record is written as JSON to ``configs/runs/`` and,
+if ``METRICS_TEXTFILE`` is set in bucket.conf, as a Prometheus textfile for
+node_exporter's textfile collector.
+"""
+
+import contextlib
+import datetime
+import itertools
+import json
+import os
+import re
+import threading
+import time
+from typing import Iterator
+
+from app.log import log_debug
+from app.paths import _safe_makedirs, get_user_config_dir
+from app.progress import format_bytes
+
+RUNS_DIRNAME = "runs"
+# Older run records beyond this many are deleted.
+MAX_RUN_RECORDS = 200
+
+PHASES = (
+    "reconcile", "package", "scan", "bundle", "compress", "checksum",
+    "write_yaml", "upload_yaml", "upload", "dedup", "verify",
+)
+COUNTERS = (
+    "folders_scanned",
+    "folders_cached",
+    "files_scanned",
+    "stat_calls",
+    "files_hashed",
+    "files_bundled",
+    "bundles_built",
+    "files_compressed",
+    "compress_bytes_saved",
+    "yaml_written",
+    "image_headers_read",
+    "files_planned",
+    "bytes_planned",
+    "files_skipped",
+    "files_uploaded",
+    "bytes_uploaded",
+    "folders_completed",
+    "files_deduplicated",
+    "dedup_bytes_saved",
+    "rclone_calls",
+    "rclone_retries",
+    "rclone_errors",
+)
+
+_PROM_PREFIX = "seabee_upload_"
+_prom_lock = threading.Lock()
+_run_ids = itertools.count(1)
+_LABEL_RE = re.compile(r'root="((?:[^"\\]|\\.)*)"')
+
+
+def metrics_textfile(options: dict[str, str]) -> str | None:
+    """METRICS_TEXTFILE in bucket.conf: where to write Prometheus metrics, if anywhere."""
+    path = options.get("metrics_textfile", "").strip()
+    return os.path.expanduser(path) if path else None
+
+
+def default_runs_dir() -> str:
+    return os.path.join(get_user_config_dir(), RUNS_DIRNAME)
+
+
+class RunMetrics:
+    """Phase timers and counters for one upload run. Not shared between threads."""
+
+    def __init__(self, folder: str = "", dest: str = "", backend: str = ""):
+        self.folder = folder
+        self.dest = dest
+        self.backend = backend
+        self.started = datetime.datetime.now(datetime.timezone.utc)
+        self.phases = {name: 0.0 for name in PHASES}
+        self.counters = {name: 0 for name in COUNTERS}
+        self.ok: bool | None = None
+        self.error: str | None = None
+        self.seconds = 0.0
+        # Run start to the first folder completely uploaded (scheduled uploads).
+        self.first_folder_seconds: float | None = None
+        self._t0 = time.monotonic()
+        self._stack: list[str] = []
+        self._since = self._t0
+
+    # -- recording --
+
+    def _charge(self, now: float) -> None:
+        if self._stack:
+            self.phases[self._stack[-1]] += now - self._since
+        self._since = now
+
+    @contextlib.contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Time the block as ``name``, pausing the enclosing phase meanwhile."""
+        self._charge(time.monotonic())
+        self._stack.append(name)
+        try:
+            yield
+        finally:
+            self._charge(time.monotonic())
+            self._stack.pop()
+
+    def count(self, name: str, n: int = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def folder_completed(self) -> None:
+        self.count("folders_completed")
+        if self.first_folder_seconds is None:
+            self.first_folder_seconds = time.monotonic() - self._t0
+
+    def finish(self, error: Exception | None = None) -> None:
+        self.seconds = time.monotonic() - self._t0
+        self.ok = error is None
+        self.error = str(error) if error is not None else None
+
+    # -- derived --
+
+    @property
+    def mb_per_s(self) -> float:
+        """Average bulk upload rate in MB/s (10^6 bytes)."""
+        seconds = self.phases["upload"]
+        return self.counters["bytes_uploaded"] / 1e6 / seconds if seconds > 0 else 0.0
+
+    def summary(self) -> str:
+        phases = ", ".join(f"{name} {s:.1f}s" for name, s in self.phases.items() if s >= 0.05)
+        text = f"{self.seconds:.1f}s ({phases or 'no phases'}), {self.mb_per_s:.1f} MB/s"
+        if self.first_folder_seconds is not None:
+            text += f", first folder done after {self.first_folder_seconds:.1f}s"
+        saved = self.counters["dedup_bytes_saved"]
+        if saved:
+            text += f", {format_bytes(saved)} saved by dedup"
+        return text
+
+    def as_dict(self) -> dict:
+        return {
+            "started": self.started.isoformat(),
+            "folder": self.folder,
+            "dest": self.dest,
+            "backend": self.backend,
+            "ok": self.ok,
+            "error": self.error,
+            "seconds": round(self.seconds, 3),
+            "phases": {name: round(s, 3) for name, s in self.phases.items()},
+            "counters": dict(self.counters),
+            "mb_per_s": round(self.mb_per_s, 2),
+            "first_folder_seconds": (
+                round(self.first_folder_seconds, 3) if self.first_folder_seconds is not None else None
+            ),
+        }
+
+    # -- export --
+
+    def write_json(self, runs_dir: str | None = None) -> str | None:
+        """Write the run record to ``configs/runs/`` and prune old records."""
+        runs_dir = runs_dir or default_runs_dir()
+        if not _safe_makedirs(runs_dir):
+            return None
+        name = f"run-{self.started.astimezone():%Y%m%d-%H%M%S}-{os.getpid()}-{next(_run_ids)}.json"
+        path = os.path.join(runs_dir, name)
+        try:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(self.as_dict(), f, indent=2, ensure_ascii=False)
+        except OSError as e:
+            log_debug(f"Could not write run record: {e}")
+            return None
+        _prune_runs(runs_dir)
+        return path
+
+    def _escaped_root(self) -> str:
+        return self.folder.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+    def prometheus_samples(self) -> dict[str, list[str]]:
+        """Sample lines by metric name, labelled with the upload root."""
+        label = f'root="{self._escaped_root()}"'
+        values: dict[str, list[tuple[str, str]]] = {
+            "last_run_timestamp_seconds": [(label, f"{self.started.timestamp():.0f}")],
+            "last_run_success": [(label, "1" if self.ok else "0")],
+            "duration_seconds": [(label, f"{self.seconds:.3f}")],
+            "phase_seconds": [(f'{label},phase="{name}"', f"{s:.3f}") for name, s in self.phases.items()],
+            "throughput_bytes_per_second": [(label, f"{self.mb_per_s * 1e6:.0f}")],
+        }
+        if self.first_folder_seconds is not None:
+            values["first_folder_seconds"] = [(label, f"{self.first_folder_seconds:.3f}")]
+        for name, value in self.counters.items():
+            values[name] = [(label, str(value))]
+        return {
+            _PROM_PREFIX + name: [f"{_PROM_PREFIX}{name}{{{labels}}} {value}" for labels, value in samples]
+            for name, samples in values.items()
+        }
+
+    def write_prometheus(self, path: str) -> None:
+        """Update ``path`` with this run's samples, keeping other roots' samples.
+
+        Written to a temporary file and renamed, so the collector never reads
+        a partial file.
+        """
+        new = self.prometheus_samples()
+        this_root = self._escaped_root()
+        with _prom_lock:
+            families: dict[str, list[str]] = {}
+            try:
+                with open(path, encoding="utf-8") as f:
+                    for line in f:
+                        line = line.rstrip("\n")
+                        if not line or line.startswith("#"):
+                            continue
+                        m = _LABEL_RE.search(line)
+                        if m is None or m.group(1) == this_root:
+                            continue
+                        families.setdefault(line.split("{", 1)[0], []).append(line)
+            except OSError:
+                pass
+            for name, lines in new.items():
+                families.setdefault(name, []).extend(lines)
+
+            tmp = f"{path}.{os.getpid()}.tmp"
+            _safe_makedirs(os.path.dirname(os.path.abspath(path)))
+            with open(tmp, "w", encoding="utf-8") as f:
+                for name in sorted(families):
+                    f.write(f"# TYPE {name} gauge\n")
+                    f.writelines(line + "\n" for line in families[name])
+            os.replace(tmp, path)
+
+    def save(self, textfile: str | None = None) -> str | None:
+        """Write the JSON record and, with ``textfile``, the Prometheus metrics."""
+        path = self.write_json()
+        if textfile:
+            try:
+                self.write_prometheus(textfile)
+            except OSError as e:
+                log_debug(f"Could not write metrics textfile {textfile}: {e}")
+        log_debug(f"Run: {self.summary()}" + (f" (record: {path})" if path else ""))
+        return path
+
+
+def recent_upload_rate(dest: str, runs_dir: str | None = None, min_bytes: int = 8 * 1024 * 1024) -> float | None:
+    """Bulk upload rate in bytes/s of the latest run to ``dest`` that moved at least ``min_bytes``."""
+    runs_dir = runs_dir or default_runs_dir()
+    try:
+        names = sorted((n for n in os.listdir(runs_dir) if n.startswith("run-") and n.endswith(".json")), reverse=True)
+    except OSError:
+        return None
+    for name in names[:50]:
+        try:
+            with open(os.path.join(runs_dir, name), encoding="utf-8") as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if record.get("dest") != dest or record.get("counters", {}).get("bytes_uploaded", 0) < min_bytes:
+            continue
+        rate = record.get("mb_per_s") or 0
+        if rate > 0:
+            return rate * 1e6
+    return None
+
+
+def _prune_runs(runs_dir: str) -> None:
+    try:
+        names = sorted(n for n in os.listdir(runs_dir) if n.startswith("run-") and n.endswith(".json"))
+    except OSError:
+        return
+    for name in names[:-MAX_RUN_RECORDS]:
+        try:
+            os.remove(os.path.join(runs_dir, name))
+        except OSError:
+            pass
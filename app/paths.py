@@ -0,0 +1,35 @@
+import os
+import sys
+
+APP_NAME = "SeaBee-FieldUploader"
+
+
+# ---------------------------------------------------------------------------
+# Paths
+# ---------------------------------------------------------------------------
+
+def get_app_root_dir() -> str:
+    """Return the repository / distribution root directory."""
+    if getattr(sys, "frozen", False):
+        return os.path.dirname(sys.executable)
+    return os.path.abspath(os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir))
+
+
+def get_resources_dir() -> str:
+    return os.path.join(get_app_root_dir(), "resources")
+
+
+def get_user_config_dir() -> str:
+    """Config lives in <app_root>/configs — portable, no surprises."""
+    override = os.environ.get("SEABEE_CONFIG_DIR")
+    if override:
+        return override
+    return os.path.join(get_app_root_dir(), "configs")
+
+
+def _safe_makedirs(path: str) -> bool:
+    try:
+        os.makedirs(path, exist_ok=True)
+        return True
+    except Exception:
+        return False
@@ -0,0 +1,321 @@
+"""Engine-generated transfer lists.
+
+The scan manifest already knows every file to upload, so rclone is handed
+explicit ``--files-from-raw`` lists instead of walking the drive itself. YAML
+files get their own list so they can be sent before the bulk data. Loose
+root files in a virtual package get a list of their own as well, since they
+are copied from the root to the package's remote folder, and so do staged
+files, which are copied from the staging folder: small-file bundles in one
+list, compressed copies in another, since only those need rclone's metadata
+mapper (one interpreter started per object). Files with the same content as
+an object already on the remote are not uploaded at all; they are listed as
+server-side copies.
+
+Each folder's place in the lists is recorded as a ``FolderWork``, so the
+lists can also be split flight by flight in any order (see app.schedule).
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+from array import array
+from dataclasses import dataclass, field
+from typing import Iterator
+
+from app.paths import get_user_config_dir
+from app.scanner import YAML_FILENAME, FileEntry, FolderManifest
+from app.tuning import SizeHistogram
+
+# Under the config dir: files made for upload (bundles, compressed copies),
+# one tree per destination, mirroring the upload root's folders.
+STAGING_DIRNAME = "staging"
+
+
+def staging_root(dest: str) -> str:
+    digest = hashlib.sha1(dest.rstrip("/").encode("utf-8")).hexdigest()[:16]
+    return os.path.join(get_user_config_dir(), STAGING_DIRNAME, digest)
+
+
+# The transfer lists, in the order they are copied.
+_ROOT, _DATA, _STAGED, _COMPRESSED = range(4)
+
+
+@dataclass
+class Batch:
+    index: int
+    list_path: str
+    nfiles: int
+    nbytes: int
+    # Entries are names at the upload root, to be copied under this remote folder.
+    remote_prefix: str = ""
+    # Local folder the entries are relative to, if not the upload root.
+    source: str | None = None
+    # Entries are compressed copies, uploaded through the metadata mapper.
+    compressed: bool = False
+    # Folders whose last planned file is in this batch (per-folder batches only).
+    completes: list[str] = field(default_factory=list)
+
+
+@dataclass
+class FolderWork:
+    """One folder's share of the plan."""
+    relpath: str  # remote folder, relative to the destination
+    nfiles: int = 0
+    nbytes: int = 0
+    newest: float = 0.0  # modtime of the newest planned file
+    ncopies: int = 0  # server-side copies, made after the transfer lists
+    # Per transfer list: [byte offset, first line, number of lines]. A
+    # folder's entries in one list are always consecutive.
+    spans: dict[int, list[int]] = field(default_factory=dict)
+
+
+@dataclass
+class Copy:
+    """A file to copy on the remote from ``source``, an object with the same content."""
+    relpath: str  # like a transfer list entry: under ``remote_prefix``, or the upload root
+    remote_prefix: str
+    source: str
+    size: int
+
+
+class TransferPlan:
+    """Ordered list of files (relative to the upload root) to hand to rclone.
+
+    Entries are streamed to temporary list files as folders are added, so
+    the paths are never held in memory. What is kept grows slowly with the
+    drive: one 8-byte size per planned file (to split the lists into
+    batches) and one ``FolderWork`` per folder.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self._dir = tempfile.mkdtemp(prefix="seabee-plan-")
+        self.yaml_list_path = os.path.join(self._dir, "yaml.lst")
+        self.data_list_path = os.path.join(self._dir, "data.lst")
+        self.root_list_path = os.path.join(self._dir, "root.lst")
+        self.staged_list_path = os.path.join(self._dir, "staged.lst")
+        self.compressed_list_path = os.path.join(self._dir, "compressed.lst")
+        self.copies_path = os.path.join(self._dir, "copies.jsonl")
+        self._yaml_f = open(self.yaml_list_path, "w", encoding="utf-8", newline="\n")
+        self._data_f = open(self.data_list_path, "w", encoding="utf-8", newline="\n")
+        self._root_f = open(self.root_list_path, "w", encoding="utf-8", newline="\n")
+        self._staged_f = open(self.staged_list_path, "w", encoding="utf-8", newline="\n")
+        self._compressed_f = open(self.compressed_list_path, "w", encoding="utf-8", newline="\n")
+        self._copies_f = open(self.copies_path, "w", encoding="utf-8", newline="\n")
+        self.nyaml = 0
+        # The virtual package of loose root files, if any: its remote folder
+        # and, once its YAML exists, the local folder holding that YAML.
+        self.virtual_prefix: str | None = None
+        self.virtual_yaml_dir: str | None = None
+        # Where files with a ``source`` (see ``staging_root``) are staged.
+        self.staged_root: str | None = None
+        self.nstaged = 0
+        self.nfiles = 0
+        self.nbytes = 0
+        self.nskipped = 0  # files left out because the ledger has them
+        self.ncopies = 0  # files copied server-side instead of uploaded
+        self.copy_bytes = 0
+        self.histogram = SizeHistogram()
+        self._sizes = array("q")  # parallel to the lines of the data list
+        self._root_sizes = array("q")  # parallel to the lines of the root list
+        self._staged_sizes = array("q")  # parallel to the lines of the staged list
+        self._compressed_sizes = array("q")  # parallel to the lines of the compressed list
+        self._lists = (self._root_f, self._data_f, self._staged_f, self._compressed_f)
+        self._list_sizes = (self._root_sizes, self._sizes, self._staged_sizes, self._compressed_sizes)
+        self._list_bytes = [0, 0, 0, 0]
+        self.folders: list[FolderWork] = []
+
+    def add_folder(self, manifest: FolderManifest) -> None:
+        if manifest.nfiles == 0:
+            return
+        if manifest.is_virtual:
+            self._add_virtual(manifest)
+            return
+        prefix = f"{manifest.relpath}/" if manifest.relpath else ""
+        if manifest.has_yaml:
+            self._yaml_f.write(f"{prefix}{YAML_FILENAME}\n")
+            self.nyaml += 1
+        work = FolderWork(manifest.relpath)
+        for f in manifest.files:
+            if f.copy_of is not None:
+                self._add_copy(prefix + f.name, "", f)
+                work.ncopies += 1
+            elif f.source is not None:
+                self._add_file(work, _COMPRESSED if f.compressed else _STAGED, prefix + f.name, f)
+                self.nstaged += 1
+            else:
+                self._add_file(work, _DATA, prefix + f.name, f)
+        self.folders.append(work)
+
+    def _add_virtual(self, manifest: FolderManifest) -> None:
+        self.virtual_prefix = manifest.relpath
+        if manifest.has_yaml:
+            self.virtual_yaml_dir = manifest.yaml_dir
+        work = FolderWork(manifest.relpath)
+        for f in manifest.files:
+            if f.copy_of is not None:
+                self._add_copy(f.name, manifest.relpath, f)
+                work.ncopies += 1
+            else:
+                self._add_file(work, _ROOT, f.name, f)
+        self.folders.append(work)
+
+    def _add_file(self, work: FolderWork, which: int, entry: str, f: FileEntry) -> None:
+        line = entry + "\n"
+        sizes = self._list_sizes[which]
+        span = work.spans.setdefault(which, [self._list_bytes[which], len(sizes), 0])
+        span[2] += 1
+        self._lists[which].write(line)
+        self._list_bytes[which] += len(line.encode("utf-8"))
+        sizes.append(f.size)
+        self.histogram.add(f.size)
+        work.nfiles += 1
+        work.nbytes += f.size
+        work.newest = max(work.newest, f.mtime)
+        self.nfiles += 1
+        self.nbytes += f.size
+
+    def _add_copy(self, relpath: str, remote_prefix: str, f: FileEntry) -> None:
+        self._copies_f.write(json.dumps([relpath, remote_prefix, f.copy_of, f.size]) + "\n")
+        self.ncopies += 1
+        self.copy_bytes += f.size
+
+    def finish(self) -> None:
+        self._yaml_f.close()
+        self._data_f.close()
+        self._root_f.close()
+        self._staged_f.close()
+        self._compressed_f.close()
+        self._copies_f.close()
+
+    def copies(self) -> Iterator[Copy]:
+        """The planned server-side copies, in plan order."""
+        self.finish()
+        with open(self.copies_path, encoding="utf-8") as f:
+            for line in f:
+                yield Copy(*json.loads(line))
+
+    def batches(self, max_bytes: int, folders: list[FolderWork] | None = None) -> Iterator[Batch]:
+        """Split the transfer lists, in order, into lists of about ``max_bytes`` each.
+
+        The virtual package's root files come first, then the data, staged
+        bundles and compressed copies. With ``folders`` (``self.folders`` in
+        another order), batches go folder by folder instead; see
+        ``_folder_batches``. Each batch file is removed once the next one is
+        requested.
+        """
+        if folders is not None:
+            yield from self._folder_batches(max_bytes, folders)
+            return
+        self.finish()
+        index = 0
+        for which, (list_path, prefix, source) in enumerate(self._list_sources()):
+            sizes = self._list_sizes[which]
+            compressed = which == _COMPRESSED
+            out = None
+            path = ""
+            nfiles = nbytes = 0
+            with open(list_path, encoding="utf-8") as f:
+                for i, line in enumerate(f):
+                    if out is None:
+                        index += 1
+                        path = os.path.join(self._dir, f"batch{index:04d}.lst")
+                        out = open(path, "w", encoding="utf-8", newline="\n")
+                        nfiles = nbytes = 0
+                    out.write(line)
+                    nfiles += 1
+                    nbytes += sizes[i]
+                    if nbytes >= max_bytes:
+                        out.close()
+                        out = None
+                        yield Batch(index, path, nfiles, nbytes, prefix, source, compressed)
+                        os.remove(path)
+            if out is not None:
+                out.close()
+                yield Batch(index, path, nfiles, nbytes, prefix, source, compressed)
+                os.remove(path)
+
+    def _list_sources(self) -> tuple[tuple[str, str, str | None], ...]:
+        """``(list path, remote prefix, source)`` of each transfer list, by index."""
+        return (
+            (self.root_list_path, self.virtual_prefix or "", None),
+            (self.data_list_path, "", None),
+            (self.staged_list_path, "", self.staged_root),
+            (self.compressed_list_path, "", self.staged_root),
+        )
+
+    def _folder_batches(self, max_bytes: int, folders: list[FolderWork]) -> Iterator[Batch]:
+        """Batches that finish each folder before starting the next.
+
+        Small folders share a batch, but a folder only joins a batch if it
+        fits in it whole; larger folders get batches of their own. A
+        folder's data comes before its staged files, which need batches of
+        their own (another source; compressed copies apart from bundles).
+        ``Batch.completes`` names the folders finished by each batch, except
+        folders with server-side copies still to make.
+        """
+        self.finish()
+        lists = self._list_sources()
+        readers = [open(path, "rb") for path, _, _ in lists]
+        index = 0
+        out = None
+        path = ""
+        kind = _DATA
+        nfiles = nbytes = 0
+        completes: list[str] = []
+
+        def batch() -> Batch:
+            out.close()
+            _, prefix, source = lists[kind]
+            return Batch(index, path, nfiles, nbytes, prefix, source, kind == _COMPRESSED, completes)
+
+        try:
+            for work in folders:
+                for which, (offset, first, count) in sorted(work.spans.items()):
+                    sizes = self._list_sizes[which]
+                    if out is not None and (which != kind or nbytes + sum(sizes[first:first + count]) > max_bytes):
+                        yield batch()
+                        out = None
+                        os.remove(path)
+                    reader = readers[which]
+                    reader.seek(offset)
+                    last = first + count - 1
+                    for i in range(first, first + count):
+                        if out is None:
+                            index += 1
+                            path = os.path.join(self._dir, f"batch{index:04d}.lst")
+                            out = open(path, "wb")
+                            kind = which
+                            nfiles = nbytes = 0
+                            completes = []
+                        out.write(reader.readline())
+                        nfiles += 1
+                        nbytes += sizes[i]
+                        if nbytes >= max_bytes and i < last:
+                            yield batch()
+                            out = None
+                            os.remove(path)
+                if out is not None and work.ncopies == 0:
+                    completes.append(work.relpath)
+            if out is not None:
+                yield batch()
+                out = None
+                os.remove(path)
+        finally:
+            if out is not None:
+                out.close()
+            for reader in readers:
+                reader.close()
+
+    def cleanup(self) -> None:
+        self.finish()
+        for name in os.listdir(self._dir):
+            try:
+                os.remove(os.path.join(self._dir, name))
+            except OSError:
+                pass
+        try:
+            os.rmdir(self._dir)
+        except OSError:
+            pass
@@ -0,0 +1,109 @@
+"""Machine-readable upload progress.
+
+rclone reports the same stats structure in ``--use-json-log`` output and from
+the rc ``core/stats`` call; both are turned into a ``Progress``. Workers push
+events onto a ``ProgressQueue`` and the UI drains it at its own pace, keeping
+only the latest snapshot, so a burst of rclone output never backs up the UI.
+"""
+
+import queue
+from dataclasses import dataclass, field
+
+
+@dataclass
+class Transfer:
+    name: str
+    percentage: int
+    speed: float  # bytes/s
+
+
+@dataclass
+class Progress:
+    bytes: int = 0
+    total_bytes: int = 0
+    speed: float = 0.0  # bytes/s
+    eta: float | None = None  # seconds, None when unknown
+    transfers: int = 0
+    total_transfers: int = 0
+    errors: int = 0
+    transferring: list[Transfer] = field(default_factory=list)
+
+    @classmethod
+    def from_rclone_stats(cls, stats: dict) -> "Progress":
+        return cls(
+            bytes=int(stats.get("bytes") or 0),
+            total_bytes=int(stats.get("totalBytes") or 0),
+            speed=float(stats.get("speed") or 0.0),
+            eta=stats.get("eta"),
+            transfers=int(stats.get("transfers") or 0),
+            total_transfers=int(stats.get("totalTransfers") or 0),
+            errors=int(stats.get("errors") or 0),
+            transferring=[
+                Transfer(
+                    name=t.get("name", ""),
+                    percentage=int(t.get("percentage") or 0),
+                    speed=float(t.get("speed") or 0.0),
+                )
+                for t in stats.get("transferring") or []
+            ],
+        )
+
+
+# ---------------------------------------------------------------------------
+# Formatting
+# ---------------------------------------------------------------------------
+
+def format_bytes(n: float) -> str:
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if abs(n) < 1024:
+            return f"{n:.3f} {unit}" if unit != "B" else f"{int(n)} B"
+        n /= 1024
+    return f"{n:.3f} TiB"
+
+
+def format_eta(seconds: float | None) -> str:
+    if seconds is None:
+        return "-"
+    seconds = int(seconds)
+    h, rem = divmod(seconds, 3600)
+    m, s = divmod(rem, 60)
+    if h:
+        return f"{h}h{m}m{s}s"
+    if m:
+        return f"{m}m{s}s"
+    return f"{s}s"
+
+
+# ---------------------------------------------------------------------------
+# Queue
+# ---------------------------------------------------------------------------
+
+class ProgressQueue:
+    """Thread-safe hand-off from upload threads to a UI loop.
+
+    ``status`` and ``progress`` are coalesced on drain: only the latest of each
+    matters. Other events (``done``, ``failed``, …) are returned in order.
+    """
+
+    def __init__(self):
+        self._q: queue.SimpleQueue = queue.SimpleQueue()
+
+    def put(self, kind: str, payload: object = None) -> None:
+        self._q.put((kind, payload))
+
+    def drain(self) -> tuple[str | None, Progress | None, list[tuple[str, object]]]:
+        status: str | None = None
+        progress: Progress | None = None
+        events: list[tuple[str, object]] = []
+        while True:
+            try:
+                kind, payload = self._q.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "status":
+                status = payload  # type: ignore[assignment]
+            elif kind == "progress":
+                progress = payload  # type: ignore[assignment]
+            else:
+                events.append((kind, payload))
+        return status, progress, events
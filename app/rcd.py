@@ -0,0 +1,251 @@
+"""Long-lived ``rclone rcd`` backend.
+
+One rclone daemon is started per session and driven over its HTTP remote
+control API, so consecutive jobs reuse the parsed config and warm S3
+connections. Progress comes from ``core/stats`` instead of scraped terminal
+output, and ``job/stop`` cancels a running job.
+"""
+
+import base64
+import json
+import os
+import secrets
+import socket
+import subprocess
+import threading
+import time
+import urllib.error
+from typing import TYPE_CHECKING, Callable
+
+from app.bandwidth import BandwidthSchedule, BandwidthScheduler
+from app.config import format_command_for_display
+from app.errors import UploadCancelled
+from app.log import log_debug
+
+if TYPE_CHECKING:
+    from app.s3native import NativeS3
+
+_POLL_INTERVAL_S = 0.5
+_STARTUP_TIMEOUT_S = 15.0
+
+
+def free_port() -> int:
+    """A TCP port on localhost that nothing is listening on right now."""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class RcloneDaemon:
+    """A running ``rclone rcd`` bound to localhost with a random password."""
+
+    backend = "rcd"
+
+    def __init__(self, rclone_exe: str, rclone_conf: str):
+        self.rclone_exe = rclone_exe
+        self.rclone_conf = rclone_conf
+        self._process: subprocess.Popen | None = None
+        self._url = ""
+        self._auth = ""
+        self._lock = threading.Lock()
+        self._bw_lock = threading.Lock()
+        self._bw_scheduler: BandwidthScheduler | None = None
+        self._bw_users = 0
+
+    # -- lifecycle --
+
+    def start(self) -> None:
+        if self._process is not None and self._process.poll() is None:
+            return
+        port = free_port()
+        user, password = "seabee", secrets.token_hex(16)
+        command = [
+            self.rclone_exe, "rcd",
+            "--config", self.rclone_conf,
+            "--rc-addr", f"127.0.0.1:{port}",
+        ]
+        log_debug("rclone: " + format_command_for_display(command))
+
+        debug = bool(os.environ.get("SEABEE_RCLONE_DEBUG"))
+        # Credentials go in the environment: the command line is visible to
+        # every local user, and the rc API can dump the S3 keys.
+        self._process = subprocess.Popen(
+            command,
+            env=dict(os.environ, RCLONE_RC_USER=user, RCLONE_RC_PASS=password),
+            stdout=None if debug else subprocess.DEVNULL,
+            stderr=None if debug else subprocess.DEVNULL,
+        )
+        self._url = f"http://127.0.0.1:{port}/"
+        self._auth = "Basic " + base64.b64encode(f"{user}:{password}".encode()).decode()
+
+        deadline = time.monotonic() + _STARTUP_TIMEOUT_S
+        while True:
+            if self._process.poll() is not None:
+                raise RuntimeError(f"rclone rcd exited with code {self._process.returncode}")
+            try:
+                self.call("rc/noop")
+                return
+            except (urllib.error.URLError, ConnectionError):
+                if time.monotonic() > deadline:
+                    self.stop()
+                    raise RuntimeError("rclone rcd did not start in time")
+                time.sleep(0.1)
+
+    def stop(self) -> None:
+        process = self._process
+        if process is None:
+            return
+        if process.poll() is None:
+            try:
+                self._post("core/quit", None)
+            except Exception:
+                pass
+            try:
+                process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        self._process = None
+
+    def __enter__(self) -> "RcloneDaemon":
+        self.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    # -- rc API --
+
+    def _post(self, method: str, params: dict | None) -> dict:
+        # Imported here: urllib.request pulls in http.client, email and ssl,
+        # which the GUI does not need until the first upload.
+        import urllib.request
+
+        req = urllib.request.Request(
+            self._url + method,
+            data=json.dumps(params or {}).encode("utf-8"),
+            headers={"Content-Type": "application/json", "Authorization": self._auth},
+            method="POST",
+        )
+        try:
+            with urllib.request.urlopen(req, timeout=60) as resp:
+                return json.loads(resp.read() or b"{}")
+        except urllib.error.HTTPError as e:
+            try:
+                detail = json.loads(e.read()).get("error", "")
+            except Exception:
+                detail = ""
+            raise RuntimeError(f"rclone rc {method} failed: {detail or e}") from None
+
+    def call(self, method: str, params: dict | None = None) -> dict:
+        with self._lock:
+            if self._process is None or self._process.poll() is not None:
+                raise RuntimeError("rclone rcd is not running")
+            return self._post(method, params)
+
+    def set_bwlimit(self, rate: str) -> None:
+        """Change the bandwidth cap of every running and future job, e.g. ``1M`` or ``off``."""
+        self.call("core/bwlimit", {"rate": rate})
+
+    def hold_bwlimit(self, schedule: BandwidthSchedule) -> None:
+        """Keep the daemon's cap on ``schedule`` until the matching ``release_bwlimit``.
+
+        The cap is global to the daemon, so concurrent uploads share one
+        scheduler; the first schedule wins until the last holder releases it.
+        """
+        with self._bw_lock:
+            self._bw_users += 1
+            if self._bw_scheduler is None:
+                self._bw_scheduler = BandwidthScheduler(schedule, self.set_bwlimit)
+                self._bw_scheduler.start()
+
+    def release_bwlimit(self) -> None:
+        with self._bw_lock:
+            self._bw_users = max(0, self._bw_users - 1)
+            if self._bw_users == 0 and self._bw_scheduler is not None:
+                self._bw_scheduler.stop()
+                self._bw_scheduler = None
+
+    # -- jobs --
+
+    def copy_file(self, src_fs: str, src_remote: str, dst_fs: str, dst_remote: str) -> None:
+        """Copy one file synchronously (skipped by rclone if already identical)."""
+        self.call("operations/copyfile", {
+            "srcFs": src_fs, "srcRemote": src_remote,
+            "dstFs": dst_fs, "dstRemote": dst_remote,
+        })
+
+    def delete_file(self, fs: str, remote: str) -> None:
+        """Delete one object synchronously."""
+        self.call("operations/deletefile", {"fs": fs, "remote": remote})
+
+    def start_copy(
+        self,
+        source: str,
+        dest: str,
+        files_from: str,
+        no_traverse: bool = False,
+        config: dict | None = None,
+    ) -> int:
+        """Start an async ``sync/copy`` of the files listed in ``files_from``; returns the job id.
+
+        ``config`` holds extra global options for this job only (e.g. ``Transfers``).
+        """
+        result = self.call("sync/copy", {
+            "srcFs": source,
+            "dstFs": dest,
+            "_async": True,
+            "_config": {"NoTraverse": no_traverse, **(config or {})},
+            "_filter": {"FilesFromRaw": [files_from]},
+        })
+        return int(result["jobid"])
+
+    def stop_job(self, jobid: int) -> None:
+        self.call("job/stop", {"jobid": jobid})
+
+    def wait_job(
+        self,
+        jobid: int,
+        on_stats: Callable[[dict], None] | None = None,
+        on_file_done: Callable[[str], None] | None = None,
+        should_stop: Callable[[], bool] | None = None,
+    ) -> None:
+        """Poll a job until it finishes, reporting ``core/stats`` for its group.
+
+        Raises RuntimeError if the job fails or is stopped.
+        """
+        group = f"job/{jobid}"
+        stop_sent = False
+        while True:
+            if should_stop and should_stop() and not stop_sent:
+                self.stop_job(jobid)
+                stop_sent = True
+            status = self.call("job/status", {"jobid": jobid})
+            if on_stats:
+                on_stats(self.call("core/stats", {"group": group}))
+            if on_file_done:
+                # Only the most recent completions are returned; reporting a
+                # file twice is harmless.
+                done = self.call("core/transferred", {"group": group}).get("transferred") or []
+                for t in done:
+                    name = t.get("name", "")
+                    if name and not t.get("error") and not t.get("checked"):
+                        on_file_done(name)
+            if status.get("finished"):
+                if stop_sent:
+                    raise UploadCancelled("Upload cancelled")
+                if not status.get("success"):
+                    raise RuntimeError(f"rclone job failed: {status.get('error') or 'unknown error'}")
+                return
+            time.sleep(_POLL_INTERVAL_S)
+
+
+def open_backend(backend: str, rclone_exe: str, rclone_conf: str) -> "RcloneDaemon | NativeS3 | None":
+    """The session backend for RCLONE_BACKEND ``backend``; None for one rclone process per transfer."""
+    if backend == "rcd":
+        return RcloneDaemon(rclone_exe, rclone_conf)
+    if backend == "native":
+        # Imported here: only sessions using it need asyncio and the S3 client.
+        from app.s3native import NativeS3
+
+        return NativeS3(rclone_conf)
+    return None
@@ -0,0 +1,1072 @@
+"""In-process S3 backend on asyncio (``RCLONE_BACKEND=native``).
+
+A drop-in for ``RcloneDaemon``: the engine drives it through the same job
+API (``start_copy``/``wait_job``/``copy_file``), but files go straight to
+S3 from this process instead of through rclone. Credentials and endpoint
+come from the remote's section of rclone.conf (``[minio]``), so nothing
+else has to be configured.
+
+One aiobotocore client per remote lives on a private event loop thread for
+the whole session, keeping its pooled keep-alive connections warm between
+batches. Files up to ``MULTIPART_THRESHOLD`` go up in one request; larger
+ones in parts, or, on a remote without multipart, in one request read from
+the file as it is sent (S3 takes at most 5 GiB that way). A multipart
+upload's ID and every finished part's ETag are committed to
+``multipart.sqlite3`` in the config dir, so after a crash or a pulled cable
+the next run resumes a multi-GB video at the part where it stopped instead
+of starting over. Objects get rclone's ``mtime`` and
+``md5chksum`` metadata, so rclone sees them as if it had uploaded them.
+``open_stream`` uploads a file from chunks the caller reads itself, which
+lets SD-card ingest (app.ingest) send the card's bytes as it copies them.
+
+Listings, verification and copies from other remotes still use rclone.
+Needs ``pip install aiobotocore``. Works against MinIO or ``moto_server``;
+``rclone serve s3`` has no multipart support, which the remote's
+``use_multipart_uploads = false`` turns off here as it does in rclone.
+"""
+
+import asyncio
+import base64
+import concurrent.futures
+import configparser
+import contextlib
+import datetime
+import hashlib
+import itertools
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable
+
+from app.bandwidth import BandwidthSchedule
+from app.config import parse_size
+from app.errors import UploadCancelled
+from app.hashing import HashCache, hash_file
+from app.log import log_debug
+from app.metamapper import map_metadata
+from app.paths import _safe_makedirs, get_user_config_dir
+
+MULTIPART_FILENAME = "multipart.sqlite3"
+_SCHEMA_VERSION = 1
+
+MULTIPART_THRESHOLD = 64 * 1024 * 1024
+_MIN_PART_BYTES = 5 * 1024 * 1024
+_MAX_PARTS = 10000
+# CopyObject's and a single PUT's limit; larger duplicates are uploaded again instead.
+_MAX_COPY_BYTES = 5 * 1024 ** 3
+# Request bodies held in memory at once, across all transfers.
+_MAX_BUFFER_BYTES = 256 * 1024 * 1024
+# Interrupted multipart uploads older than this are aborted, not resumed.
+_MAX_RESUME_AGE_S = 7 * 24 * 3600
+_POLL_INTERVAL_S = 0.5
+# How long a stream may hold up its reader, in all, before giving up on the file.
+_MAX_STREAM_STALL_S = 10.0
+
+
+def _import_aiobotocore():
+    try:
+        from aiobotocore.config import AioConfig
+        from aiobotocore.session import get_session
+    except ImportError:
+        raise RuntimeError("RCLONE_BACKEND=native needs aiobotocore: pip install aiobotocore") from None
+    return get_session, AioConfig
+
+
+def _chunk_size(options: dict[str, str]) -> int:
+    """The remote's ``chunk_size`` (rclone syntax, e.g. ``32Mi``) in bytes; 5 MiB if unset or invalid."""
+    raw = options.get("chunk_size", "")
+    size = parse_size(raw) if raw else None
+    if raw and size is None:
+        log_debug(f"Native S3: ignoring invalid chunk_size={raw!r}")
+    return size or _MIN_PART_BYTES
+
+
+def parse_remote_path(path: str) -> tuple[str, dict[str, str], str, str]:
+    """``minio,chunk_size=8Mi:bucket/a/b/`` -> (``minio``, {chunk_size: 8Mi}, ``bucket``, ``a/b/``)."""
+    remote, sep, rest = path.partition(":")
+    if not sep:
+        raise RuntimeError(f"not an rclone remote path: {path!r}")
+    name, *params = remote.split(",")
+    options = {}
+    for p in params:
+        key, _, value = p.partition("=")
+        options[key.strip()] = value.strip()
+    bucket, _, key = rest.lstrip("/").partition("/")
+    if not bucket:
+        raise RuntimeError(f"no bucket in {path!r}")
+    return name, options, bucket, key
+
+
+def _join_key(prefix: str, rel: str) -> str:
+    return f"{prefix.rstrip('/')}/{rel}" if prefix.strip("/") else rel
+
+
+def _format_mtime(mtime_ns: int) -> str:
+    """Modtime the way rclone stores it in ``X-Amz-Meta-Mtime``."""
+    return f"{mtime_ns // 10 ** 9}.{mtime_ns % 10 ** 9:09d}"
+
+
+def _remote_md5(head: dict) -> str | None:
+    """MD5 of an object from its HEAD: the ETag of a single-part upload, else ``md5chksum``."""
+    etag = (head.get("ETag") or "").strip('"')
+    if etag and "-" not in etag:
+        return etag.lower()
+    chksum = (head.get("Metadata") or {}).get("md5chksum")
+    if chksum:
+        try:
+            return base64.b64decode(chksum).hex()
+        except ValueError:
+            return None
+    return None
+
+
+def _error_code(e: Exception) -> str:
+    response = getattr(e, "response", None)
+    return str(((response or {}).get("Error") or {}).get("Code", "")) if isinstance(response, dict) else ""
+
+
+def _part_size(size: int, chunk_size: int) -> int:
+    """Part size for a ``size``-byte file: ``chunk_size``, grown to stay within S3's part count."""
+    part = max(chunk_size, _MIN_PART_BYTES)
+    needed = -(-size // _MAX_PARTS)
+    if needed > part:
+        part = -(-needed // (1024 * 1024)) * 1024 * 1024
+    return part
+
+
+def _read_range(path: str, offset: int, length: int) -> tuple[bytes, str]:
+    """``length`` bytes of ``path`` from ``offset`` and their base64 MD5 (for Content-MD5)."""
+    with open(path, "rb") as f:
+        f.seek(offset)
+        data = f.read(length)
+    if len(data) != length:
+        raise RuntimeError(f"{path} changed while uploading")
+    return data, base64.b64encode(hashlib.md5(data).digest()).decode("ascii")
+
+
+@dataclass
+class S3Remote:
+    """Connection settings of one ``type = s3`` section of rclone.conf."""
+    name: str
+    endpoint: str | None = None
+    region: str | None = None
+    access_key_id: str | None = None
+    secret_access_key: str | None = None
+    path_style: bool = True
+    multipart: bool = True
+
+
+def load_s3_remote(rclone_conf: str, name: str) -> S3Remote:
+    parser = configparser.ConfigParser(interpolation=None)
+    try:
+        with open(rclone_conf, encoding="utf-8") as f:
+            text = f.read()
+    except OSError as e:
+        raise RuntimeError(f"Cannot read {rclone_conf}: {e}") from None
+    if text.lstrip().startswith("RCLONE_ENCRYPT_"):
+        raise RuntimeError("RCLONE_BACKEND=native cannot read an encrypted rclone.conf")
+    parser.read_string(text)
+    if not parser.has_section(name):
+        raise RuntimeError(f"No [{name}] section in {rclone_conf}")
+    section = parser[name]
+    if section.get("type", "").strip() != "s3":
+        raise RuntimeError(f"[{name}] in {rclone_conf} is not an S3 remote")
+    env_auth = section.get("env_auth", "false").strip().lower() == "true"
+    return S3Remote(
+        name=name,
+        endpoint=section.get("endpoint", "").strip() or None,
+        region=section.get("region", "").strip() or None,
+        access_key_id=None if env_auth else section.get("access_key_id", "").strip() or None,
+        secret_access_key=None if env_auth else section.get("secret_access_key", "").strip() or None,
+        path_style=section.get("force_path_style", "true").strip().lower() != "false",
+        multipart=section.get("use_multipart_uploads", "true").strip().lower() != "false",
+    )
+
+
+# ---------------------------------------------------------------------------
+# Multipart resume state
+# ---------------------------------------------------------------------------
+
+@dataclass
+class MultipartRecord:
+    upload_id: str
+    local_path: str
+    size: int
+    mtime_ns: int
+    part_size: int
+    started_at: float
+
+
+def default_multipart_path() -> str:
+    return os.path.join(get_user_config_dir(), MULTIPART_FILENAME)
+
+
+class MultipartStore:
+    """Upload IDs and finished part ETags of multipart uploads still in progress."""
+
+    def __init__(self, path: str | None = None):
+        self.path = path or default_multipart_path()
+        _safe_makedirs(os.path.dirname(self.path))
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._init_schema()
+
+    def _init_schema(self) -> None:
+        version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+        if version not in (0, _SCHEMA_VERSION):
+            self._conn.execute("DROP TABLE IF EXISTS uploads")
+            self._conn.execute("DROP TABLE IF EXISTS parts")
+        self._conn.executescript(
+            f"""
+            CREATE TABLE IF NOT EXISTS uploads (
+                remote TEXT NOT NULL,
+                bucket TEXT NOT NULL,
+                key TEXT NOT NULL,
+                upload_id TEXT NOT NULL,
+                local_path TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                part_size INTEGER NOT NULL,
+                started_at REAL NOT NULL,
+                PRIMARY KEY (remote, bucket, key)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS parts (
+                upload_id TEXT NOT NULL,
+                part_number INTEGER NOT NULL,
+                etag TEXT NOT NULL,
+                PRIMARY KEY (upload_id, part_number)
+            ) WITHOUT ROWID;
+            PRAGMA user_version = {_SCHEMA_VERSION};
+            """
+        )
+        self._conn.commit()
+
+    def lookup(self, remote: str, bucket: str, key: str) -> MultipartRecord | None:
+        row = self._conn.execute(
+            "SELECT upload_id, local_path, size, mtime_ns, part_size, started_at FROM uploads "
+            "WHERE remote = ? AND bucket = ? AND key = ?",
+            (remote, bucket, key),
+        ).fetchone()
+        return MultipartRecord(*row) if row else None
+
+    def begin(self, remote: str, bucket: str, key: str, record: MultipartRecord) -> None:
+        with self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO uploads "
+                "(remote, bucket, key, upload_id, local_path, size, mtime_ns, part_size, started_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (remote, bucket, key, record.upload_id, record.local_path, record.size,
+                 record.mtime_ns, record.part_size, record.started_at),
+            )
+
+    def parts(self, upload_id: str) -> dict[int, str]:
+        return dict(self._conn.execute(
+            "SELECT part_number, etag FROM parts WHERE upload_id = ?", (upload_id,),
+        ))
+
+    def add_part(self, upload_id: str, part_number: int, etag: str) -> None:
+        # Committed per part: a part is only worth something if it survives a crash.
+        with self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO parts (upload_id, part_number, etag) VALUES (?, ?, ?)",
+                (upload_id, part_number, etag),
+            )
+
+    def forget(self, remote: str, bucket: str, key: str, upload_id: str) -> None:
+        with self._conn:
+            self._conn.execute(
+                "DELETE FROM uploads WHERE remote = ? AND bucket = ? AND key = ?", (remote, bucket, key),
+            )
+            self._conn.execute("DELETE FROM parts WHERE upload_id = ?", (upload_id,))
+
+    def close(self) -> None:
+        try:
+            self._conn.close()
+        except Exception:
+            pass
+
+
+# ---------------------------------------------------------------------------
+# Flow control
+# ---------------------------------------------------------------------------
+
+class _RateLimiter:
+    """Spaces request bodies out to the cap returned by ``rate()`` (bytes/s, None for none)."""
+
+    def __init__(self, rate: Callable[[], float | None]):
+        self._rate = rate
+        self._next = 0.0
+
+    async def take(self, nbytes: int) -> None:
+        rate = self._rate()
+        if not rate:
+            return
+        now = time.monotonic()
+        start = max(now, self._next)
+        self._next = start + nbytes / rate
+        if start > now:
+            await asyncio.sleep(start - now)
+
+
+class _ByteGate:
+    """Bounds the bytes of request bodies held in memory."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._used = 0
+        self._cond = asyncio.Condition()
+
+    async def acquire(self, nbytes: int) -> int:
+        nbytes = min(nbytes, self.limit)
+        async with self._cond:
+            await self._cond.wait_for(lambda: self._used + nbytes <= self.limit)
+            self._used += nbytes
+        return nbytes
+
+    async def release(self, nbytes: int) -> None:
+        async with self._cond:
+            self._used -= nbytes
+            self._cond.notify_all()
+
+
+# ---------------------------------------------------------------------------
+# Jobs
+# ---------------------------------------------------------------------------
+
+@dataclass
+class _Job:
+    source: str
+    remote: str
+    bucket: str
+    prefix: str
+    files: list[str]
+    transfers: int = 4
+    chunk_size: int = _MIN_PART_BYTES
+    upload_concurrency: int = 4
+    checksum: bool = False
+    mapper_root: str | None = None
+    started: float = field(default_factory=time.monotonic)
+    total_bytes: int = 0
+    bytes: int = 0
+    transfers_done: int = 0
+    errors: int = 0
+    failed: list[str] = field(default_factory=list)
+    # name -> (bytes sent, size) of files in flight
+    transferring: dict[str, list[int]] = field(default_factory=dict)
+    done: list[str] = field(default_factory=list)
+    lock: threading.Lock = field(default_factory=threading.Lock)
+    task: concurrent.futures.Future | None = None
+    stopped: bool = False
+
+    def sent(self, name: str, nbytes: int) -> None:
+        self.bytes += nbytes
+        entry = self.transferring.get(name)
+        if entry is not None:
+            entry[0] += nbytes
+
+    def finished(self, name: str, uploaded: bool) -> None:
+        self.transferring.pop(name, None)
+        if uploaded:
+            self.transfers_done += 1
+            with self.lock:
+                self.done.append(name)
+
+    def drain_done(self) -> list[str]:
+        with self.lock:
+            done, self.done = self.done, []
+        return done
+
+    def stats(self) -> dict:
+        """Progress in the shape of rclone's ``core/stats``."""
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        speed = self.bytes / elapsed
+        remaining = max(0, self.total_bytes - self.bytes)
+        return {
+            "bytes": self.bytes,
+            "totalBytes": self.total_bytes,
+            "speed": speed,
+            "eta": int(remaining / speed) if speed > 0 and self.total_bytes else None,
+            "transfers": self.transfers_done,
+            "totalTransfers": len(self.files),
+            "errors": self.errors,
+            "transferring": [
+                {
+                    "name": name,
+                    "percentage": int(100 * sent / size) if size else 0,
+                    "speed": sent / elapsed,
+                }
+                for name, (sent, size) in list(self.transferring.items())
+            ],
+        }
+
+
+# ---------------------------------------------------------------------------
+# Streams
+# ---------------------------------------------------------------------------
+
+class StreamUpload:
+    """One object uploaded from chunks read elsewhere (see ``NativeS3.open_stream``).
+
+    Parts go up on the backend's loop while the caller keeps reading; once
+    ``concurrency`` parts are in flight, ``write`` waits for one. The stream
+    gives up, aborting what it sent, if a request fails or it has held the
+    reader up for ``_MAX_STREAM_STALL_S`` in all; nothing is resumed, the
+    file is left to a normal upload. A multipart object gets its
+    ``md5chksum``, unknown until the last chunk, by being copied onto itself.
+    """
+
+    def __init__(
+        self, backend: "NativeS3", remote: str, bucket: str, key: str, size: int, mtime_ns: int,
+        part_size: int | None, concurrency: int,
+    ):
+        self._backend = backend
+        self.remote = remote
+        self.bucket = bucket
+        self.key = key
+        self.size = size
+        self._metadata = {"mtime": _format_mtime(mtime_ns)}
+        # None: the whole file in one request.
+        self._part_size = part_size
+        self._concurrency = concurrency
+        self._buf = bytearray()
+        self._next_part = 1
+        self._parts: dict[int, str] = {}
+        # (future, bytes it holds) of requests not yet reaped
+        self._pending: list[tuple[concurrent.futures.Future, int]] = []
+        self._created: concurrent.futures.Future | None = None
+        # Seconds the reader has waited for parts to go up
+        self._stalled = 0.0
+        self.error: str | None = None
+
+    @property
+    def in_flight(self) -> int:
+        """Bytes buffered or still being sent."""
+        self._reap()
+        return len(self._buf) + sum(n for _, n in self._pending)
+
+    def write(self, chunk) -> bool:
+        """Add the next ``chunk`` of the file; False once the stream has given up."""
+        if self.error is None:
+            self._buf += chunk
+            while self._part_size and len(self._buf) >= self._part_size and self.error is None:
+                self._send_part(bytes(self._buf[:self._part_size]))
+                del self._buf[:self._part_size]
+        return self.error is None
+
+    def finish(self, md5: str) -> concurrent.futures.Future | None:
+        """Send the rest of the file, whose MD5 is ``md5`` (hex).
+
+        Returns a future that completes once the object is in place, or None
+        if the stream has given up.
+        """
+        if self.error is None and self._part_size:
+            if self._buf or self._next_part == 1:
+                self._send_part(bytes(self._buf))
+            self._buf = bytearray()
+        held = self.in_flight
+        if self.error is not None:
+            return None
+        content_md5 = base64.b64encode(bytes.fromhex(md5)).decode("ascii")
+        if self._part_size:
+            parts = [f for f, _ in self._pending]
+            future = self._schedule(self._complete(parts, content_md5))
+        else:
+            data, self._buf = bytes(self._buf), bytearray()
+            future = self._schedule(self._put(data, content_md5))
+        # The parts' bytes are only released when the whole object is done.
+        self._pending = [(future, held)]
+        return future
+
+    def abort(self, reason: str) -> None:
+        """Give up on the stream, aborting a multipart upload already begun."""
+        if self.error is not None:
+            return
+        self.error = reason
+        self._buf = bytearray()
+        log_debug(f"Native S3: stopped streaming {self.key}: {reason}")
+        if self._created is not None:
+            self._schedule(self._abort())
+
+    def _schedule(self, coro) -> concurrent.futures.Future:
+        loop = self._backend._loop
+        if loop is None:
+            coro.close()
+            raise RuntimeError("Native S3 backend is not running")
+        return asyncio.run_coroutine_threadsafe(coro, loop)
+
+    def _reap(self) -> None:
+        still = []
+        for future, nbytes in self._pending:
+            if not future.done():
+                still.append((future, nbytes))
+            elif self.error is None and (future.cancelled() or future.exception() is not None):
+                self.abort("upload cancelled" if future.cancelled() else f"upload failed: {future.exception()}")
+        self._pending = still
+
+    def _send_part(self, data: bytes) -> None:
+        self._reap()
+        if self.error is not None:
+            return
+        while len(self._pending) >= self._concurrency:
+            if self._stalled >= _MAX_STREAM_STALL_S:
+                self.abort("the upload fell behind the reader")
+                return
+            started = time.monotonic()
+            concurrent.futures.wait(
+                [f for f, _ in self._pending], _MAX_STREAM_STALL_S - self._stalled, concurrent.futures.FIRST_COMPLETED,
+            )
+            self._stalled += time.monotonic() - started
+            self._reap()
+            if self.error is not None:
+                return
+        if self._created is None:
+            self._created = self._schedule(self._create())
+        n, self._next_part = self._next_part, self._next_part + 1
+        self._pending.append((self._schedule(self._upload_part(n, data)), len(data)))
+
+    async def _create(self) -> str:
+        client = await self._backend._client(self.remote)
+        resp = await client.create_multipart_upload(Bucket=self.bucket, Key=self.key, Metadata=self._metadata)
+        return resp["UploadId"]
+
+    async def _upload_part(self, n: int, data: bytes) -> None:
+        client = await self._backend._client(self.remote)
+        upload_id = await asyncio.wrap_future(self._created)
+        await self._backend._limiter.take(len(data))
+        content_md5 = base64.b64encode(hashlib.md5(data).digest()).decode("ascii")
+        resp = await client.upload_part(
+            Bucket=self.bucket, Key=self.key, UploadId=upload_id, PartNumber=n, Body=data, ContentMD5=content_md5,
+        )
+        self._parts[n] = resp["ETag"]
+
+    async def _put(self, data: bytes, content_md5: str) -> None:
+        client = await self._backend._client(self.remote)
+        await self._backend._limiter.take(len(data))
+        await client.put_object(
+            Bucket=self.bucket, Key=self.key, Body=data, ContentMD5=content_md5,
+            Metadata=dict(self._metadata, md5chksum=content_md5),
+        )
+
+    async def _complete(self, parts: list[concurrent.futures.Future], content_md5: str) -> None:
+        client = await self._backend._client(self.remote)
+        try:
+            await asyncio.gather(*(asyncio.wrap_future(f) for f in parts))
+            upload_id = await asyncio.wrap_future(self._created)
+            etags = [{"PartNumber": n, "ETag": self._parts[n]} for n in sorted(self._parts)]
+            await client.complete_multipart_upload(
+                Bucket=self.bucket, Key=self.key, UploadId=upload_id, MultipartUpload={"Parts": etags},
+            )
+        except BaseException:
+            await self._abort()
+            raise
+        await client.copy_object(
+            Bucket=self.bucket, Key=self.key, CopySource={"Bucket": self.bucket, "Key": self.key},
+            Metadata=dict(self._metadata, md5chksum=content_md5), MetadataDirective="REPLACE",
+        )
+
+    async def _abort(self) -> None:
+        try:
+            client = await self._backend._client(self.remote)
+            upload_id = await asyncio.wrap_future(self._created)
+            await client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=upload_id)
+        except Exception as e:
+            log_debug(f"Native S3: could not abort streamed upload of {self.key}: {e}")
+
+
+class NativeS3:
+    """Uploads to the S3 remotes of ``rclone_conf`` from an in-process event loop."""
+
+    backend = "native"
+
+    def __init__(self, rclone_conf: str):
+        self.rclone_conf = rclone_conf
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._thread: threading.Thread | None = None
+        self._clients: dict[str, object] = {}
+        self._remotes: dict[str, S3Remote] = {}
+        self._clients_lock: asyncio.Lock | None = None
+        self._exit_stack: contextlib.AsyncExitStack | None = None
+        self._store: MultipartStore | None = None
+        self._hash_cache: HashCache | None = None
+        self._jobs: dict[int, _Job] = {}
+        self._job_ids = itertools.count(1)
+        self._gate: _ByteGate | None = None
+        self._limiter = _RateLimiter(self._rate)
+        self._fixed_rate: float | None = None
+        self._schedules: list[BandwidthSchedule] = []
+
+    # -- lifecycle --
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        _import_aiobotocore()
+        self._store = MultipartStore()
+        self._hash_cache = HashCache()
+        self._exit_stack = contextlib.AsyncExitStack()
+        self._clients_lock = asyncio.Lock()
+        self._gate = _ByteGate(_MAX_BUFFER_BYTES)
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="seabee-s3", daemon=True)
+        self._thread.start()
+        log_debug("Native S3 backend started")
+
+    def stop(self) -> None:
+        loop = self._loop
+        if loop is None:
+            return
+        try:
+            self._run(self._close(), timeout=10)
+        except Exception as e:
+            log_debug(f"Native S3 backend did not shut down cleanly: {e}")
+        loop.call_soon_threadsafe(loop.stop)
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        loop.close()
+        self._loop = self._thread = None
+        self._clients.clear()
+        self._jobs.clear()
+        for db in (self._store, self._hash_cache):
+            if db is not None:
+                db.close()
+        self._store = self._hash_cache = None
+
+    async def _close(self) -> None:
+        # Includes jobs already cancelled from another thread but still unwinding.
+        tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self._exit_stack is not None:
+            await self._exit_stack.aclose()
+            self._exit_stack = None
+
+    def __enter__(self) -> "NativeS3":
+        self.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def _run(self, coro, timeout: float | None = None):
+        """Run ``coro`` on the backend's loop and wait for its result."""
+        if self._loop is None:
+            coro.close()
+            raise RuntimeError("Native S3 backend is not running")
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result(timeout)
+
+    async def _client(self, name: str):
+        async with self._clients_lock:
+            client = self._clients.get(name)
+            if client is None:
+                client = self._clients[name] = await self._connect(name)
+            return client
+
+    async def _connect(self, name: str):
+        get_session, AioConfig = _import_aiobotocore()
+        remote = self._remotes[name] = load_s3_remote(self.rclone_conf, name)
+        config = AioConfig(
+            max_pool_connections=64,
+            tcp_keepalive=True,
+            retries={"max_attempts": 5, "mode": "standard"},
+            s3={"addressing_style": "path" if remote.path_style else "virtual"},
+        )
+        client = await self._exit_stack.enter_async_context(get_session().create_client(
+            "s3",
+            endpoint_url=remote.endpoint,
+            region_name=remote.region or "us-east-1",
+            aws_access_key_id=remote.access_key_id,
+            aws_secret_access_key=remote.secret_access_key,
+            config=config,
+        ))
+        log_debug(f"Native S3: connected to [{name}] at {remote.endpoint or 'AWS'}")
+        return client
+
+    # -- bandwidth --
+
+    def _rate(self) -> float | None:
+        if self._schedules:
+            return self._schedules[0].bytes_per_s_at(datetime.datetime.now())
+        return self._fixed_rate
+
+    def set_bwlimit(self, rate: str) -> None:
+        """Cap uploads at ``rate`` (rclone syntax, e.g. ``1M`` or ``off``)."""
+        self._fixed_rate = BandwidthSchedule(rate).bytes_per_s_at(datetime.datetime.now())
+
+    def hold_bwlimit(self, schedule: BandwidthSchedule) -> None:
+        """Follow ``schedule`` until the matching ``release_bwlimit``; the first one held wins."""
+        self._schedules.append(schedule)
+
+    def release_bwlimit(self) -> None:
+        if self._schedules:
+            self._schedules.pop()
+
+    # -- jobs --
+
+    def copy_file(self, src_fs: str, src_remote: str, dst_fs: str, dst_remote: str) -> None:
+        """Copy one file synchronously, from a local folder or server-side within the remote."""
+        name, _, bucket, prefix = parse_remote_path(dst_fs)
+        key = _join_key(prefix, dst_remote)
+        src_name = src_fs.partition(":")[0].split(",")[0]
+        try:
+            if ":" in src_fs and src_name == name:
+                _, _, src_bucket, src_prefix = parse_remote_path(src_fs)
+                self._run(self._server_side_copy(name, src_bucket, _join_key(src_prefix, src_remote), bucket, key))
+                return
+            # A one-letter "remote" is a Windows drive.
+            if ":" in src_fs and len(src_name) > 1:
+                raise RuntimeError(f"Native S3 backend cannot copy from {src_fs}")
+            job = _Job(source=src_fs, remote=name, bucket=bucket, prefix="", files=[key])
+            self._run(self._upload_file(job, key, os.path.join(src_fs, *src_remote.split("/"))))
+        except (RuntimeError, OSError):
+            raise
+        except Exception as e:
+            raise RuntimeError(f"S3 copy of {src_remote} failed: {e}") from None
+
+    def delete_file(self, fs: str, remote: str) -> None:
+        """Delete one object synchronously."""
+        name, _, bucket, prefix = parse_remote_path(fs)
+        key = _join_key(prefix, remote)
+        try:
+            self._run(self._delete(name, bucket, key))
+        except Exception as e:
+            raise RuntimeError(f"S3 delete of {key} failed: {e}") from None
+
+    def open_stream(self, fs: str, remote: str, size: int, mtime_ns: int) -> StreamUpload | None:
+        """Start uploading ``remote`` under ``fs`` from chunks passed to the stream's ``write``.
+
+        Returns None for a file that cannot be streamed: one over CopyObject's
+        5 GiB, or over ``MULTIPART_THRESHOLD`` on a remote without multipart.
+        """
+        name, options, bucket, prefix = parse_remote_path(fs)
+        self._run(self._client(name))
+        multipart = size > MULTIPART_THRESHOLD
+        if size > _MAX_COPY_BYTES or (multipart and not self._remotes[name].multipart):
+            return None
+        part_size = _part_size(size, _chunk_size(options)) if multipart else None
+        concurrency = max(1, int(options.get("upload_concurrency", 4)))
+        return StreamUpload(self, name, bucket, _join_key(prefix, remote), size, mtime_ns, part_size, concurrency)
+
+    def start_copy(
+        self,
+        source: str,
+        dest: str,
+        files_from: str,
+        no_traverse: bool = False,
+        config: dict | None = None,
+    ) -> int:
+        """Start uploading the files listed in ``files_from``; returns the job id.
+
+        ``config`` takes the rc options the engine passes to rcd (``Transfers``,
+        ``CheckSum``, ``MetadataMapper``); S3 options come from ``dest``.
+        """
+        config = config or {}
+        name, options, bucket, prefix = parse_remote_path(dest)
+        with open(files_from, encoding="utf-8") as f:
+            files = [line.rstrip("\n") for line in f if line.strip()]
+        mapper = config.get("MetadataMapper")
+        job = _Job(
+            source=source,
+            remote=name,
+            bucket=bucket,
+            prefix=prefix,
+            files=files,
+            transfers=max(1, int(config.get("Transfers") or 4)),
+            chunk_size=_chunk_size(options),
+            upload_concurrency=max(1, int(options.get("upload_concurrency", 4))),
+            checksum=bool(config.get("CheckSum")),
+            mapper_root=mapper[-1] if mapper else None,
+        )
+        jobid = next(self._job_ids)
+        self._jobs[jobid] = job
+        if self._loop is None:
+            raise RuntimeError("Native S3 backend is not running")
+        job.task = asyncio.run_coroutine_threadsafe(self._run_job(job), self._loop)
+        return jobid
+
+    def stop_job(self, jobid: int) -> None:
+        job = self._jobs.get(jobid)
+        if job is not None and job.task is not None:
+            job.stopped = True
+            job.task.cancel()
+
+    def wait_job(
+        self,
+        jobid: int,
+        on_stats: Callable[[dict], None] | None = None,
+        on_file_done: Callable[[str], None] | None = None,
+        should_stop: Callable[[], bool] | None = None,
+    ) -> None:
+        """Wait for a job, reporting rclone-style stats; raises RuntimeError if it fails or is stopped."""
+        job = self._jobs[jobid]
+        try:
+            while True:
+                if should_stop and should_stop() and not job.stopped:
+                    self.stop_job(jobid)
+                finished = job.task.done()
+                if on_stats:
+                    on_stats(job.stats())
+                if on_file_done:
+                    for name in job.drain_done():
+                        on_file_done(name)
+                if finished:
+                    break
+                time.sleep(_POLL_INTERVAL_S)
+        finally:
+            self._jobs.pop(jobid, None)
+        if job.stopped or job.task.cancelled():
+            raise UploadCancelled("Upload cancelled")
+        error = job.task.exception()
+        if isinstance(error, RuntimeError):
+            raise error
+        if error is not None:
+            raise RuntimeError(f"Native S3 upload failed: {error}") from None
+        if job.failed:
+            raise RuntimeError(f"{len(job.failed)} file(s) failed to upload, e.g. {job.failed[0]}")
+
+    # -- transfers --
+
+    async def _run_job(self, job: _Job) -> None:
+        loop = asyncio.get_running_loop()
+        paths = [os.path.join(job.source, *rel.split("/")) for rel in job.files]
+        sizes = await loop.run_in_executor(None, _sizes, paths)
+        job.total_bytes = sum(sizes)
+        pending = iter(zip(job.files, paths))
+
+        async def worker() -> None:
+            for rel, path in pending:
+                try:
+                    await self._upload_file(job, rel, path)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    job.errors += 1
+                    job.failed.append(rel)
+                    job.transferring.pop(rel, None)
+                    log_debug(f"Native S3: {rel} failed: {e}")
+
+        await _run_all(worker() for _ in range(min(job.transfers, len(job.files)) or 1))
+
+    async def _upload_file(self, job: _Job, rel: str, path: str) -> None:
+        """Upload ``path`` as ``rel`` under the job's prefix, unless the object is already there."""
+        loop = asyncio.get_running_loop()
+        client = await self._client(job.remote)
+        key = _join_key(job.prefix, rel)
+        st = await loop.run_in_executor(None, os.stat, path)
+        metadata = {"mtime": _format_mtime(st.st_mtime_ns)}
+        if job.mapper_root:
+            metadata = map_metadata({"Remote": rel, "Metadata": metadata}, job.mapper_root)["Metadata"]
+
+        head = await self._head(client, job.bucket, key)
+        md5 = None
+        if head is not None and head.get("ContentLength") == st.st_size:
+            remote_md5 = _remote_md5(head)
+            if not job.checksum and _same_mtime(head, st):
+                job.finished(rel, uploaded=False)
+                return
+            if remote_md5:
+                md5 = await self._md5(path, st)
+                if md5 == remote_md5:
+                    job.finished(rel, uploaded=False)
+                    return
+
+        job.transferring[rel] = [0, st.st_size]
+        if st.st_size <= MULTIPART_THRESHOLD:
+            await self._put_single(client, job, rel, path, st, key, metadata)
+        elif self._remotes[job.remote].multipart:
+            await self._put_multipart(client, job, rel, path, st, key, metadata, md5)
+        else:
+            await self._put_streamed(client, job, rel, path, st, key, metadata, md5)
+        job.finished(rel, uploaded=True)
+
+    async def _put_single(self, client, job: _Job, rel: str, path: str, st, key: str, metadata: dict) -> None:
+        loop = asyncio.get_running_loop()
+        held = await self._gate.acquire(st.st_size)
+        try:
+            data, content_md5 = await loop.run_in_executor(None, _read_range, path, 0, st.st_size)
+            metadata = dict(metadata, md5chksum=content_md5)
+            await self._limiter.take(len(data))
+            await client.put_object(
+                Bucket=job.bucket, Key=key, Body=data, ContentMD5=content_md5, Metadata=metadata,
+            )
+        finally:
+            await self._gate.release(held)
+        job.sent(rel, st.st_size)
+
+    async def _put_streamed(
+        self, client, job: _Job, rel: str, path: str, st, key: str, metadata: dict, md5: str | None,
+    ) -> None:
+        """One request for a file too big to hold in memory, on a remote without multipart.
+
+        The body is read from the file as it is sent, so only the MD5 needs
+        a pass of its own (usually from the hash cache).
+        """
+        if st.st_size > _MAX_COPY_BYTES:
+            raise RuntimeError(
+                f"{rel} is over 5 GiB, the most S3 takes in one request; "
+                "set use_multipart_uploads = true for this remote"
+            )
+        if md5 is None:
+            md5 = await self._md5(path, st)
+        content_md5 = base64.b64encode(bytes.fromhex(md5)).decode("ascii")
+        metadata = dict(metadata, md5chksum=content_md5)
+        await self._limiter.take(st.st_size)
+        with open(path, "rb") as body:
+            await client.put_object(
+                Bucket=job.bucket, Key=key, Body=body, ContentLength=st.st_size, ContentMD5=content_md5,
+                Metadata=metadata,
+            )
+        job.sent(rel, st.st_size)
+
+    async def _put_multipart(
+        self, client, job: _Job, rel: str, path: str, st, key: str, metadata: dict, md5: str | None,
+    ) -> None:
+        store = self._store
+        parts: dict[int, str] = {}
+        record = store.lookup(job.remote, job.bucket, key)
+        if record is not None:
+            resumable = (
+                (record.local_path, record.size, record.mtime_ns) == (path, st.st_size, st.st_mtime_ns)
+                and time.time() - record.started_at < _MAX_RESUME_AGE_S
+            )
+            resumed = await self._resumable_parts(client, job.bucket, key, record) if resumable else None
+            if resumed is None:
+                # The file changed, the upload is too old, or the server forgot it.
+                await self._abort(client, job, key, record)
+                record = None
+            else:
+                parts = resumed
+        if record is None:
+            if md5 is None:
+                md5 = await self._md5(path, st)
+            metadata = dict(metadata, md5chksum=base64.b64encode(bytes.fromhex(md5)).decode("ascii"))
+            resp = await client.create_multipart_upload(Bucket=job.bucket, Key=key, Metadata=metadata)
+            record = MultipartRecord(
+                upload_id=resp["UploadId"],
+                local_path=path,
+                size=st.st_size,
+                mtime_ns=st.st_mtime_ns,
+                part_size=_part_size(st.st_size, job.chunk_size),
+                started_at=time.time(),
+            )
+            store.begin(job.remote, job.bucket, key, record)
+        else:
+            log_debug(f"Native S3: resuming {rel} with {len(parts)} part(s) already uploaded")
+
+        part_size = record.part_size
+        nparts = max(1, -(-st.st_size // part_size))
+        for n in parts:
+            job.sent(rel, min(part_size, st.st_size - (n - 1) * part_size))
+        todo = iter(n for n in range(1, nparts + 1) if n not in parts)
+        loop = asyncio.get_running_loop()
+
+        async def worker() -> None:
+            for n in todo:
+                offset = (n - 1) * part_size
+                length = min(part_size, st.st_size - offset)
+                held = await self._gate.acquire(length)
+                try:
+                    data, content_md5 = await loop.run_in_executor(None, _read_range, path, offset, length)
+                    await self._limiter.take(length)
+                    resp = await client.upload_part(
+                        Bucket=job.bucket, Key=key, UploadId=record.upload_id,
+                        PartNumber=n, Body=data, ContentMD5=content_md5,
+                    )
+                finally:
+                    await self._gate.release(held)
+                parts[n] = resp["ETag"]
+                store.add_part(record.upload_id, n, resp["ETag"])
+                job.sent(rel, length)
+
+        await _run_all(worker() for _ in range(min(job.upload_concurrency, nparts)))
+        await client.complete_multipart_upload(
+            Bucket=job.bucket, Key=key, UploadId=record.upload_id,
+            MultipartUpload={"Parts": [{"PartNumber": n, "ETag": parts[n]} for n in sorted(parts)]},
+        )
+        store.forget(job.remote, job.bucket, key, record.upload_id)
+
+    async def _resumable_parts(self, client, bucket: str, key: str, record: MultipartRecord) -> dict[int, str] | None:
+        """Parts of an interrupted upload that the server still has, as recorded; None if it is gone."""
+        saved = self._store.parts(record.upload_id)
+        parts: dict[int, str] = {}
+        try:
+            paginator = client.get_paginator("list_parts")
+            async for page in paginator.paginate(Bucket=bucket, Key=key, UploadId=record.upload_id):
+                for p in page.get("Parts") or []:
+                    n = p["PartNumber"]
+                    expected = min(record.part_size, record.size - (n - 1) * record.part_size)
+                    if saved.get(n) == p["ETag"] and p.get("Size") == expected:
+                        parts[n] = p["ETag"]
+        except Exception as e:
+            if _error_code(e) in ("NoSuchUpload", "404"):
+                return None
+            raise
+        return parts
+
+    async def _abort(self, client, job: _Job, key: str, record: MultipartRecord) -> None:
+        try:
+            await client.abort_multipart_upload(Bucket=job.bucket, Key=key, UploadId=record.upload_id)
+        except Exception as e:
+            log_debug(f"Native S3: could not abort stale upload of {key}: {e}")
+        self._store.forget(job.remote, job.bucket, key, record.upload_id)
+
+    async def _head(self, client, bucket: str, key: str) -> dict | None:
+        try:
+            return await client.head_object(Bucket=bucket, Key=key)
+        except Exception as e:
+            if _error_code(e) in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+
+    async def _md5(self, path: str, st: os.stat_result) -> str:
+        cached = self._hash_cache.lookup(path, st)
+        if cached is not None:
+            return cached
+        md5 = await asyncio.get_running_loop().run_in_executor(None, hash_file, path)
+        self._hash_cache.store_many([(path, st, md5)])
+        return md5
+
+    async def _delete(self, remote: str, bucket: str, key: str) -> None:
+        client = await self._client(remote)
+        await client.delete_object(Bucket=bucket, Key=key)
+
+    async def _server_side_copy(self, remote: str, src_bucket: str, src_key: str, bucket: str, key: str) -> None:
+        client = await self._client(remote)
+        head = await self._head(client, src_bucket, src_key)
+        if head is None:
+            raise RuntimeError(f"{src_bucket}/{src_key} not found")
+        if head.get("ContentLength", 0) > _MAX_COPY_BYTES:
+            raise RuntimeError(f"{src_bucket}/{src_key} is too large for a single server-side copy")
+        await client.copy_object(Bucket=bucket, Key=key, CopySource={"Bucket": src_bucket, "Key": src_key})
+
+
+async def _run_all(coros) -> None:
+    """Await ``coros`` concurrently; if one fails, cancel the rest before raising."""
+    tasks = [asyncio.ensure_future(c) for c in coros]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+def _same_mtime(head: dict, st: os.stat_result) -> bool:
+    try:
+        return abs(float((head.get("Metadata") or {})["mtime"]) - st.st_mtime) < 1
+    except (KeyError, ValueError):
+        return False
+
+
+def _sizes(paths: list[str]) -> list[int]:
+    sizes = []
+    for p in paths:
+        try:
+            sizes.append(os.path.getsize(p))
+        except OSError:
+            sizes.append(0)
+    return sizes
@@ -0,0 +1,164 @@
+"""Persistent scan cache so restarts skip unchanged folders.
+
+Each folder is keyed by its absolute path and validated against the directory's
+``st_mtime_ns`` and ``st_ino``. Adding, removing or renaming an entry changes
+the directory mtime, so a hit means the cached file list, sub-folder names and
+confirmed YAML ``nfiles`` can be reused without listing the folder or parsing
+its YAML. Editing a file in place does not change the directory mtime; the
+cached size/mtime of such a file may be stale until the folder changes, the
+cache is bypassed (``--rescan``) or watch mode, which notices the growth,
+drops the folder (see app.watch).
+"""
+
+import os
+import sqlite3
+import time
+from typing import Iterable
+
+from app.log import log_debug
+from app.paths import _safe_makedirs, get_user_config_dir
+from app.scanner import FileEntry, FolderManifest
+
+SCAN_CACHE_FILENAME = "scancache.sqlite3"
+_SCHEMA_VERSION = 1
+
+# Directories modified this recently are not cached: a file added within the
+# same timestamp tick would not move the mtime (FAT has 2 s resolution).
+_RACY_WINDOW_NS = 2_000_000_000
+
+
+def default_scan_cache_path() -> str:
+    return os.path.join(get_user_config_dir(), SCAN_CACHE_FILENAME)
+
+
+class ScanCache:
+    def __init__(self, path: str | None = None):
+        self.path = path or default_scan_cache_path()
+        _safe_makedirs(os.path.dirname(self.path))
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._init_schema()
+        self.hits = 0
+        self.misses = 0
+
+    def _init_schema(self) -> None:
+        version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+        if version != _SCHEMA_VERSION:
+            self._conn.executescript(
+                """
+                DROP TABLE IF EXISTS folders;
+                DROP TABLE IF EXISTS files;
+                """
+            )
+        self._conn.executescript(
+            f"""
+            CREATE TABLE IF NOT EXISTS folders (
+                path TEXT PRIMARY KEY,
+                mtime_ns INTEGER NOT NULL,
+                ino INTEGER NOT NULL,
+                has_yaml INTEGER NOT NULL,
+                yaml_nfiles INTEGER,
+                subdirs TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS files (
+                folder TEXT NOT NULL,
+                name TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                PRIMARY KEY (folder, name)
+            ) WITHOUT ROWID;
+            PRAGMA user_version = {_SCHEMA_VERSION};
+            """
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def _key(path: str) -> str:
+        return os.path.normcase(os.path.abspath(path))
+
+    def lookup(self, path: str, relpath: str, st: os.stat_result) -> FolderManifest | None:
+        """Return the cached manifest for ``path`` if the directory is unchanged."""
+        key = self._key(path)
+        row = self._conn.execute(
+            "SELECT mtime_ns, ino, has_yaml, yaml_nfiles, subdirs FROM folders WHERE path = ?",
+            (key,),
+        ).fetchone()
+        if row is None or row[0] != st.st_mtime_ns or row[1] != st.st_ino:
+            self.misses += 1
+            return None
+        files = [
+            FileEntry(name, size, mtime)
+            for name, size, mtime in self._conn.execute(
+                "SELECT name, size, mtime FROM files WHERE folder = ? ORDER BY name", (key,),
+            )
+        ]
+        self.hits += 1
+        return FolderManifest(
+            path=path,
+            relpath=relpath,
+            files=files,
+            has_yaml=bool(row[2]),
+            yaml_nfiles=row[3],
+            subdirs=row[4].split("/") if row[4] else [],
+            dir_mtime_ns=st.st_mtime_ns,
+            dir_ino=st.st_ino,
+            cached=True,
+        )
+
+    def forget(self, paths: Iterable[str]) -> None:
+        """Drop the cached listings of ``paths``, e.g. after a file in one grew in place."""
+        keys = [(self._key(p),) for p in paths]
+        with self._conn:
+            self._conn.executemany("DELETE FROM folders WHERE path = ?", keys)
+            self._conn.executemany("DELETE FROM files WHERE folder = ?", keys)
+
+    def store(self, manifest: FolderManifest) -> None:
+        """Record a fully processed folder. Racily fresh directories are skipped."""
+        if manifest.dir_mtime_ns is None or manifest.dir_ino is None:
+            return
+        if manifest.cached:
+            # The listing is unchanged; only our own YAML write can have moved
+            # the directory stat.
+            self._conn.execute(
+                "UPDATE folders SET mtime_ns = ?, ino = ?, has_yaml = ?, yaml_nfiles = ? WHERE path = ?",
+                (
+                    manifest.dir_mtime_ns,
+                    manifest.dir_ino,
+                    int(manifest.has_yaml),
+                    manifest.yaml_nfiles,
+                    self._key(manifest.path),
+                ),
+            )
+            self._conn.commit()
+            return
+        if time.time_ns() - manifest.dir_mtime_ns < _RACY_WINDOW_NS:
+            return
+
+        key = self._key(manifest.path)
+        with self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO folders (path, mtime_ns, ino, has_yaml, yaml_nfiles, subdirs) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    key,
+                    manifest.dir_mtime_ns,
+                    manifest.dir_ino,
+                    int(manifest.has_yaml),
+                    manifest.yaml_nfiles,
+                    "/".join(manifest.subdirs),
+                ),
+            )
+            self._conn.execute("DELETE FROM files WHERE folder = ?", (key,))
+            self._conn.executemany(
+                "INSERT INTO files (folder, name, size, mtime) VALUES (?, ?, ?, ?)",
+                [(key, f.name, f.size, f.mtime) for f in manifest.files],
+            )
+
+    def close(self) -> None:
+        if self.hits or self.misses:
+            log_debug(f"Scan cache: {self.hits} folder(s) reused, {self.misses} listed")
+        try:
+            self._conn.close()
+        except Exception:
+            pass
@@ -0,0 +1,145 @@
+"""Single-pass directory scanner.
+
+One ``os.scandir`` per directory, reusing the ``DirEntry`` type cache and a
+single stat per file for size/mtime. Folders are yielded one at a time so memory
+stays bounded by the largest directory, not the whole drive.
+"""
+
+import os
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Collection, Iterator
+
+if TYPE_CHECKING:
+    from app.scancache import ScanCache
+
+YAML_FILENAME = "fielduploads.seabee.yaml"
+# Written to the bucket when a folder has finished uploading (see app.schedule).
+COMPLETE_FILENAME = "fielduploads.seabee.complete"
+IGNORED_FILE_NAMES = {"thumbs.db"}
+IGNORED_DIR_NAMES = {"$recycle.bin"}
+
+
+@dataclass
+class FileEntry:
+    name: str
+    size: int
+    mtime: float
+    # Local path when the file is not in its manifest's folder (a staged bundle).
+    source: str | None = None
+    # Remote path of an object with the same content, to copy server-side
+    # instead of uploading (see app.dedup).
+    copy_of: str | None = None
+    # ``source`` is a compressed copy (see app.compress).
+    compressed: bool = False
+
+
+@dataclass
+class FolderManifest:
+    """Files directly inside one folder (not recursive)."""
+    path: str
+    relpath: str  # POSIX-style, relative to the scan root; "" for the root itself
+    files: list[FileEntry] = field(default_factory=list)
+    has_yaml: bool = False
+    subdirs: list[str] = field(default_factory=list)
+    dir_mtime_ns: int | None = None
+    dir_ino: int | None = None
+    yaml_nfiles: int | None = None  # nfiles already confirmed in the folder's YAML
+    cached: bool = False
+    # Set for a virtual package: loose root files uploaded under ``relpath``
+    # without moving them. Its YAML lives here instead of on the drive.
+    yaml_dir: str | None = None
+
+    @property
+    def nfiles(self) -> int:
+        return len(self.files)
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(f.size for f in self.files)
+
+    @property
+    def is_root(self) -> bool:
+        return self.relpath == ""
+
+    @property
+    def is_virtual(self) -> bool:
+        return self.yaml_dir is not None
+
+    @property
+    def yaml_path(self) -> str:
+        return os.path.join(self.yaml_dir or self.path, YAML_FILENAME)
+
+    def refresh_dir_stat(self) -> None:
+        """Re-read the directory stat after the app itself changed the folder."""
+        try:
+            st = os.stat(self.path)
+            self.dir_mtime_ns, self.dir_ino = st.st_mtime_ns, st.st_ino
+        except OSError:
+            self.dir_mtime_ns = self.dir_ino = None
+
+
+def _join_rel(parent: str, name: str) -> str:
+    return f"{parent}/{name}" if parent else name
+
+
+def scan_folder(path: str, relpath: str = "") -> FolderManifest:
+    """List one directory into a manifest, including its sub-folder names."""
+    manifest = FolderManifest(path=path, relpath=relpath)
+    # Stat before listing, so a change made while listing shows up next time.
+    manifest.refresh_dir_stat()
+    subdirs = manifest.subdirs
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if entry.name.lower() not in IGNORED_DIR_NAMES:
+                            subdirs.append(entry.name)
+                        continue
+                    if not entry.is_file():
+                        continue
+                    if entry.name == YAML_FILENAME:
+                        manifest.has_yaml = True
+                        continue
+                    if entry.name == COMPLETE_FILENAME or entry.name.lower() in IGNORED_FILE_NAMES:
+                        continue
+                    st = entry.stat()
+                    manifest.files.append(FileEntry(entry.name, st.st_size, st.st_mtime))
+                except OSError:
+                    continue
+    except OSError:
+        pass
+    manifest.files.sort(key=lambda f: f.name)
+    subdirs.sort()
+    return manifest
+
+
+def scan_tree(
+    root: str,
+    cache: "ScanCache | None" = None,
+    folders: Collection[str] | None = None,
+) -> Iterator[FolderManifest]:
+    """Yield a manifest for ``root`` and every folder below it, top-down.
+
+    With a ``cache``, folders whose directory stat is unchanged are served from
+    it with a single ``stat`` instead of a listing. Callers store processed
+    manifests back with ``cache.store``. With ``folders``, only those
+    top-level folders are scanned, and the root's own files are left out.
+    """
+    stack: list[tuple[str, str]] = [(root, "")]
+    if folders is not None:
+        stack = [(os.path.join(root, name), name) for name in sorted(folders, reverse=True)]
+    while stack:
+        path, relpath = stack.pop()
+        manifest = None
+        if cache is not None:
+            try:
+                manifest = cache.lookup(path, relpath, os.stat(path))
+            except OSError:
+                pass
+        if manifest is None:
+            manifest = scan_folder(path, relpath)
+        yield manifest
+        # Reversed so sub-folders are visited in sorted order.
+        for name in reversed(manifest.subdirs):
+            stack.append((os.path.join(path, name), _join_rel(relpath, name)))
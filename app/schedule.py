@@ -0,0 +1,80 @@
+"""Flight-by-flight upload order.
+
+Handing rclone the whole drive at once interleaves files from every flight
+folder, so processing and GeoNode publishing for any one flight can only
+start near the end of the run. Instead, the plan's folders are uploaded one
+after another in priority order (``UPLOAD_ORDER`` in bucket.conf):
+
+* ``name``: folders in scan (name) order, the default
+* ``newest`` / ``oldest``: by the modtime of each folder's newest file
+* ``smallest``: fewest bytes first, so short flights are done soonest
+* ``mixed``: no scheduling; one interleaved copy, as fast as possible for
+  drives of many tiny folders, and no completion markers
+
+``UPLOAD_FIRST`` names folders (comma-separated, ``*`` wildcards allowed,
+matched against the folder's path or name) that go before all others, in
+the order given.
+
+When a folder's last file is confirmed, a ``fielduploads.seabee.complete``
+object is written next to its YAML, so downstream processing can start on
+it without waiting for the rest of the drive. Total throughput stays about
+the same; the time until the first flight is complete drops.
+"""
+
+import datetime
+import fnmatch
+import json
+
+from app.log import log_debug
+from app.plan import FolderWork
+
+UPLOAD_ORDERS = ("name", "newest", "oldest", "smallest", "mixed")
+
+
+def upload_order(options: dict[str, str]) -> str:
+    """UPLOAD_ORDER in bucket.conf (default ``name``)."""
+    order = options.get("upload_order", "name").strip().lower() or "name"
+    if order not in UPLOAD_ORDERS:
+        log_debug(f"Ignoring invalid UPLOAD_ORDER={order!r} in bucket.conf")
+        return "name"
+    return order
+
+
+def upload_first(options: dict[str, str]) -> list[str]:
+    """UPLOAD_FIRST in bucket.conf: folder name patterns to upload before the rest."""
+    return [p.strip().strip("/") for p in options.get("upload_first", "").split(",") if p.strip()]
+
+
+def _rank(relpath: str, first: list[str]) -> int:
+    name = relpath.rpartition("/")[2]
+    for i, pattern in enumerate(first):
+        if fnmatch.fnmatch(relpath, pattern) or fnmatch.fnmatch(name, pattern):
+            return i
+    return len(first)
+
+
+# Sort key within each UPLOAD_FIRST rank; "name" keeps scan order.
+_ORDER_KEYS = {
+    "newest": lambda w: -w.newest,
+    "oldest": lambda w: w.newest,
+    "smallest": lambda w: w.nbytes,
+}
+
+
+def order_folders(folders: list[FolderWork], order: str, first: list[str] | None = None) -> list[FolderWork]:
+    """``folders`` (in scan order) in upload order; see the module docstring."""
+    first = first or []
+    key = _ORDER_KEYS.get(order)
+    # sorted() is stable: ties keep scan order.
+    return sorted(folders, key=lambda w: (_rank(w.relpath, first), key(w) if key else 0))
+
+
+def completion_marker(work: FolderWork) -> str:
+    """Contents of a folder's completion marker object."""
+    return json.dumps({
+        "folder": work.relpath,
+        "completed_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "uploaded_files": work.nfiles,
+        "uploaded_bytes": work.nbytes,
+        "copied_files": work.ncopies,
+    }, indent=1) + "\n"
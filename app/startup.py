@@ -0,0 +1,98 @@
+"""Start-up timing for the GUI.
+
+``StartupClock`` marks the steps from launch to the first painted window
+(imports, Tk, building the window, first paint) and logs them as one line,
+with a warning when the total is over ``STARTUP_BUDGET_MS``. The clock starts
+in ``app.__main__`` before anything else is imported, so only the interpreter's
+own start-up is not counted.
+
+``profile_imports`` runs ``python -X importtime`` on a module in a fresh
+interpreter and returns the slowest imports, for ``python -m app startup``.
+
+This module is imported before everything else; keep it to the stdlib's
+cheapest modules.
+"""
+
+import os
+import sys
+import time
+
+# Launch to first paint, and the share of it spent importing app.gui.
+STARTUP_BUDGET_MS = 1000.0
+IMPORT_BUDGET_MS = 250.0
+
+
+def startup_budget_ms() -> float:
+    """SEABEE_STARTUP_BUDGET_MS overrides the launch-to-first-paint budget."""
+    try:
+        return float(os.environ.get("SEABEE_STARTUP_BUDGET_MS", ""))
+    except ValueError:
+        return STARTUP_BUDGET_MS
+
+
+class StartupClock:
+    """Milliseconds from launch to each named start-up step."""
+
+    def __init__(self, started: float | None = None):
+        self.started = time.perf_counter() if started is None else started
+        self.marks: list[tuple[str, float]] = []
+
+    def mark(self, name: str) -> float:
+        """Record that ``name`` is done; returns the milliseconds since launch."""
+        ms = (time.perf_counter() - self.started) * 1000
+        self.marks.append((name, ms))
+        return ms
+
+    @property
+    def total_ms(self) -> float:
+        return self.marks[-1][1] if self.marks else 0.0
+
+    def summary(self) -> str:
+        steps = []
+        previous = 0.0
+        for name, ms in self.marks:
+            steps.append(f"{name} {ms - previous:.0f} ms")
+            previous = ms
+        return f"{self.total_ms:.0f} ms ({', '.join(steps)})"
+
+    def report(self) -> None:
+        from app.log import WARNING, log
+
+        budget = startup_budget_ms()
+        if self.total_ms > budget:
+            log(f"Startup: {self.summary()}, over the {budget:.0f} ms budget", WARNING)
+        else:
+            log(f"Startup: {self.summary()}")
+
+
+# ---------------------------------------------------------------------------
+# Import profiling
+# ---------------------------------------------------------------------------
+
+def profile_imports(module: str = "app.gui") -> list[tuple[str, float, float]]:
+    """Import ``module`` in a fresh interpreter; (name, self ms, cumulative ms) per import.
+
+    Entries are in the order ``-X importtime`` reports them, so the last one
+    is ``module`` itself, whose cumulative time is the total.
+    """
+    import subprocess
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=root,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        detail = proc.stderr.strip().splitlines()[-1:] or [f"exit code {proc.returncode}"]
+        raise RuntimeError(f"importing {module} failed: {detail[0]}")
+    entries = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        self_us, cumulative_us, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        if not self_us.isdigit():
+            continue  # the header line
+        entries.append((name, int(self_us) / 1000, int(cumulative_us) / 1000))
+    return entries
@@ -0,0 +1,218 @@
+"""Transfer tuning from the dataset's size profile and measured throughput.
+
+The initial rclone settings are picked from the size histogram of the files to
+upload: many small JPGs want many parallel transfers, a few multi-GB videos
+want fewer transfers but bigger, more concurrent multipart chunks. The bulk
+upload then runs in batches and ``AutoTuner`` adjusts the parallelism between
+batches: it backs off when errors appear and keeps climbing while throughput
+improves. Any value set in bucket.conf is used as-is and never adjusted.
+"""
+
+from dataclasses import dataclass, replace
+
+from app.log import log_debug
+
+MIB = 1024 * 1024
+GIB = 1024 * MIB
+
+# Upper bounds of the size classes in a TransferPlan histogram.
+SMALL_FILE_MAX = 16 * MIB
+MEDIUM_FILE_MAX = 256 * MIB
+
+# Keep rclone's multipart buffers (transfers x concurrency x chunk) bounded on
+# field laptops.
+_MAX_BUFFER_BYTES = 1 * GIB
+_MIN_TRANSFERS = 1
+_MAX_TRANSFERS = 32
+
+# Bulk copies are split into batches of roughly this share of the upload, so
+# there is something to adjust between.
+_BATCHES_PER_UPLOAD = 10
+_MIN_BATCH_BYTES = 512 * MIB
+_MAX_BATCH_BYTES = 20 * GIB
+
+_ERROR_RATE_BACKOFF = 0.01
+_IMPROVEMENT = 1.10
+
+OVERRIDE_KEYS = {
+    "transfers": "transfers",
+    "checkers": "checkers",
+    "s3_chunk_size": "chunk_size_mib",
+    "s3_upload_concurrency": "upload_concurrency",
+}
+
+
+@dataclass(frozen=True)
+class TransferSettings:
+    transfers: int = 4
+    checkers: int = 8
+    chunk_size_mib: int = 5
+    upload_concurrency: int = 4
+
+    def rclone_args(self) -> list[str]:
+        return [
+            "--transfers", str(self.transfers),
+            "--checkers", str(self.checkers),
+            "--s3-chunk-size", f"{self.chunk_size_mib}Mi",
+            "--s3-upload-concurrency", str(self.upload_concurrency),
+        ]
+
+    def rc_config(self) -> dict:
+        return {"Transfers": self.transfers, "Checkers": self.checkers}
+
+    def remote_with_options(self, dest: str) -> str:
+        """``dest`` as an rclone connection string carrying the S3 options.
+
+        Used with the rc API, where backend flags cannot be passed per job.
+        """
+        remote, sep, path = dest.partition(":")
+        if not sep:
+            return dest
+        return (
+            f"{remote},chunk_size={self.chunk_size_mib}Mi,"
+            f"upload_concurrency={self.upload_concurrency}:{path}"
+        )
+
+    def describe(self) -> str:
+        return (
+            f"transfers={self.transfers} checkers={self.checkers} "
+            f"s3-chunk-size={self.chunk_size_mib}Mi s3-upload-concurrency={self.upload_concurrency}"
+        )
+
+
+@dataclass
+class SizeHistogram:
+    small_files: int = 0
+    small_bytes: int = 0
+    medium_files: int = 0
+    medium_bytes: int = 0
+    large_files: int = 0
+    large_bytes: int = 0
+
+    def add(self, size: int) -> None:
+        if size < SMALL_FILE_MAX:
+            self.small_files += 1
+            self.small_bytes += size
+        elif size < MEDIUM_FILE_MAX:
+            self.medium_files += 1
+            self.medium_bytes += size
+        else:
+            self.large_files += 1
+            self.large_bytes += size
+
+    @property
+    def total_bytes(self) -> int:
+        return self.small_bytes + self.medium_bytes + self.large_bytes
+
+    def describe(self) -> str:
+        return (
+            f"<16MiB: {self.small_files} files/{self.small_bytes // MIB} MiB, "
+            f"<256MiB: {self.medium_files} files/{self.medium_bytes // MIB} MiB, "
+            f">=256MiB: {self.large_files} files/{self.large_bytes // MIB} MiB"
+        )
+
+
+def _parse_override(key: str, raw: str) -> int | None:
+    value = raw.strip()
+    if key == "s3_chunk_size":
+        # Accept "64", "64M", "64Mi", "64MiB".
+        value = value.rstrip("BbIi").rstrip("Mm")
+    try:
+        n = int(value)
+    except ValueError:
+        log_debug(f"Ignoring invalid {key.upper()}={raw!r} in bucket.conf")
+        return None
+    return n if n > 0 else None
+
+
+def autotune_enabled(options: dict[str, str]) -> bool:
+    """AUTOTUNE=false in bucket.conf keeps the initial settings for the whole run."""
+    return options.get("autotune", "true").strip().lower() not in ("0", "false", "no", "off")
+
+
+def parse_overrides(options: dict[str, str]) -> dict[str, int]:
+    """Pull TRANSFERS / CHECKERS / S3_CHUNK_SIZE / S3_UPLOAD_CONCURRENCY from bucket.conf."""
+    overrides: dict[str, int] = {}
+    for key, field_name in OVERRIDE_KEYS.items():
+        if options.get(key):
+            n = _parse_override(key, options[key])
+            if n is not None:
+                overrides[field_name] = n
+    return overrides
+
+
+def _fit_buffers(s: TransferSettings) -> TransferSettings:
+    while (
+        s.transfers * s.upload_concurrency * s.chunk_size_mib * MIB > _MAX_BUFFER_BYTES
+        and s.upload_concurrency > 1
+    ):
+        s = replace(s, upload_concurrency=s.upload_concurrency - 1)
+    return s
+
+
+def initial_settings(hist: SizeHistogram) -> TransferSettings:
+    """Pick starting settings from where the bytes are."""
+    total = hist.total_bytes or 1
+    if hist.large_bytes / total >= 0.5:
+        # Few huge files (MP4, orthomosaics): parallelism inside each file.
+        s = TransferSettings(transfers=4, checkers=8, chunk_size_mib=64, upload_concurrency=8)
+    elif hist.small_bytes / total >= 0.5:
+        # Thousands of drone JPGs: parallelism across files.
+        s = TransferSettings(transfers=16, checkers=16, chunk_size_mib=8, upload_concurrency=2)
+    else:
+        s = TransferSettings(transfers=8, checkers=16, chunk_size_mib=32, upload_concurrency=4)
+    return _fit_buffers(s)
+
+
+def batch_bytes_for(total_bytes: int) -> int:
+    return max(_MIN_BATCH_BYTES, min(_MAX_BATCH_BYTES, total_bytes // _BATCHES_PER_UPLOAD))
+
+
+class AutoTuner:
+    """Adjusts ``transfers`` between batches from measured throughput.
+
+    Doubles while each batch is clearly faster than the best so far, falls back
+    to the best and holds once it is not, and halves (then holds) when the error
+    rate goes up.
+    """
+
+    def __init__(self, hist: SizeHistogram, overrides: dict[str, int] | None = None, adaptive: bool = True):
+        self.overrides = overrides or {}
+        self.adaptive = adaptive and "transfers" not in self.overrides
+        self.current = replace(initial_settings(hist), **self.overrides)
+        self._best = self.current
+        self._best_rate = 0.0
+        self._climbing = True
+        log_debug(f"Size profile: {hist.describe()}")
+        log_debug(f"Transfer settings (initial): {self.current.describe()}")
+
+    def record(self, nbytes: int, seconds: float, nfiles: int, errors: int) -> None:
+        """Feed back one finished batch and pick settings for the next one."""
+        if seconds <= 0:
+            return
+        rate = nbytes / seconds
+        log_debug(
+            f"Batch: {nbytes // MIB} MiB, {nfiles} files in {seconds:.1f}s "
+            f"= {rate / MIB:.2f} MiB/s, errors={errors} ({self.current.describe()})"
+        )
+        if not self.adaptive:
+            return
+
+        previous = self.current
+        if nfiles and errors / nfiles > _ERROR_RATE_BACKOFF:
+            transfers = max(_MIN_TRANSFERS, previous.transfers // 2)
+            self._climbing = False
+            self._best_rate = 0.0
+        elif rate > self._best_rate * _IMPROVEMENT:
+            self._best, self._best_rate = previous, rate
+            transfers = min(_MAX_TRANSFERS, previous.transfers * 2) if self._climbing else previous.transfers
+        else:
+            self._climbing = False
+            transfers = self._best.transfers
+
+        self.current = replace(
+            _fit_buffers(replace(previous, transfers=transfers, checkers=max(previous.checkers, transfers))),
+            **self.overrides,
+        )
+        if self.current != previous:
+            log_debug(f"Transfer settings (adjusted): {self.current.describe()}")
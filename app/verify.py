@@ -0,0 +1,289 @@
+"""Post-upload verification against the remote listing.
+
+rclone exiting 0 only says the files it was given were copied. Verification
+lists what is actually under the target prefix (``rclone lsjson``, limited to
+the folders being uploaded) and joins it with the local scan manifest, per
+folder: objects missing remotely, objects whose size (or MD5, when known on
+both sides) differs, and remote objects with no local file. It also checks
+that each folder's object count matches the ``nfiles`` in its
+fielduploads.seabee.yaml.
+
+Both sides are streamed into a temporary SQLite database, so memory stays
+bounded however large the drive is. The missing and mismatched files ("gaps")
+can then be re-uploaded without copying everything again.
+"""
+
+import json
+import os
+import re
+import sqlite3
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Iterable, Iterator
+
+from app.log import log_debug
+from app.paths import get_user_config_dir
+from app.scanner import COMPLETE_FILENAME, YAML_FILENAME, FolderManifest
+
+REPORT_FILENAME = "verify_report.json"
+
+# Names kept per folder and category in the report; counts are always exact.
+_SAMPLE_NAMES = 10
+
+_FILTER_SPECIAL_RE = re.compile(r"([\\*?\[\]{}])")
+
+
+def verify_enabled(options: dict[str, str]) -> bool:
+    """VERIFY=true in bucket.conf checks every upload against the remote listing."""
+    return options.get("verify", "false").strip().lower() in ("1", "true", "yes", "on")
+
+
+def repair_enabled(options: dict[str, str]) -> bool:
+    """REPAIR=true re-uploads the gaps verification finds (implies VERIFY)."""
+    return options.get("repair", "false").strip().lower() in ("1", "true", "yes", "on")
+
+
+def default_report_path() -> str:
+    return os.path.join(get_user_config_dir(), REPORT_FILENAME)
+
+
+def write_filter_file(path: str, top_folders: Iterable[str]) -> None:
+    """rclone filter rules that list only the given top-level folders."""
+    with open(path, "w", encoding="utf-8") as f:
+        for name in top_folders:
+            escaped = _FILTER_SPECIAL_RE.sub(r"\\\1", name)
+            f.write(f"+ /{escaped}/**\n")
+        f.write("- **\n")
+
+
+def parse_lsjson(lines: Iterable[str]) -> Iterator[tuple[str, int, str | None]]:
+    """Yield ``(path, size, md5)`` from ``rclone lsjson`` output, one line at a time.
+
+    rclone writes one object per line inside the JSON array, so the array is
+    never held in memory.
+    """
+    for line in lines:
+        line = line.strip().rstrip(",")
+        if not line.startswith("{"):
+            continue
+        try:
+            item = json.loads(line)
+        except ValueError:
+            continue
+        if item.get("IsDir"):
+            continue
+        md5 = (item.get("Hashes") or {}).get("md5") or None
+        yield item["Path"], int(item.get("Size") or 0), md5
+
+
+@dataclass
+class FolderReport:
+    relpath: str
+    local_files: int = 0
+    remote_files: int = 0
+    yaml_nfiles: int | None = None
+    missing: int = 0
+    mismatched: int = 0
+    extra: int = 0
+    missing_names: list[str] = field(default_factory=list)
+    mismatched_names: list[str] = field(default_factory=list)
+    extra_names: list[str] = field(default_factory=list)
+
+    @property
+    def count_ok(self) -> bool:
+        """The YAML's nfiles matches the folder's data objects on the remote.
+
+        Extra objects (e.g. files since deleted locally) are reported but not
+        counted, so they do not fail verification on their own.
+        """
+        return self.yaml_nfiles is None or self.yaml_nfiles == self.remote_files - self.extra
+
+    @property
+    def ok(self) -> bool:
+        return not (self.missing or self.mismatched) and self.count_ok
+
+
+@dataclass
+class VerificationReport:
+    dest: str
+    root: str
+    folders: list[FolderReport] = field(default_factory=list)
+    remote_objects: int = 0
+    seconds: float = 0.0
+    # Relative paths of the missing and mismatched files, for a repair run.
+    gaps: list[str] = field(default_factory=list)
+
+    @property
+    def missing(self) -> int:
+        return sum(f.missing for f in self.folders)
+
+    @property
+    def mismatched(self) -> int:
+        return sum(f.mismatched for f in self.folders)
+
+    @property
+    def extra(self) -> int:
+        return sum(f.extra for f in self.folders)
+
+    @property
+    def ok(self) -> bool:
+        return all(f.ok for f in self.folders)
+
+    def summary(self) -> str:
+        bad_counts = sum(not f.count_ok for f in self.folders)
+        text = (
+            f"{len(self.folders)} folder(s), {self.remote_objects} object(s) checked: "
+            f"{self.missing} missing, {self.mismatched} mismatched, {self.extra} extra"
+        )
+        if bad_counts:
+            text += f", {bad_counts} folder(s) whose object count differs from nfiles"
+        return text
+
+    def write_json(self, path: str | None = None) -> str:
+        path = path or default_report_path()
+        data = {
+            "dest": self.dest,
+            "root": self.root,
+            "verified_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "seconds": round(self.seconds, 1),
+            "ok": self.ok,
+            "summary": self.summary(),
+            "folders": [asdict(f) | {"ok": f.ok} for f in self.folders if not f.ok or f.extra],
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+        return path
+
+
+class Verifier:
+    """Joins a local scan with a remote listing in a throwaway SQLite database."""
+
+    def __init__(self, dest: str, root: str):
+        self.dest = dest
+        self.root = root
+        # "" opens a private on-disk temporary database: large listings spill
+        # to disk instead of memory.
+        self._conn = sqlite3.connect("")
+        self._conn.executescript(
+            """
+            CREATE TABLE local (
+                folder TEXT NOT NULL,
+                name TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                md5 TEXT,
+                PRIMARY KEY (folder, name)
+            );
+            CREATE TABLE remote (
+                folder TEXT NOT NULL,
+                name TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                md5 TEXT,
+                PRIMARY KEY (folder, name)
+            );
+            CREATE TABLE folders (
+                folder TEXT PRIMARY KEY,
+                yaml_nfiles INTEGER
+            );
+            """
+        )
+        self._top_folders: dict[str, None] = {}
+        self.remote_objects = 0
+
+    @property
+    def top_folders(self) -> list[str]:
+        """Top-level folders seen locally, in scan order; only these are listed remotely."""
+        return list(self._top_folders)
+
+    def add_local(self, manifest: FolderManifest, md5s: dict[str, str] | None = None) -> None:
+        """Record one local folder as it should appear remotely."""
+        if not manifest.relpath:
+            return
+        self._top_folders[manifest.relpath.split("/", 1)[0]] = None
+        md5s = md5s or {}
+        rows = [(manifest.relpath, f.name, f.size, md5s.get(f.name)) for f in manifest.files]
+        if manifest.has_yaml:
+            rows.append((manifest.relpath, YAML_FILENAME, -1, None))
+        self._conn.executemany("INSERT OR REPLACE INTO local VALUES (?, ?, ?, ?)", rows)
+        self._conn.execute(
+            "INSERT OR REPLACE INTO folders VALUES (?, ?)",
+            (manifest.relpath, manifest.yaml_nfiles if manifest.has_yaml else None),
+        )
+
+    def add_remote(self, listing: Iterable[tuple[str, int, str | None]]) -> None:
+        """Record the remote objects; completion markers are not files and are skipped."""
+        def rows():
+            for relpath, size, md5 in listing:
+                folder, _, name = relpath.rpartition("/")
+                if name == COMPLETE_FILENAME:
+                    continue
+                self.remote_objects += 1
+                yield folder, name, size, md5
+
+        with self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO remote VALUES (?, ?, ?, ?)", rows())
+
+    def _names(self, sql: str, folder: str) -> list[str]:
+        return [r[0] for r in self._conn.execute(sql + f" LIMIT {_SAMPLE_NAMES}", (folder,))]
+
+    def report(self, seconds: float = 0.0) -> VerificationReport:
+        # YAML files are written locally after the scan stat, so their size is
+        # not compared (stored as -1); only their presence is.
+        missing_sql = (
+            "SELECT l.name FROM local l LEFT JOIN remote r ON r.folder = l.folder AND r.name = l.name "
+            "WHERE l.folder = ? AND r.name IS NULL ORDER BY l.name"
+        )
+        mismatched_sql = (
+            "SELECT l.name FROM local l JOIN remote r ON r.folder = l.folder AND r.name = l.name "
+            "WHERE l.folder = ? AND l.size >= 0 "
+            "AND (r.size != l.size OR (l.md5 IS NOT NULL AND r.md5 IS NOT NULL AND r.md5 != l.md5)) "
+            "ORDER BY l.name"
+        )
+        extra_sql = (
+            "SELECT r.name FROM remote r LEFT JOIN local l ON l.folder = r.folder AND l.name = r.name "
+            "WHERE r.folder = ? AND l.name IS NULL ORDER BY r.name"
+        )
+
+        report = VerificationReport(dest=self.dest, root=self.root, remote_objects=self.remote_objects)
+        folders = self._conn.execute(
+            "SELECT folder FROM folders UNION SELECT DISTINCT folder FROM remote WHERE folder != '' ORDER BY 1"
+        ).fetchall()
+        for (folder,) in folders:
+            fr = FolderReport(relpath=folder)
+            row = self._conn.execute("SELECT yaml_nfiles FROM folders WHERE folder = ?", (folder,)).fetchone()
+            fr.yaml_nfiles = row[0] if row else None
+            fr.local_files = self._conn.execute(
+                "SELECT COUNT(*) FROM local WHERE folder = ? AND name != ?", (folder, YAML_FILENAME),
+            ).fetchone()[0]
+            fr.remote_files = self._conn.execute(
+                "SELECT COUNT(*) FROM remote WHERE folder = ? AND name != ?", (folder, YAML_FILENAME),
+            ).fetchone()[0]
+            for attr, sql in (("missing", missing_sql), ("mismatched", mismatched_sql), ("extra", extra_sql)):
+                count = self._conn.execute(
+                    f"SELECT COUNT(*) FROM ({sql})", (folder,),
+                ).fetchone()[0]
+                setattr(fr, attr, count)
+                if count:
+                    setattr(fr, f"{attr}_names", self._names(sql, folder))
+            report.folders.append(fr)
+        report.seconds = seconds
+        return report
+
+    def gaps(self) -> Iterator[str]:
+        """Relative paths of local files that are missing or mismatched remotely."""
+        yield from (
+            f"{folder}/{name}"
+            for folder, name in self._conn.execute(
+                "SELECT l.folder, l.name FROM local l LEFT JOIN remote r "
+                "ON r.folder = l.folder AND r.name = l.name "
+                "WHERE r.name IS NULL OR (l.size >= 0 AND (r.size != l.size "
+                "OR (l.md5 IS NOT NULL AND r.md5 IS NOT NULL AND r.md5 != l.md5))) "
+                "ORDER BY l.folder, l.name"
+            )
+        )
+
+    def close(self) -> None:
+        try:
+            self._conn.close()
+        except Exception:
+            pass
+        log_debug(f"Verify: {self.remote_objects} remote object(s) listed")
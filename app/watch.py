@@ -0,0 +1,272 @@
+"""Watch mode: upload flight folders while the drive is still being filled.
+
+Instead of copying the whole SD card to the drive and only then clicking
+Upload, the uploader watches the selected root. Each top-level folder
+(``DJI_*``) is uploaded as soon as its files have stopped changing for
+``WATCH_SETTLE`` seconds, so uploading overlaps with the crew's copying.
+A folder that changes again after it was queued is queued again; the
+ledger makes that a delta upload of the new files.
+
+Changes are picked up every ``WATCH_POLL`` seconds. Only folders still
+settling are checked in full, and even there only directories whose mtime
+changed are listed again; the known files of the others are re-stat'ed to
+catch one still growing. For settled folders a ``stat`` of each directory
+is enough to notice new files. With the optional ``watchdog`` package
+(``pip install watchdog``: inotify on Linux, ReadDirectoryChangesW on
+Windows) even those stats are skipped, apart from an occasional full check
+in case events were lost.
+
+A file growing in place leaves its directory's stat, and so the scan
+cache's listing of it, unchanged; the watcher drops such directories from
+the scan cache, so the folder's upload lists them afresh.
+
+Root files are not packaged in watch mode; a normal upload afterwards
+takes care of them.
+"""
+
+import os
+import threading
+import time
+from dataclasses import dataclass, field, replace
+from typing import Callable
+
+from app.log import log_debug
+from app.scancache import ScanCache
+from app.scanner import FileEntry, FolderManifest, scan_folder
+
+DEFAULT_SETTLE_S = 30.0
+DEFAULT_POLL_S = 5.0
+# With filesystem events, a full check every this many polls catches lost ones.
+_FULL_CHECK_EVERY = 12
+# Directories modified this recently are listed again: a file added within
+# the same timestamp tick would not move the mtime (FAT has 2 s resolution).
+_RACY_WINDOW_NS = 2_000_000_000
+
+
+def watch_timing(options: dict[str, str]) -> tuple[float, float]:
+    """WATCH_SETTLE and WATCH_POLL (seconds) from bucket.conf."""
+    values = []
+    for key, default in (("watch_settle", DEFAULT_SETTLE_S), ("watch_poll", DEFAULT_POLL_S)):
+        value = default
+        if options.get(key):
+            try:
+                value = max(0.0, float(options[key]))
+            except ValueError:
+                log_debug(f"Ignoring invalid {key.upper()}={options[key]!r} in bucket.conf")
+        values.append(value)
+    return values[0], max(0.1, values[1])
+
+
+def _stat_ns(path: str) -> int | None:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _relist(path: str, relpath: str, old: FolderManifest | None) -> tuple[FolderManifest, bool]:
+    """``path`` listed again if its directory changed since ``old``, else ``old`` with its files re-stat'ed.
+
+    The flag is True if a file changed without the directory changing.
+    """
+    mtime_ns = _stat_ns(path)
+    if old is None or mtime_ns is None or mtime_ns != old.dir_mtime_ns:
+        return scan_folder(path, relpath), False
+    if time.time_ns() - mtime_ns < _RACY_WINDOW_NS:
+        return scan_folder(path, relpath), False
+    files = []
+    grown = False
+    for f in old.files:
+        try:
+            st = os.stat(os.path.join(path, f.name))
+        except OSError:
+            return scan_folder(path, relpath), False
+        if (st.st_size, st.st_mtime) != (f.size, f.mtime):
+            f = FileEntry(f.name, st.st_size, st.st_mtime)
+            grown = True
+        files.append(f)
+    return replace(old, files=files), grown
+
+
+def _start_observer(root: str, on_change: Callable[[str], None]):
+    """A watchdog observer calling ``on_change(path)`` for every change below ``root``, if available."""
+    try:
+        from watchdog.events import FileSystemEventHandler
+        from watchdog.observers import Observer
+    except ImportError:
+        return None
+
+    class Handler(FileSystemEventHandler):
+        def on_any_event(self, event) -> None:
+            on_change(event.src_path)
+            if getattr(event, "dest_path", ""):
+                on_change(event.dest_path)
+
+    try:
+        observer = Observer()
+        observer.schedule(Handler(), root, recursive=True)
+        observer.start()
+    except Exception as e:
+        log_debug(f"Watch: filesystem events unavailable, polling only: {e}")
+        return None
+    return observer
+
+
+@dataclass
+class _Folder:
+    # Directory path -> its last listing, top-down.
+    listings: dict[str, FolderManifest] = field(default_factory=dict)
+    # Directories where a file grew in place since the folder was last ready.
+    grown: set[str] = field(default_factory=set)
+    signature: tuple = ()
+    nfiles: int = 0
+    changed_at: float = 0.0
+    submitted: tuple | None = None
+    dirty: bool = True
+
+    @property
+    def pending(self) -> bool:
+        return self.signature != self.submitted
+
+
+class FolderWatcher:
+    """Finds top-level folders of ``root`` whose files have stopped changing."""
+
+    def __init__(
+        self,
+        root: str,
+        settle_s: float = DEFAULT_SETTLE_S,
+        poll_s: float = DEFAULT_POLL_S,
+        use_events: bool = True,
+        use_scan_cache: bool = True,
+    ):
+        self.root = root
+        self.settle_s = settle_s
+        self.poll_s = poll_s
+        self._folders: dict[str, _Folder] = {}
+        self._root_mtime_ns: int | None = None
+        self._root_dirty = True
+        self._polls = 0
+        self._lock = threading.Lock()
+        self.use_scan_cache = use_scan_cache
+        self._cache: ScanCache | None = None
+        self._observer = _start_observer(root, self._on_event) if use_events else None
+        log_debug(
+            f"Watching {root}: folders are queued after {settle_s:g}s without changes, "
+            f"checked every {poll_s:g}s" + (" (filesystem events)" if self._observer else "")
+        )
+
+    def _on_event(self, path: str) -> None:
+        # Called on the observer's thread.
+        rel = os.path.relpath(path, self.root)
+        top = rel.split(os.sep)[0]
+        with self._lock:
+            if top == rel or top in (".", ".."):
+                self._root_dirty = True
+            state = self._folders.get(top)
+            if state is not None:
+                state.dirty = True
+
+    def _update_folder_list(self) -> None:
+        names = set(scan_folder(self.root).subdirs)
+        with self._lock:
+            for name in names - self._folders.keys():
+                self._folders[name] = _Folder()
+            for name in self._folders.keys() - names:
+                del self._folders[name]
+
+    def _rescan(self, name: str, state: _Folder, now: float) -> None:
+        with self._lock:
+            state.dirty = False
+        listings: dict[str, FolderManifest] = {}
+        grown = set()
+        stack = [(os.path.join(self.root, name), "")]
+        while stack:
+            path, relpath = stack.pop()
+            manifest, changed = _relist(path, relpath, state.listings.get(path))
+            listings[path] = manifest
+            if changed:
+                grown.add(path)
+            for sub in reversed(manifest.subdirs):
+                stack.append((os.path.join(path, sub), f"{relpath}/{sub}" if relpath else sub))
+        state.listings = listings
+        if grown:
+            state.grown |= grown
+            self._forget_cached(grown)
+        manifests = list(listings.values())
+        signature = tuple((m.relpath, tuple((f.name, f.size, f.mtime) for f in m.files)) for m in manifests)
+        if signature != state.signature:
+            state.signature = signature
+            state.nfiles = sum(m.nfiles for m in manifests)
+            state.changed_at = now
+
+    def check(self, now: float | None = None) -> list[str]:
+        """Folders changed since they were last submitted and unchanged for the settle time."""
+        now = time.monotonic() if now is None else now
+        self._polls += 1
+        full = self._observer is None or self._polls % _FULL_CHECK_EVERY == 0
+        with self._lock:
+            root_dirty, self._root_dirty = self._root_dirty, False
+        root_mtime_ns = _stat_ns(self.root)
+        if root_dirty or (full and root_mtime_ns != self._root_mtime_ns):
+            self._root_mtime_ns = root_mtime_ns
+            self._update_folder_list()
+
+        ready = []
+        with self._lock:
+            folders = sorted(self._folders.items())
+        for name, state in folders:
+            # A folder still settling is checked every time: a file growing
+            # in place does not change its directory's mtime.
+            changed = state.dirty or state.pending or (
+                full and any(_stat_ns(path) != m.dir_mtime_ns for path, m in state.listings.items())
+            )
+            if changed:
+                self._rescan(name, state, now)
+            if state.pending and state.nfiles and now - state.changed_at >= self.settle_s:
+                # Again: a job still scanning may have stored a listing from before the growth.
+                self._forget_cached(state.grown)
+                state.grown = set()
+                ready.append(name)
+        return ready
+
+    def _forget_cached(self, paths: set[str]) -> None:
+        """Drop ``paths`` from the scan cache, whose listings may hold a file's old size."""
+        if not self.use_scan_cache or not paths:
+            return
+        try:
+            if self._cache is None:
+                self._cache = ScanCache()
+            self._cache.forget(paths)
+        except Exception as e:
+            log_debug(f"Watch: could not update the scan cache: {e}")
+
+    def mark_submitted(self, names: list[str]) -> None:
+        """Record ``names`` as queued in their current state."""
+        with self._lock:
+            for name in names:
+                state = self._folders.get(name)
+                if state is not None:
+                    state.submitted = state.signature
+
+    def run(self, submit: Callable[[list[str]], None], stop: threading.Event) -> None:
+        """Pass settled folders to ``submit`` every ``poll_s`` until ``stop`` is set."""
+        try:
+            while not stop.is_set():
+                ready = self.check()
+                if ready:
+                    log_debug(f"Watch: {len(ready)} folder(s) settled: {', '.join(ready)}")
+                    submit(ready)
+                    self.mark_submitted(ready)
+                stop.wait(self.poll_s)
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        observer, self._observer = self._observer, None
+        if observer is not None:
+            observer.stop()
+            observer.join(timeout=2)
+        cache, self._cache = self._cache, None
+        if cache is not None:
+            cache.close()